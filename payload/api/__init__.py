@@ -32,10 +32,43 @@ API_SERVICE_OPTS = [
                ),
     cfg.BoolOpt('enable_reverse_dns_lookup',
                 default=False,
-                help=('Set it to False if your environment does not need '
-                      'or have dns server, otherwise it will delay the '
-                      'response from api.')
+                help=('Deprecated for removal and ignored, the payload API '
+                      'server never looks up the host names of clients.')
                 ),
+    cfg.IntOpt('backlog',
+               default=4096,
+               help='Number of connections the listen socket queues.',
+               ),
+    cfg.IntOpt('wsgi_pool_size',
+               default=1000,
+               help=('Number of green threads of a worker, the most '
+                     'connections it serves at once.')
+               ),
+    cfg.BoolOpt('wsgi_keep_alive',
+                default=True,
+                help=('Keep HTTP/1.1 connections open between requests, '
+                      'rather than closing them after every response.')
+                ),
+    cfg.IntOpt('client_socket_timeout',
+               default=900,
+               help=('Seconds a client connection may stay idle before it '
+                     'is closed, 0 to wait forever.')
+               ),
+    cfg.IntOpt('shutdown_timeout',
+               default=5,
+               help=('Seconds a stopping worker lets the requests being '
+                     'served finish, before closing every connection.')
+               ),
+    cfg.IntOpt('watch_timeout',
+               default=30,
+               help=('Seconds a listing watched for changes waits for one '
+                     'before it is returned unchanged.')
+               ),
+    cfg.IntOpt('workers',
+               default=None,
+               help=('Number of payload-api worker processes, sharing the '
+                     'listen socket. Defaults to the number of CPUs.')
+               ),
 ]
 
 CONF = cfg.CONF
@@ -16,10 +16,12 @@
 # limitations under the License.
 
 import logging
+import multiprocessing
 import os
 import socket
-from wsgiref import simple_server
 
+import eventlet
+import eventlet.wsgi
 import netaddr
 from oslo.config import cfg
 from paste import deploy
@@ -29,6 +31,7 @@ from payload.api import config
 from payload.api import hooks
 from payload.api import middleware
 from payload.openstack.common import log
+from payload.openstack.common import service
 
 LOG = log.getLogger(__name__)
 
@@ -48,12 +51,13 @@ def app_factory(global_config, **local_conf):
 
 def build_server():
     app = load_app()
-    # Create the WSGI server and start it
+    # Create the WSGI server, it is started by WSGIService
     host, port = cfg.CONF.api.host, cfg.CONF.api.port
-    server_cls = get_server_cls(host)
+    srv = Server(app=app, host=host, port=port)
 
-    srv = simple_server.make_server(
-        host, port, app, server_cls, get_handler_cls())
+    if cfg.CONF.api.enable_reverse_dns_lookup:
+        LOG.warn('The enable_reverse_dns_lookup option is deprecated and '
+                 'ignored, client host names are never looked up')
 
     LOG.info('Starting server in PID %s' % os.getpid())
     LOG.info("Configuration:")
@@ -70,39 +74,31 @@ def build_server():
     return srv
 
 
-def get_handler_cls():
-    cls = simple_server.WSGIRequestHandler
-
-    # old-style class doesn't support super
-    class CeilometerHandler(cls, object):
-        def address_string(self):
-            if cfg.CONF.api.enable_reverse_dns_lookup:
-                return super(CeilometerHandler, self).address_string()
-            else:
-                # disable reverse dns lookup, directly return ip adress
-                return self.client_address[0]
-
-    return CeilometerHandler
-
-
 def get_pecan_config():
     # Set up the pecan configuration
     filename = config.__file__.replace('.pyc', '.py')
     return pecan.configuration.conf_from_file(filename)
 
 
-def get_server_cls(host):
-    """Return an appropriate WSGI server class base on provided host
+def get_address_family(host):
+    """Return the socket address family for the provided host
 
-    :param host: The listen host for the ceilometer API server.
+    :param host: The listen host for the payload API server.
     """
-    server_cls = simple_server.WSGIServer
     if netaddr.valid_ipv6(host):
-        # NOTE(dzyu) make sure use IPv6 sockets if host is in IPv6 pattern
-        if getattr(server_cls, 'address_family') == socket.AF_INET:
-            class server_cls(server_cls):
-                address_family = socket.AF_INET6
-    return server_cls
+        return socket.AF_INET6
+    return socket.AF_INET
+
+
+def get_workers():
+    """Return the number of payload-api worker processes to fork."""
+    if cfg.CONF.api.workers:
+        return cfg.CONF.api.workers
+
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
 
 
 def load_app():
@@ -144,6 +140,79 @@ def setup_app(pecan_config=None):
     return app
 
 
+class Server(object):
+    """An eventlet WSGI server, serving every connection in a green thread.
+
+    Connections waiting on Redis or the database yield to the others, so
+    a worker serves up to wsgi_pool_size slow clients at once.
+    """
+
+    def __init__(self, app, host, port):
+        self.app = app
+        self.pool = None
+        self.socket = eventlet.listen(
+            (host, port), family=get_address_family(host),
+            backlog=cfg.CONF.api.backlog)
+        self._server = None
+
+    def start(self):
+        """Accept connections until stopped."""
+        self.pool = eventlet.GreenPool(cfg.CONF.api.wsgi_pool_size)
+        # NOTE(pabelanger): eventlet.wsgi closes the socket it serves on
+        # its way out, give it a copy so we can start again.
+        self._server = eventlet.spawn(
+            eventlet.wsgi.server, self.socket.dup(), self.app,
+            custom_pool=self.pool, keepalive=cfg.CONF.api.wsgi_keep_alive,
+            log=log.WritableLogger(LOG),
+            socket_timeout=cfg.CONF.api.client_socket_timeout or None)
+
+    def stop(self):
+        """Stop accepting connections."""
+        if self._server is not None:
+            self._server.kill()
+            self._server = None
+
+    def wait(self):
+        """Wait for the connections being served to close.
+
+        Connections still open after shutdown_timeout seconds are closed,
+        idle keep-alive connections would otherwise be waited for up to
+        client_socket_timeout.
+        """
+        if self.pool is None:
+            return
+
+        with eventlet.Timeout(cfg.CONF.api.shutdown_timeout, False):
+            self.pool.waitall()
+
+        for thread in list(self.pool.coroutines_running):
+            eventlet.kill(thread)
+        self.pool.waitall()
+
+
+class WSGIService(service.Service):
+    """Serve requests with a WSGI server built by build_server().
+
+    The server binds its socket before the worker processes are forked, so
+    every worker accepts connections on the same socket.
+    """
+
+    def __init__(self, server):
+        super(WSGIService, self).__init__()
+        self.server = server
+
+    def start(self):
+        super(WSGIService, self).start()
+        self.server.start()
+
+    def stop(self):
+        # NOTE(pabelanger): Let the requests being served finish, so
+        # workers restart gracefully on SIGHUP.
+        self.server.stop()
+        self.server.wait()
+        super(WSGIService, self).stop()
+
+
 class VersionSelectorApplication(object):
     def __init__(self):
         pc = get_pecan_config()
@@ -34,6 +34,7 @@ class Agent(base.APIBase):
     """API representation of an agent."""
 
     project_id = wtypes.text
+    skills = {wtypes.text: int}
     user_id = wtypes.text
     uuid = wtypes.text
 
@@ -75,7 +76,8 @@ class AgentsController(rest.RestController):
         d = body.as_dict()
 
         res = pecan.request.db_api.create_agent(
-            user_id=d['user_id'], project_id=d['project_id'])
+            user_id=d['user_id'], project_id=d['project_id'],
+            skills=d.get('skills'))
         return res
 
     @wsme.validate(Agent)
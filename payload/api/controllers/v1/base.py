@@ -15,10 +15,19 @@
 # limitations under the License.
 
 import datetime
+import itertools
+import json
+
+import pecan
 import wsme
+import wsme.api
+import wsme.rest.json
 
 from wsme import types
 
+# Records encoded per chunk of a streamed listing.
+CHUNK_SIZE = 100
+
 
 class APIBase(types.Base):
 
@@ -30,3 +39,101 @@ class APIBase(types.Base):
                     for k in self.fields
                     if hasattr(self, k) and
                     getattr(self, k) != wsme.Unset)
+
+
+def get_etag(name, value):
+    """Return the epoch and version of an ETag query parameter.
+
+    Takes the ETag of a listing, quoted or not, see render_list(). A bare
+    version is taken as is, with no epoch.
+    """
+    if value is None:
+        return None, None
+
+    etag = value.strip('"')
+    epoch, sep, version = etag.partition('-')
+    if not sep or not epoch:
+        epoch, version = None, etag
+
+    try:
+        return epoch, int(version)
+    except ValueError:
+        raise wsme.exc.InvalidInput(name, value)
+
+
+def get_int(name, value):
+    """Return an integer query parameter, parsed as wsexpose would."""
+    if value is None:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        raise wsme.exc.InvalidInput(name, value)
+
+
+def is_not_modified(etag):
+    """Answer a conditional GET of a listing at etag with a 304.
+
+    The ETag of a listing is the version of the callers or members it was
+    read at, prefixed with its epoch, see render_list().
+
+    :returns: True if the client already has the listing at etag.
+    """
+    if etag not in pecan.request.if_none_match:
+        return False
+
+    pecan.response.status = 304
+    pecan.response.etag = etag
+
+    return True
+
+
+def render_error(exc_info):
+    """Render an exception as the JSON fault wsexpose would return."""
+    data = wsme.api.format_exception(
+        exc_info, pecan.conf.get('wsme', {}).get('debug', False))
+    pecan.response.status = getattr(exc_info[1], 'code', 500)
+    pecan.response.content_type = 'application/json'
+    pecan.response.body = wsme.rest.json.encode_error(None, data)
+
+    return pecan.response
+
+
+def render_list(items, etag=None):
+    """Stream records as a JSON array of their as_dict().
+
+    Skips WSME, which wraps every record in its API type and converts it
+    attribute by attribute, for listings large enough for that to show.
+    The output is the same JSON as wsexpose renders for the API type.
+
+    :param etag: The epoch and version the records were read at, sent as
+                 the ETag, see is_not_modified().
+    """
+    def encode():
+        yield '['
+        it = iter(items)
+        chunk = list(itertools.islice(it, CHUNK_SIZE))
+        while chunk:
+            res = json.dumps([x.as_dict() for x in chunk])[1:-1]
+            chunk = list(itertools.islice(it, CHUNK_SIZE))
+            if chunk:
+                res += ', '
+            yield res
+        yield ']'
+
+    pecan.response.content_type = 'application/json'
+    if etag is not None:
+        pecan.response.etag = etag
+    pecan.response.app_iter = encode()
+
+    return pecan.response
+
+
+def validate_page(limit=None, min_wait=None, max_wait=None, watch=None):
+    """Reject negative listing query parameters."""
+    for name, value in [
+            ('limit', limit), ('min_wait', min_wait),
+            ('max_wait', max_wait), ('watch', watch)]:
+        if value is not None and value < 0:
+            raise wsme.exc.ClientSideError('%s must not be negative' % name)
@@ -28,6 +28,7 @@ from payload.common import exception
 # TODO(pabelanger): We should not be access db.sqlalchemy directly.
 from payload.db.sqlalchemy import models
 from payload.openstack.common import log as logging
+from payload.server import strategies
 
 LOG = logging.getLogger(__name__)
 
@@ -38,7 +39,11 @@ class Queue(base.APIBase):
     description = wtypes.text
     disabled = bool
     name = wtypes.text
+    overflow_max_callers = int
+    overflow_max_wait = int
+    overflow_queue_id = wtypes.text
     project_id = wtypes.text
+    strategy = wtypes.text
     user_id = wtypes.text
     uuid = wtypes.text
 
@@ -48,6 +53,52 @@ class Queue(base.APIBase):
             setattr(self, k, kwargs.get(k))
 
 
+def _validate_overflow(values, uuid=None):
+    for name in ['overflow_max_callers', 'overflow_max_wait']:
+        if values.get(name) is not None and values[name] < 0:
+            raise wsme.exc.ClientSideError('%s must not be negative' % name)
+
+    queue_id = values.get('overflow_queue_id')
+    if not queue_id:
+        return
+
+    # NOTE(pabelanger): Callers overflowing into their own queue would
+    # move back in, and be overflowed again at every queue event.
+    if queue_id == uuid:
+        raise wsme.exc.ClientSideError(
+            'A queue cannot overflow into itself')
+
+    try:
+        queue = pecan.request.db_api.get_queue(uuid=queue_id)
+    except exception.QueueNotFound:
+        raise wsme.exc.ClientSideError(
+            'Unknown overflow queue %s' % queue_id)
+
+    # NOTE(pabelanger): Nor should they move around a chain of queues
+    # leading back to theirs.
+    seen = set([queue_id])
+    while queue.overflow_queue_id:
+        if queue.overflow_queue_id == uuid:
+            raise wsme.exc.ClientSideError(
+                'Overflow queue %s overflows back into this queue' %
+                queue_id)
+        if queue.overflow_queue_id in seen:
+            raise wsme.exc.ClientSideError(
+                'Overflow queue %s overflows in a loop' % queue_id)
+        seen.add(queue.overflow_queue_id)
+        try:
+            queue = pecan.request.db_api.get_queue(
+                uuid=queue.overflow_queue_id)
+        except exception.QueueNotFound:
+            break
+
+
+def _validate_strategy(strategy):
+    if strategy and strategy not in strategies.get_names():
+        raise wsme.exc.ClientSideError(
+            'Unknown member selection strategy %s' % strategy)
+
+
 class QueuesController(rest.RestController):
     """REST Controller for queues."""
 
@@ -87,17 +138,34 @@ class QueuesController(rest.RestController):
         user_id = pecan.request.headers.get('X-User-Id')
         project_id = pecan.request.headers.get('X-Tenant-Id')
         d = body.as_dict()
+        _validate_overflow(d)
+        _validate_strategy(d.get('strategy'))
         res = pecan.request.db_api.create_queue(
             name=d['name'], user_id=user_id, project_id=project_id,
-            description=d['description'], disabled=d['disabled'])
+            description=d['description'], disabled=d['disabled'],
+            strategy=d.get('strategy') or strategies.DEFAULT,
+            overflow_queue_id=d.get('overflow_queue_id'),
+            overflow_max_callers=d.get('overflow_max_callers'),
+            overflow_max_wait=d.get('overflow_max_wait'))
         return res
 
     @wsme.validate(Queue)
     @wsme_pecan.wsexpose(Queue, wtypes.text, body=Queue)
     def put(self, uuid, body):
         queue = pecan.request.db_api.get_queue(uuid)
-        items = body.as_dict().items()
-        for k, v in [(k, v) for (k, v) in items if v]:
+        # NOTE(pabelanger): Every field of body defaults to None, so only
+        # the fields sent are changed. Sending null clears a field, such
+        # as the overflow rule.
+        sent = pecan.request.json_body
+        values = dict(
+            (k, v) for k, v in body.as_dict().items() if k in sent)
+        overflow = dict(
+            (k, values.get(k, queue[k])) for k in [
+                'overflow_max_callers', 'overflow_max_wait',
+                'overflow_queue_id'])
+        _validate_overflow(overflow, uuid=queue.uuid)
+        _validate_strategy(values.get('strategy'))
+        for k, v in values.items():
             queue[k] = v
 
         queue.save()
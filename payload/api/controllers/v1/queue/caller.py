@@ -14,17 +14,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import sys
+
+from oslo.config import cfg
 import pecan
+import wsme
 
 from pecan import rest
 from wsme import types as wtypes
 from wsmeext import pecan as wsme_pecan
 
+from payload.api.controllers.v1 import base
 from payload.cache import models
+from payload.common import exception
 from payload.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+
 
 class QueueCaller(object):
     """API representation of a queue caller."""
@@ -34,13 +42,15 @@ class QueueCaller(object):
     name = wtypes.text
     number = wtypes.text
     position = int
+    priority = int
     queue_id = wtypes.text
+    skills = {wtypes.text: int}
     status = wtypes.text
     status_at = wtypes.text
     uuid = wtypes.text
 
     def __init__(self, **kwargs):
-        self.fields = vars(models.QueueCaller)
+        self.fields = models.QueueCaller.fields
         for k in self.fields:
             setattr(self, k, kwargs.get(k))
 
@@ -48,12 +58,56 @@ class QueueCaller(object):
 class QueueCallersController(rest.RestController):
     """REST Controller for queue callers."""
 
-    @wsme_pecan.wsexpose([QueueCaller], wtypes.text)
-    def get_all(self, queue_id):
+    @wsme_pecan.wsexpose(
+        None, wtypes.text, body=[wtypes.text], status_code=204)
+    def delete(self, queue_id, body):
+        """Delete callers from the specified queue.
+
+        .. http:delete:: /queues/:queue_uuid/callers
+
+           **Example request**:
+
+           .. sourcecode:: http
+
+              DELETE /queues/cc096e0b-0c96-4b8b-b812-ef456f361ee3/callers
+
+              [
+                "e5814fee-6e8a-4771-8edd-ea413eff57f1",
+                "4b4fa110-be14-45b7-a998-2219ab8bee6f"
+              ]
+        """
+        try:
+            pecan.request.cache_api.delete_queue_callers(
+                queue_id=queue_id, uuids=body)
+        except exception.QueueCallerNotFound as e:
+            raise wsme.exc.ClientSideError(e.message, status_code=e.code)
+
+    @pecan.expose(content_type='application/json')
+    def get_all(
+            self, queue_id, status=None, limit=None, marker=None,
+            min_wait=None, max_wait=None, watch=None):
         """List callers from the specified queue.
 
         .. http:get:: /queues/:queue_uuid/callers
 
+           :query status: only list callers in this status.
+           :query limit: maximum number of callers to return.
+           :query marker: uuid of the last caller of the previous page.
+           :query min_wait: only list callers waiting at least this many
+                            seconds.
+           :query max_wait: only list callers waiting at most this many
+                            seconds.
+           :query watch: ETag of a previous listing.
+                         The request waits for a caller to change since,
+                         or for the watch_timeout option to run out,
+                         before listing the callers.
+           :reqheader If-None-Match: ETag of a previous listing, answered
+                                     with 304 Not Modified if no caller
+                                     changed since.
+           :resheader ETag: version of the callers, prefixed with its
+                            epoch, left out along with min_wait and
+                            max_wait.
+
            **Example request**:
 
            .. sourcecode:: http
@@ -83,10 +137,45 @@ class QueueCallersController(rest.RestController):
                 }
               ]
         """
-        res = pecan.request.cache_api.list_queue_callers(
-            queue_id=queue_id)
+        # NOTE(pabelanger): Listings are rendered by base.render_list(), not
+        # WSME, so the query parameters are parsed here.
+        try:
+            limit = base.get_int('limit', limit)
+            min_wait = base.get_int('min_wait', min_wait)
+            max_wait = base.get_int('max_wait', max_wait)
+            epoch, watch = base.get_etag('watch', watch)
+            base.validate_page(
+                limit=limit, min_wait=min_wait, max_wait=max_wait,
+                watch=watch)
 
-        return res
+            # NOTE(pabelanger): Watchers were woken by the master,
+            # replicas may not have the change yet.
+            master = watch is not None
+            if watch is not None:
+                pecan.request.cache_api.wait_queue_callers(
+                    queue_id=queue_id, version=watch,
+                    timeout=CONF.api.watch_timeout, epoch=epoch)
+
+            # NOTE(pabelanger): Which callers waited long enough changes
+            # with time alone, so those listings get no ETag.
+            conditional = min_wait is None and max_wait is None
+            if conditional and 'If-None-Match' in pecan.request.headers:
+                etag = pecan.request.cache_api.get_queue_callers_etag(
+                    queue_id=queue_id, master=master)
+                if base.is_not_modified(etag):
+                    return pecan.response
+
+            res = pecan.request.cache_api.list_queue_callers(
+                queue_id=queue_id, status=status, limit=limit,
+                marker=marker, min_wait=min_wait, max_wait=max_wait,
+                master=master)
+        except (exception.Invalid, wsme.exc.ClientSideError):
+            return base.render_error(sys.exc_info())
+
+        if not conditional:
+            return base.render_list(res)
+
+        return base.render_list(res, etag=res.etag)
 
     @wsme_pecan.wsexpose(QueueCaller, wtypes.text, wtypes.text)
     def get_one(self, queue_id, uuid):
@@ -118,3 +207,51 @@ e5814fee-6e8a-4771-8edd-ea413eff57f1
             queue_id=queue_id, uuid=uuid)
 
         return result
+
+    @wsme_pecan.wsexpose([QueueCaller], wtypes.text, body=[QueueCaller])
+    def post(self, queue_id, body):
+        """Add callers to the specified queue.
+
+        .. http:post:: /queues/:queue_uuid/callers
+
+           **Example request**:
+
+           .. sourcecode:: http
+
+              POST /queues/cc096e0b-0c96-4b8b-b812-ef456f361ee3/callers
+
+              [
+                {
+                  "created_at": "2014-12-12T02:05:14Z",
+                  "name": "Paul Belanger",
+                  "number": "6135551234",
+                  "uuid": "e5814fee-6e8a-4771-8edd-ea413eff57f1",
+                }
+              ]
+
+           A caller keeps its place in the queue based on created_at,
+           which defaults to the time of the request. Callers with
+           skills, such as {"french": 2}, are only rung through members
+           with at least that level of every skill. Callers with a higher
+           priority, from 0 to 9, are queued ahead of the others.
+        """
+        fields = [
+            'created_at', 'member_uuid', 'name', 'number', 'priority',
+            'skills', 'status', 'uuid',
+        ]
+        callers = []
+        for item in body:
+            callers.append(dict(
+                (k, getattr(item, k)) for k in fields
+                if getattr(item, k) is not None))
+
+        try:
+            res = pecan.request.cache_api.create_queue_callers(
+                queue_id=queue_id, callers=callers)
+        except exception.QueueCallerPriorityInvalid as e:
+            # NOTE(pabelanger): Unlike the class message, the formatted one
+            # names the priority sent.
+            raise wsme.exc.ClientSideError(
+                e.format_message(), status_code=e.code)
+
+        return res
@@ -14,31 +14,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import sys
+
+from oslo.config import cfg
 import pecan
+import wsme
+
 from pecan import rest
 from wsme import types as wtypes
 from wsmeext import pecan as wsme_pecan
 
+from payload.api.controllers.v1 import base
 from payload.cache import models
+from payload.common import exception
 from payload.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+
 
 class QueueMember(object):
     """API representation of a queue member."""
 
+    agent_uuid = wtypes.text
     created_at = wtypes.text
     number = wtypes.text
     paused = wtypes.text
     paused_at = wtypes.text
     queue_id = wtypes.text
+    skills = {wtypes.text: int}
     status = wtypes.text
     status_at = wtypes.text
     uuid = wtypes.text
 
     def __init__(self, **kwargs):
-        self.fields = vars(models.QueueMember)
+        self.fields = models.QueueMember.fields
         for k in self.fields:
             setattr(self, k, kwargs.get(k))
 
@@ -46,12 +57,55 @@ class QueueMember(object):
 class QueueMembersController(rest.RestController):
     """REST Controller for queue members."""
 
-    @wsme_pecan.wsexpose([QueueMember], wtypes.text)
-    def get_all(self, queue_id):
-        """Retrieve a list of queue members."""
-        res = pecan.request.cache_api.list_queue_members(queue_id=queue_id)
+    @pecan.expose(content_type='application/json')
+    def get_all(
+            self, queue_id, status=None, limit=None, marker=None,
+            min_wait=None, max_wait=None, watch=None):
+        """Retrieve a list of queue members.
 
-        return res
+        Takes the same status, limit, marker, min_wait, max_wait and watch
+        query parameters, and answers If-None-Match the same way, as the
+        callers listing.
+        """
+        # NOTE(pabelanger): Listings are rendered by base.render_list(), not
+        # WSME, so the query parameters are parsed here.
+        try:
+            limit = base.get_int('limit', limit)
+            min_wait = base.get_int('min_wait', min_wait)
+            max_wait = base.get_int('max_wait', max_wait)
+            epoch, watch = base.get_etag('watch', watch)
+            base.validate_page(
+                limit=limit, min_wait=min_wait, max_wait=max_wait,
+                watch=watch)
+
+            # NOTE(pabelanger): Watchers were woken by the master,
+            # replicas may not have the change yet.
+            master = watch is not None
+            if watch is not None:
+                pecan.request.cache_api.wait_queue_members(
+                    queue_id=queue_id, version=watch,
+                    timeout=CONF.api.watch_timeout, epoch=epoch)
+
+            # NOTE(pabelanger): Which members waited long enough changes
+            # with time alone, so those listings get no ETag.
+            conditional = min_wait is None and max_wait is None
+            if conditional and 'If-None-Match' in pecan.request.headers:
+                etag = pecan.request.cache_api.get_queue_members_etag(
+                    queue_id=queue_id, master=master)
+                if base.is_not_modified(etag):
+                    return pecan.response
+
+            res = pecan.request.cache_api.list_queue_members(
+                queue_id=queue_id, status=status, limit=limit,
+                marker=marker, min_wait=min_wait, max_wait=max_wait,
+                master=master)
+        except (exception.Invalid, wsme.exc.ClientSideError):
+            return base.render_error(sys.exc_info())
+
+        if not conditional:
+            return base.render_list(res)
+
+        return base.render_list(res, etag=res.etag)
 
     @wsme_pecan.wsexpose(QueueMember, wtypes.text, wtypes.text)
     def get_one(self, queue_id, uuid):
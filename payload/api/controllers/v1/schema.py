@@ -42,6 +42,9 @@ class SchemasController(rest.RestController):
             'project_id': {
                 'type': 'string',
             },
+            'skills': {
+                'type': ['object', 'null'],
+            },
             'updated_at': {
                 'type': ['string', 'null'],
             },
@@ -74,9 +77,21 @@ class SchemasController(rest.RestController):
             'name': {
                 'type': 'string',
             },
+            'overflow_max_callers': {
+                'type': ['integer', 'null'],
+            },
+            'overflow_max_wait': {
+                'type': ['integer', 'null'],
+            },
+            'overflow_queue_id': {
+                'type': ['string', 'null'],
+            },
             'project_id': {
                 'type': 'string',
             },
+            'strategy': {
+                'type': 'string',
+            },
             'updated_at': {
                 'type': ['string', 'null'],
             },
@@ -28,5 +28,8 @@ class DBHook(hooks.PecanHook):
 
 class CacheHook(hooks.PecanHook):
 
+    def __init__(self):
+        self.cache_api = cache_api.get_instance()
+
     def before(self, state):
-        state.request.cache_api = cache_api.get_instance()
+        state.request.cache_api = self.cache_api
@@ -14,11 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import redis
+import calendar
+import functools
+import json
+import time
 
 from oslo.config import cfg
+import redis
 
+from payload.cache import cluster
+from payload.cache import codec
 from payload.cache import models
+from payload.cache import replicas
+from payload.cache import scripts
+from payload.cache import watch
 from payload.common import exception
 from payload.openstack.common import context
 from payload.openstack.common import log as logging
@@ -37,10 +46,130 @@ cache_opts = [
         'database', default=0, help='Which Redis database to use'),
     cfg.StrOpt(
         'password', default=None, help='Password to use with AUTH command'),
+    cfg.IntOpt(
+        'max_connections', default=None,
+        help='Maximum number of connections in the shared connection pool, '
+        'unlimited if unset'),
+    cfg.FloatOpt(
+        'socket_timeout', default=None,
+        help='Seconds to wait for a reply from Redis before giving up'),
+    cfg.FloatOpt(
+        'socket_connect_timeout', default=None,
+        help='Seconds to wait while connecting to Redis'),
+    cfg.BoolOpt(
+        'socket_keepalive', default=False,
+        help='Enable TCP keepalive on Redis connections'),
+    cfg.IntOpt(
+        'health_check_interval', default=0,
+        help='Seconds a pooled connection may sit idle before it is checked '
+        'with PING on checkout, 0 disables the check'),
+    cfg.StrOpt(
+        'record_format', default='hash', choices=sorted(codec.FORMATS),
+        help='How queue callers and members are stored, either hash for '
+        'full field names or compact for single character field names '
+        'with unset fields left out. Existing records are not converted '
+        'when this changes'),
+    cfg.ListOpt(
+        'cluster_nodes', default=[],
+        help='host:port seed nodes of a Redis Cluster. When set, every '
+        'queue is served by the master owning its hash slot and the '
+        'host and port options are only used for administrative '
+        'commands'),
+    cfg.ListOpt(
+        'replicas', default=[],
+        help='host:port of Redis replicas of the master. When set, queue '
+        'caller and member reads are spread over the replicas, except on '
+        'the distribution path. Not used in cluster mode'),
+    cfg.IntOpt(
+        'replica_max_lag', default=10,
+        help='Seconds since a replica last heard from its master after '
+        'which reads go back to the master. Masters ping their replicas '
+        'every repl-ping-replica-period seconds, 10 by default'),
+    cfg.FloatOpt(
+        'replica_timeout', default=0.5,
+        help='Seconds to wait for a replica to connect, or to answer a '
+        'health check, before reads go back to the master'),
+]
+
+timer_opts = [
+    cfg.IntOpt(
+        'ring_timeout', default=0,
+        help='Seconds callers and members ring for before going back to '
+        'waiting, 0 to ring until told otherwise'),
+    cfg.IntOpt(
+        'wrapup_time', default=0,
+        help='Seconds members stay in wrap-up before going back to '
+        'waiting, 0 to stay until told otherwise'),
+    cfg.IntOpt(
+        'max_wait', default=0,
+        help='Seconds after joining a queue at which waiting callers time '
+        'out, 0 to wait forever'),
+    cfg.IntOpt(
+        'timeout_retention', default=300,
+        help='Seconds timed out callers are kept for before they are '
+        'deleted, 0 to keep them until deleted through the API'),
+]
+
+distributor_opts = [
+    cfg.BoolOpt(
+        'batch_matching', default=False,
+        help='Match every queue with waiting callers and members in a '
+        'single script per Redis node, rather than a queue at a time'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(cache_opts, 'redis')
+CONF.register_opts(timer_opts, 'timers')
+# NOTE(pabelanger): Registered here rather than by payload.server.distributor,
+# as the dirty queues batch matching reads are kept by whoever adds waiting
+# callers and members, payload-api included.
+CONF.register_opts(distributor_opts, 'distributor')
+
+
+# Channel on which the ids of queues that may have a new match are
+# published for payload-distributor.
+EVENTS_CHANNEL = 'payload:queue:events'
+
+# Set of the queues which gained a waiting caller or member since they
+# were last matched, see match_queue_callers().
+DIRTY_KEY = 'payload:queue:dirty'
+
+# Sorted set of the running payload-distributor nodes, scored by when
+# their registration expires.
+DISTRIBUTORS_KEY = 'payload:distributors'
+
+# Members are weighted from 1 to MAX_MEMBER_WEIGHT for the weighted member
+# selection strategy.
+MAX_MEMBER_WEIGHT = 10
+
+# Callers are scored by the epoch seconds they arrived at, or entered their
+# status at, less their priority times CALLER_PRIORITY_BAND. Each priority
+# from 0 to MAX_CALLER_PRIORITY gets a band of scores of its own, and
+# callers of priority 0 keep their plain timestamps.
+CALLER_PRIORITY_BAND = 2 ** 32
+MAX_CALLER_PRIORITY = 9
+
+_POOL = None
+_REPLICAS = None
+_ROUTER = None
+_WATCHER = None
+
+
+def cleanup():
+    """Disconnect and drop the shared connection pool."""
+    global _POOL, _REPLICAS, _ROUTER, _WATCHER
+    if _WATCHER is not None:
+        _WATCHER.stop()
+    if _POOL is not None:
+        _POOL.disconnect()
+    if _REPLICAS is not None:
+        _REPLICAS.disconnect()
+    if _ROUTER is not None:
+        _ROUTER.disconnect()
+    _POOL = None
+    _REPLICAS = None
+    _ROUTER = None
+    _WATCHER = None
 
 
 def get_instance():
@@ -48,6 +177,156 @@ def get_instance():
     return Connection()
 
 
+def get_pool():
+    """Return the connection pool shared by every Redis API instance."""
+    global _POOL
+    if _POOL is None:
+        _POOL = ConnectionPool(
+            host=CONF.redis.host, port=CONF.redis.port,
+            **_get_pool_kwargs())
+
+    return _POOL
+
+
+def get_pool_stats():
+    """Return utilisation of the shared connection pool.
+
+    The pools of the cluster masters and of the replicas are returned as
+    well, keyed by 'host:port'.
+    """
+    res = get_pool().get_stats()
+    if _REPLICAS is not None:
+        res['replicas'] = _REPLICAS.get_stats()
+    if _ROUTER is not None:
+        res['cluster'] = _ROUTER.get_stats()
+
+    return res
+
+
+def get_replicas():
+    """Return the read replicas, or None if there are none."""
+    global _REPLICAS
+    if (_REPLICAS is None and CONF.redis.replicas and
+            not CONF.redis.cluster_nodes):
+        _REPLICAS = replicas.ReplicaSet(
+            nodes=CONF.redis.replicas, max_lag=CONF.redis.replica_max_lag,
+            pool_class=ConnectionPool, timeout=CONF.redis.replica_timeout,
+            **_get_pool_kwargs())
+
+    return _REPLICAS
+
+
+def get_router():
+    """Return the Redis Cluster router, or None outside cluster mode."""
+    global _ROUTER
+    if _ROUTER is None and CONF.redis.cluster_nodes:
+        _ROUTER = cluster.Router(
+            nodes=CONF.redis.cluster_nodes, pool_class=ConnectionPool,
+            **_get_pool_kwargs())
+
+    return _ROUTER
+
+
+def get_watcher():
+    """Return the watcher shared by every Redis API instance.
+
+    In cluster mode any node sees every message, so it listens on one of
+    the masters found through the cluster_nodes option, the host and port
+    options may not point to a node of the cluster. The watcher stays on
+    that master until cleanup().
+    """
+    global _WATCHER
+    if _WATCHER is None:
+        router = get_router()
+        if router is not None:
+            session = router.get_node_session()
+        else:
+            session = redis.StrictRedis(connection_pool=get_pool())
+        _WATCHER = watch.Watcher(session=session)
+
+    return _WATCHER
+
+
+def _get_pool_kwargs():
+    res = {
+        'db': CONF.redis.database,
+        'password': CONF.redis.password,
+        'max_connections': CONF.redis.max_connections,
+        'socket_timeout': CONF.redis.socket_timeout,
+        'socket_connect_timeout': CONF.redis.socket_connect_timeout,
+        'socket_keepalive': CONF.redis.socket_keepalive,
+        'health_check_interval': CONF.redis.health_check_interval,
+    }
+
+    return res
+
+
+def _retry_on_moved(f):
+    """Reload the cluster slot map and retry once if a queue moved.
+
+    Every key of a queue lives in the same slot, so a MOVED reply is
+    returned by the first command sent and nothing has been written.
+
+    An ASK reply, for a slot being migrated, is raised. The slot map still
+    names the old node, and a retry would only be asked again.
+    """
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return f(self, *args, **kwargs)
+        except redis.ResponseError as e:
+            if self._router is None or not str(e).startswith('MOVED '):
+                raise
+            LOG.info('Reloading Redis Cluster slots: %s' % e)
+            self._router.refresh()
+
+        return f(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _timestamp_from_iso8601(value):
+    """Return the epoch timestamp of an ISO 8601 string."""
+    try:
+        res = timeutils.normalize_time(timeutils.parse_isotime(value))
+    except ValueError:
+        raise exception.QueueCallerCreatedAtInvalid(created_at=value)
+
+    return calendar.timegm(res.timetuple()) + res.microsecond / 1000000.0
+
+
+def _get_caller_score(timestamp, priority):
+    return timestamp - priority * CALLER_PRIORITY_BAND
+
+
+def _get_etag(epoch, version):
+    """Return the ETag of a listing, see get_queue_callers_etag()."""
+    return '%s-%d' % (epoch, version)
+
+
+def _get_timers(timers):
+    """Return the timers of the statuses with a timeout, see scripts."""
+    return dict((k, v) for k, v in timers.iteritems() if v[0] > 0)
+
+
+def _has_agent(values):
+    """Return True if a member record stands for an agent."""
+    return values.get('agent_uuid') not in (None, 'None')
+
+
+def _is_hash_tag(value):
+    # Redis Cluster hashes the whole key if the tag is empty, and only up to
+    # the first closing brace otherwise.
+    value = str(value)
+
+    return value != '' and '{' not in value and '}' not in value
+
+
+def _is_paused(value):
+    """Return True if a paused value is set, the same way the scripts do."""
+    return value is not None and str(value) not in ('0', 'False', 'None')
+
+
 def _send_notification(event, payload):
     notification = event.replace(" ", "_")
     notification = "queue.%s" % notification
@@ -55,11 +334,52 @@ def _send_notification(event, payload):
     notifier.info(context.RequestContext(), notification, payload)
 
 
+class ConnectionPool(redis.ConnectionPool):
+    """Connection pool which health checks idle connections on checkout."""
+
+    def __init__(self, health_check_interval=0, **kwargs):
+        super(ConnectionPool, self).__init__(**kwargs)
+        self.health_check_interval = health_check_interval
+
+    def get_connection(self, command_name, *keys, **options):
+        connection = super(ConnectionPool, self).get_connection(
+            command_name, *keys, **options)
+
+        if not self.health_check_interval or connection._sock is None:
+            return connection
+
+        idle = time.time() - getattr(connection, 'released_at', 0)
+        if idle > self.health_check_interval:
+            try:
+                connection.send_command('PING')
+                connection.read_response()
+            except (redis.ConnectionError, redis.TimeoutError):
+                LOG.debug('Dropping stale Redis connection')
+                connection.disconnect()
+
+        return connection
+
+    def get_stats(self):
+        res = {
+            'available_connections': len(self._available_connections),
+            'created_connections': self._created_connections,
+            'in_use_connections': len(self._in_use_connections),
+            'max_connections': self.max_connections,
+        }
+
+        return res
+
+    def release(self, connection):
+        connection.released_at = time.time()
+        super(ConnectionPool, self).release(connection)
+
+
 class QueueCallerStatus(object):
 
     WAITING = '1'
     RINGING = '2'
     CONNECTED = '3'
+    TIMEOUT = '4'
 
 
 class QueueMemberStatus(object):
@@ -67,181 +387,1001 @@ class QueueMemberStatus(object):
     WAITING = '1'
     CONNECTED = '2'
     RINGING = '6'
+    WRAPUP = '9'
 
 
 class Connection(object):
 
+    _replicas = None
+    _router = None
     _session = None
+    _agent_namespace = 'agent'
     _queue_namespace = 'queue'
 
     def __init__(self):
-        self._session = redis.StrictRedis(
-            host=CONF.redis.host, port=CONF.redis.port,
-            db=CONF.redis.database, password=CONF.redis.password)
-
+        self._replicas = get_replicas()
+        self._router = get_router()
+        self._session = redis.StrictRedis(connection_pool=get_pool())
+        record_format = codec.FORMATS[CONF.redis.record_format]
+        self._caller_codec = record_format(codec.QUEUE_CALLER_FIELDS)
+        self._member_codec = record_format(codec.QUEUE_MEMBER_FIELDS)
+        self._agent_status = self._session.register_script(
+            scripts.AGENT_STATUS)
+        self._expire_timers = self._session.register_script(
+            scripts.EXPIRE_TIMERS)
+        self._finish_overflow = self._session.register_script(
+            scripts.FINISH_OVERFLOW)
+        self._index_members = self._session.register_script(
+            scripts.INDEX_MEMBERS)
+        self._lease = self._session.register_script(scripts.LEASE)
+        self._leave_agent = self._session.register_script(
+            scripts.LEAVE_AGENT)
+        self._list_page = self._session.register_script(scripts.LIST_PAGE)
+        self._overflow_callers = self._session.register_script(
+            scripts.OVERFLOW_CALLERS)
+        self._release_lease = self._session.register_script(
+            scripts.RELEASE_LEASE)
+        self._match_queues = dict()
+        self._matches = dict()
+        self._unmatch = self._session.register_script(scripts.UNMATCH)
+        self._update_member = self._session.register_script(
+            scripts.UPDATE_MEMBER)
+        self._update_status = self._session.register_script(
+            scripts.UPDATE_STATUS)
+
+    @_retry_on_moved
+    def acquire_queue_lease(self, queue_id, owner, ttl):
+        """Lease a queue to owner for ttl seconds, or renew its lease.
+
+        :returns: True if owner holds the lease, False if another does.
+        """
+        res = self._lease(
+            client=self._get_session(queue_id=queue_id),
+            keys=[self._get_lease_key(queue_id=queue_id)],
+            args=[owner, int(ttl * 1000)])
+
+        return bool(res)
+
+    @_retry_on_moved
     def create_queue_caller(
             self, queue_id, uuid=None, member_uuid=None, name=None,
-            number=None, status=1):
+            number=None, status=1, skills=None, priority=0):
+        """Create a queue caller.
+
+        :param skills: A dict of the skills a member needs to be rung for
+                       the caller, mapped to the lowest acceptable level.
+        :param priority: From 0 to MAX_CALLER_PRIORITY, callers of a higher
+                         priority are queued ahead of all callers of a
+                         lower one.
+        """
         timestamp = timeutils.utcnow_ts(microsecond=True)
-        values = {
-            'created_at': timeutils.iso8601_from_timestamp(
-                timestamp, microsecond=True),
-            'member_uuid': member_uuid,
-            'name': name,
-            'number': number,
-            'queue_id': queue_id,
-        }
-        if uuid:
-            values['uuid'] = uuid
-        else:
-            values['uuid'] = uuidutils.generate_uuid()
+
+        # Write the hash, the queue and the status sorted sets in a single
+        # MULTI/EXEC, asking for the position on the way out so we don't
+        # have to read the caller back.
+        session = self._get_session(queue_id=queue_id)
+        pipe = session.pipeline()
+        values = self._create_queue_caller(
+            session=pipe, queue_id=queue_id, timestamp=timestamp, uuid=uuid,
+            member_uuid=member_uuid, name=name, number=number, status=status,
+            skills=skills, priority=priority)
+
+        self._publish_event(queue_id=queue_id, session=pipe)
 
         key = self._get_callers_namespace(queue_id=queue_id)
-        self._session.zadd(key, timestamp, values['uuid'])
+        pipe.zrank(key, values['uuid'])
+        position = pipe.execute()[-1]
 
-        caller = '%s:%s' % (key, values['uuid'])
-        self._session.hmset(caller, values)
+        res = self._get_queue_caller_model(
+            values=self._caller_codec.load(values), position=position)
 
-        self._create_queue_caller_status(
-            queue_id=queue_id, timestamp=timestamp, status=status,
-            uuid=values['uuid'])
+        _send_notification('caller.create', res.as_dict())
 
-        res = self.get_queue_caller(
-            queue_id=queue_id, uuid=values['uuid'])
+        return res
+
+    @_retry_on_moved
+    def create_queue_callers(self, queue_id, callers):
+        """Create several queue callers in a single round trip.
 
-        _send_notification('caller.create', res.__dict__)
+        :param callers: A list of dicts accepting the keyword arguments of
+                        create_queue_caller. An ISO 8601 created_at is kept
+                        as the arrival time so restored callers keep their
+                        place in the queue.
+        """
+        timestamp = timeutils.utcnow_ts(microsecond=True)
+        key = self._get_callers_namespace(queue_id=queue_id)
+        session = self._get_session(queue_id=queue_id)
+        pipe = session.pipeline()
+        data = []
+
+        for caller in callers:
+            caller = dict(caller)
+            created_at = caller.pop('created_at', None)
+            if created_at:
+                caller['timestamp'] = _timestamp_from_iso8601(created_at)
+            else:
+                caller['timestamp'] = timestamp
+
+            data.append(self._create_queue_caller(
+                session=pipe, queue_id=queue_id, **caller))
+
+        self._publish_event(queue_id=queue_id, session=pipe)
+        for values in data:
+            pipe.zrank(key, values['uuid'])
+
+        positions = pipe.execute()
+        positions = positions[len(positions) - len(data):]
+        res = []
+        for values, position in zip(data, positions):
+            res.append(self._get_queue_caller_model(
+                values=self._caller_codec.load(values), position=position))
+
+        _send_notification('callers.create', {
+            'callers': [x.as_dict() for x in res],
+            'queue_id': queue_id,
+        })
 
         return res
 
+    @_retry_on_moved
     def create_queue_member(
-            self, queue_id, number, uuid=None, paused=0, status=1):
+            self, queue_id, number, uuid=None, paused=0, status=1, weight=1,
+            skills=None, agent_uuid=None):
+        """Create a queue member.
+
+        :param skills: A dict of the skills of the member mapped to their
+                       level, usually the skills of the agent.
+        :param agent_uuid: The agent the member stands for. Members of an
+                           agent take on the status of the agent, and keep
+                           sharing it with the other members of the agent.
+        """
+        self._validate_weight(weight=weight)
         timestamp = timeutils.utcnow_ts(microsecond=True)
+        if not uuid:
+            uuid = uuidutils.generate_uuid()
+
+        if agent_uuid and self._router is not None:
+            # NOTE(pabelanger): In cluster mode the agent lives on another
+            # node. It is joined first, its status read back in the same
+            # transaction.
+            agent_pipe = self._get_session(queue_id=agent_uuid).pipeline()
+            self._join_agent(
+                pipe=agent_pipe, agent_uuid=agent_uuid, queue_id=queue_id,
+                uuid=uuid, status=status, timestamp=timestamp)
+            agent_pipe.hget(
+                self._get_agent_namespace(agent_uuid=agent_uuid), 'status')
+            status = agent_pipe.execute()[-1]
+
+        pipe = self._get_session(queue_id=queue_id).pipeline()
+        while True:
+            try:
+                values = self._create_queue_member(
+                    pipe=pipe, queue_id=queue_id, uuid=uuid, number=number,
+                    paused=paused, status=status, weight=weight,
+                    skills=skills, agent_uuid=agent_uuid,
+                    timestamp=timestamp)
+                pipe.execute()
+                break
+            except redis.WatchError:
+                # NOTE(pabelanger): The agent changed since its status was
+                # read, try again with the new one.
+                continue
+
+        if agent_uuid and self._router is not None:
+            # NOTE(pabelanger): The agent may have changed while the member
+            # was written, before an update of the agent could reach it.
+            agent = self._get_session(queue_id=agent_uuid).hget(
+                self._get_agent_namespace(agent_uuid=agent_uuid), 'status')
+            if agent != values['status']:
+                self.update_agent_presence(agent_uuid=agent_uuid, status=agent)
+                values['status'] = agent
+
+        res = self._get_queue_member_model(
+            values=self._member_codec.load(values))
+
+        _send_notification('member.create', res.as_dict())
+
+        return res
+
+    def _create_queue_member(
+            self, pipe, queue_id, uuid, number, paused, status, weight,
+            skills, agent_uuid, timestamp):
+        # Queue the writes of create_queue_member() on pipe. Outside cluster
+        # mode the agent lives on the node of the queue, and is joined in
+        # the same transaction, which fails if the agent changes since its
+        # status was read.
+        if agent_uuid and self._router is None:
+            agent = self._get_agent_namespace(agent_uuid=agent_uuid)
+            pipe.watch(agent)
+            status = pipe.hget(agent, 'status') or status
+            pipe.multi()
+            self._join_agent(
+                pipe=pipe, agent_uuid=agent_uuid, queue_id=queue_id,
+                uuid=uuid, status=status, timestamp=timestamp)
+
         values = {
-            'created_at': timeutils.iso8601_from_timestamp(
-                timestamp, microsecond=True),
+            'agent_uuid': agent_uuid,
+            'created_at': timestamp,
             'number': number,
             'paused': paused,
-            'paused_at': timeutils.iso8601_from_timestamp(
-                timestamp, microsecond=True),
+            'paused_at': timestamp,
             'queue_id': queue_id,
+            'skills': skills,
+            'status': status,
+            'status_at': timestamp,
+            'uuid': uuid,
         }
-        if uuid:
-            values['uuid'] = uuid
-        else:
-            values['uuid'] = uuidutils.generate_uuid()
 
         key = self._get_members_namespace(queue_id=queue_id)
-        self._session.zadd(key, timestamp, values['uuid'])
+        pipe.zadd(key, timestamp, values['uuid'])
 
         member = '%s:%s' % (key, values['uuid'])
-        self._session.hmset(member, values)
-
-        self._create_queue_member_status(
-            queue_id=queue_id, timestamp=timestamp, status=status,
-            uuid=values['uuid'])
-
-        res = self.get_queue_member(
-            queue_id=queue_id, uuid=values['uuid'])
-
-        _send_notification('member.create', res.__dict__)
-
-        return res
+        pipe.hmset(member, self._member_codec.encode(values))
 
+        status_key = self._get_members_status_namespace(
+            queue_id=queue_id, status=status)
+        pipe.zadd(status_key, timestamp, values['uuid'])
+        pipe.zadd('%s:weights' % key, weight, values['uuid'])
+        timer = self._get_member_timers().get(str(status))
+        if timer is not None:
+            pipe.zadd('%s:timers' % key, timestamp + timer[0], values['uuid'])
+        for skill, level in (skills or dict()).iteritems():
+            pipe.zadd('%s:skill:%s' % (key, skill), level, values['uuid'])
+
+        if (str(status) == QueueMemberStatus.WAITING and
+                not _is_paused(paused)):
+            available = '%s:available' % key
+            pipe.zadd(available, timestamp, values['uuid'])
+            pipe.zadd('%s:created' % available, timestamp, values['uuid'])
+            pipe.zadd('%s:calls' % available, 0, values['uuid'])
+            pipe.zadd(
+                '%s:weight:%d' % (available, weight), timestamp,
+                values['uuid'])
+
+        self._bump_version(key=key, session=pipe)
+        self._publish_event(queue_id=queue_id, session=pipe)
+
+        return values
+
+    def _join_agent(self, pipe, agent_uuid, queue_id, uuid, status,
+                    timestamp):
+        # Add a member to an agent, created with status if it is new.
+        agent = self._get_agent_namespace(agent_uuid=agent_uuid)
+        pipe.hsetnx(agent, 'status', status)
+        pipe.hsetnx(
+            agent, 'status_at', self._member_codec.encode_timestamp(timestamp))
+        pipe.hset('%s:members' % agent, queue_id, uuid)
+
+    @_retry_on_moved
     def delete_queue_caller(self, queue_id, uuid):
         res = self.get_queue_caller(
-            queue_id=queue_id, uuid=uuid).__dict__
+            queue_id=queue_id, uuid=uuid, master=True).as_dict()
         _send_notification('caller.delete', res)
 
         key = self._get_callers_namespace(queue_id=queue_id)
-        self._session.zrem(key, uuid)
+        session = self._get_session(queue_id=queue_id)
+        session.zrem(key, uuid)
+        session.zrem('%s:timers' % key, uuid)
         caller = '%s:%s' % (key, uuid)
-        self._session.delete(caller)
+        session.delete(caller)
+        # NOTE(pabelanger): Undoes a move to another queue, see
+        # overflow_queue_callers().
+        session.hdel('%s:overflow' % key, uuid)
 
         self._delete_queue_caller_status(
             queue_id=queue_id, status=res['status'], uuid=uuid)
+        self._bump_version(key=key, session=session)
 
+    @_retry_on_moved
     def delete_queue_member(self, queue_id, uuid):
         res = self.get_queue_member(
-            queue_id=queue_id, uuid=uuid).__dict__
+            queue_id=queue_id, uuid=uuid, master=True).as_dict()
         _send_notification('member.delete', res)
 
         key = self._get_members_namespace(queue_id=queue_id)
-        self._session.zrem(key, uuid)
+        session = self._get_session(queue_id=queue_id)
+        pipe = session.pipeline()
+        pipe.zrem(key, uuid)
         member = '%s:%s' % (key, uuid)
-        self._session.delete(member)
+        pipe.delete(member)
+
+        available = '%s:available' % key
+        for index in ['', ':created', ':calls']:
+            pipe.zrem(available + index, uuid)
+        for weight in range(1, MAX_MEMBER_WEIGHT + 1):
+            pipe.zrem('%s:weight:%d' % (available, weight), uuid)
+        pipe.zrem('%s:calls' % key, uuid)
+        pipe.zrem('%s:timers' % key, uuid)
+        pipe.zrem('%s:weights' % key, uuid)
+        for skill in res['skills'] or []:
+            pipe.zrem('%s:skill:%s' % (key, skill), uuid)
+        pipe.execute()
+
+        if _has_agent(res):
+            agent = self._get_agent_namespace(agent_uuid=res['agent_uuid'])
+            self._leave_agent(
+                client=self._get_session(queue_id=res['agent_uuid']),
+                keys=[agent, '%s:members' % agent, '%s:offer' % agent],
+                args=[queue_id, member])
 
         self._delete_queue_member_status(
             queue_id=queue_id, status=res['status'], uuid=uuid)
+        self._bump_version(
+            key=key, session=self._get_session(queue_id=queue_id))
+
+    @_retry_on_moved
+    def delete_queue_callers(self, queue_id, uuids):
+        """Delete several queue callers in two round trips."""
+        key = self._get_callers_namespace(queue_id=queue_id)
+
+        session = self._get_session(queue_id=queue_id)
+        pipe = session.pipeline(transaction=False)
+        for uuid in uuids:
+            pipe.hgetall('%s:%s' % (key, uuid))
+            pipe.zrank(key, uuid)
+        data = pipe.execute()
 
-    def get_queue_caller(self, queue_id, uuid):
-        """Retrieve information about the given queue caller."""
+        res = []
+        for uuid, values, position in zip(uuids, data[::2], data[1::2]):
+            if not self._caller_codec.exists(values):
+                raise exception.QueueCallerNotFound(uuid=uuid)
+            res.append(self._get_queue_caller_model(
+                values=self._caller_codec.decode(values), position=position))
+
+        pipe = session.pipeline()
+        for caller in res:
+            pipe.zrem(key, caller.uuid)
+            pipe.zrem('%s:timers' % key, caller.uuid)
+            pipe.delete('%s:%s' % (key, caller.uuid))
+            pipe.hdel('%s:overflow' % key, caller.uuid)
+            self._delete_queue_caller_status(
+                queue_id=queue_id, status=caller.status, uuid=caller.uuid,
+                session=pipe)
+        self._bump_version(key=key, session=pipe)
+        pipe.execute()
+
+        _send_notification('callers.delete', {
+            'callers': [x.as_dict() for x in res],
+            'queue_id': queue_id,
+        })
+
+    @_retry_on_moved
+    def expire_queue_timers(self, queue_id, limit):
+        """Time out the callers and members of a queue whose timers are due.
+
+        Ringing callers and members go back to waiting, members in wrap-up
+        go back to waiting, waiting callers time out and timed out callers
+        are deleted, as set by the timers options. Timers are due at the
+        time they were set, changing the status of a caller or member
+        replaces its timer.
+
+        :param limit: The most callers, and members, to time out at once.
+        :returns: The epoch seconds the next timer of the queue is due at,
+                  or None if there is none.
+        """
+        timestamp = timeutils.utcnow_ts(microsecond=True)
+        callers, members, next_timer = self._expire_timers(
+            client=self._get_session(queue_id=queue_id),
+            keys=[
+                self._get_callers_namespace(queue_id=queue_id),
+                self._get_members_namespace(queue_id=queue_id),
+            ],
+            args=[
+                queue_id, timestamp,
+                self._member_codec.encode_timestamp(timestamp), limit,
+                self._get_caller_fields(), self._get_member_fields(),
+            ])
+
+        if callers or members:
+            _send_notification('timers.expire', {
+                'callers': callers,
+                'members': members,
+                'queue_id': queue_id,
+            })
+
+        # NOTE(pabelanger): In cluster mode the other members of an agent
+        # only catch up with its members going back to waiting here.
+        if self._router is not None:
+            for uuid in members:
+                member = self.get_queue_member(
+                    queue_id=queue_id, uuid=uuid, master=True)
+                if _has_agent(member.as_dict()):
+                    self.update_agent_presence(
+                        agent_uuid=member.agent_uuid,
+                        status=QueueMemberStatus.WAITING)
+
+        if next_timer is None:
+            return None
+
+        return float(next_timer)
+
+    @_retry_on_moved
+    def get_agent_presence(self, agent_uuid):
+        """Retrieve the status of an agent, shared by all its members."""
+        key = self._get_agent_namespace(agent_uuid=agent_uuid)
+        pipe = self._get_session(queue_id=agent_uuid).pipeline()
+        pipe.hgetall(key)
+        pipe.hkeys('%s:members' % key)
+        values, queue_ids = pipe.execute()
+
+        if not values:
+            raise exception.AgentNotFound(uuid=agent_uuid)
+
+        return models.AgentPresence(
+            uuid=agent_uuid, queue_ids=sorted(queue_ids),
+            status=values['status'], status_at=int(values['status_at']))
+
+    def get_changed_queue(self, message):
+        """Return the id of the queue a change message is about.
+
+        :param message: A message of the PubSub returned by
+                        subscribe_queue_changes().
+        """
+        channel = message['channel'][len(self._queue_namespace) + 1:]
+        queue_id = channel.rsplit(':', 2)[0]
+        if self._router is not None:
+            queue_id = queue_id[1:-1]
+
+        return queue_id
+
+    @_retry_on_moved
+    def get_queue_caller(self, queue_id, uuid, master=False):
+        """Retrieve information about the given queue caller.
+
+        Set master to read from the master even if replicas are available.
+        """
         key = '%s:%s' % (self._get_callers_namespace(queue_id=queue_id), uuid)
-        res = self._session.hgetall(key)
+        session = self._get_read_session(queue_id=queue_id, master=master)
+        res = session.hgetall(key)
 
-        if 'uuid' not in res:
+        if not self._caller_codec.exists(res):
             raise exception.QueueCallerNotFound(uuid=uuid)
 
         key = self._get_callers_namespace(queue_id=queue_id)
-        res['position'] = self._session.zrank(key, uuid)
+        position = session.zrank(key, uuid)
 
-        caller = models.QueueCaller(
-            uuid=res['uuid'], created_at=res['created_at'],
-            member_uuid=res['member_uuid'], name=res['name'],
-            number=res['number'], position=res['position'],
-            queue_id=res['queue_id'], status=res['status'],
-            status_at=res['status_at'])
+        return self._get_queue_caller_model(
+            values=self._caller_codec.decode(res), position=position)
 
-        return caller
+    @_retry_on_moved
+    def get_queue_callers_version(self, queue_id, master=False):
+        """Return the version of the callers of a queue.
+
+        The version goes up with every change to the callers, and is 0 for
+        a queue which never had any. Listings carry the version they were
+        read at, so comparing the two takes a single GET.
+        """
+        key = self._get_callers_namespace(queue_id=queue_id)
+        session = self._get_read_session(queue_id=queue_id, master=master)
+
+        return int(session.get('%s:version' % key) or 0)
 
-    def get_queue_member(self, queue_id, uuid):
-        """Retrieve information about the given queue member."""
+    @_retry_on_moved
+    def get_queue_callers_etag(self, queue_id, master=False):
+        """Return the ETag of the callers of a queue.
+
+        The ETag is the version of the callers prefixed with its epoch, a
+        random token kept along with the version. A version reset by a
+        flush or failover gets a new epoch, so its ETags never match those
+        handed out before.
+        """
+        key = self._get_callers_namespace(queue_id=queue_id)
+
+        return self._get_version_etag(
+            queue_id=queue_id, key=key, master=master)
+
+    @_retry_on_moved
+    def get_queue_member(self, queue_id, uuid, master=False):
+        """Retrieve information about the given queue member.
+
+        Set master to read from the master even if replicas are available.
+        """
         key = '%s:%s' % (self._get_members_namespace(queue_id=queue_id), uuid)
-        res = self._session.hgetall(key)
+        session = self._get_read_session(queue_id=queue_id, master=master)
+        res = session.hgetall(key)
 
-        if 'uuid' not in res:
+        if not self._member_codec.exists(res):
             raise exception.QueueMemberNotFound(uuid=uuid)
 
-        caller = models.QueueMember(
-            uuid=res['uuid'], created_at=res['created_at'],
-            number=res['number'], paused=res['paused'],
-            paused_at=res['paused_at'], queue_id=res['queue_id'],
-            status=res['status'], status_at=res['status_at'])
+        return self._get_queue_member_model(
+            values=self._member_codec.decode(res))
 
-        return caller
+    @_retry_on_moved
+    def get_queue_members_version(self, queue_id, master=False):
+        """Return the version of the members of a queue.
+
+        See get_queue_callers_version().
+        """
+        key = self._get_members_namespace(queue_id=queue_id)
+        session = self._get_read_session(queue_id=queue_id, master=master)
+
+        return int(session.get('%s:version' % key) or 0)
+
+    @_retry_on_moved
+    def get_queue_members_etag(self, queue_id, master=False):
+        """Return the ETag of the members of a queue.
+
+        See get_queue_callers_etag().
+        """
+        key = self._get_members_namespace(queue_id=queue_id)
+
+        return self._get_version_etag(
+            queue_id=queue_id, key=key, master=master)
+
+    @_retry_on_moved
+    def index_queue_members(self, queue_id):
+        """Index the waiting members of a queue for the match scripts.
+
+        Members kept waiting since before the available sorted sets were
+        introduced are otherwise never matched, until they next enter the
+        waiting status. Indexing a member again is harmless.
+
+        :returns: The number of members indexed.
+        """
+        key = self._get_members_namespace(queue_id=queue_id)
+
+        return self._index_members(
+            client=self._get_session(queue_id=queue_id), keys=[key],
+            args=[
+                QueueMemberStatus.WAITING,
+                self._member_codec.fields['paused'],
+            ])
+
+    def list_dirty_queues(self):
+        """Return the ids of the queues to match with match_queue_callers().
+
+        Those are the queues which gained a waiting caller or member since
+        they were last matched. They are only kept with batch matching, and
+        never in cluster mode where queue events are the only record of
+        them.
+        """
+        if self._router is not None:
+            return []
+
+        return sorted(self._session.smembers(DIRTY_KEY))
+
+    @_retry_on_moved
+    def list_queue_callers(
+            self, queue_id, status=None, limit=None, marker=None,
+            min_wait=None, max_wait=None, master=False):
+        """Retrieve a list of queue callers.
+
+        :param status: Only list callers in this status.
+        :param limit: Maximum number of callers to return.
+        :param marker: uuid of the last caller of the previous page.
+        :param min_wait: Only list callers waiting at least this many
+                         seconds, since they joined the queue or, with
+                         status, since they entered that status.
+        :param max_wait: Only list callers waiting at most this many
+                         seconds.
+        :param master: Read from the master even if replicas are
+                       available.
+        """
+        key = self._get_callers_namespace(queue_id=queue_id)
+        session = self._get_read_session(queue_id=queue_id, master=master)
 
-    def list_queue_callers(self, queue_id, status=None):
-        """Retrieve a list of queue callers."""
         if status:
-            data = self._list_queue_callers_status(
+            page_key = self._get_callers_status_namespace(
                 queue_id=queue_id, status=status)
         else:
-            data = self._list_queue_callers(queue_id=queue_id)
+            page_key = key
+        version, epoch, data = self._list_page_script(
+            session=session, key=page_key, namespace=key, limit=limit,
+            marker=marker, min_wait=min_wait, max_wait=max_wait,
+            priorities=MAX_CALLER_PRIORITY)
+        if epoch is None:
+            epoch = self._get_epoch(queue_id=queue_id, key=key)
+
+        # Hydrate every caller in a single round trip. When the page starts
+        # at the head of the queue the position is simply the index into
+        # the page, otherwise ask for the ZRANK in the same pipeline.
+        indexed = (
+            not status and not marker and min_wait is None and
+            max_wait is None)
+        pipe = session.pipeline(transaction=False)
+        for uuid in data:
+            pipe.hgetall('%s:%s' % (key, uuid))
+            if not indexed:
+                pipe.zrank(key, uuid)
+        values = pipe.execute()
+
+        if indexed:
+            positions = range(0, len(data))
+        else:
+            positions = values[1::2]
+            values = values[::2]
 
         res = []
+        for item, position in zip(values, positions):
+            # Skip callers deleted between ZRANGE and HGETALL.
+            if not self._caller_codec.exists(item):
+                continue
+            res.append(self._get_queue_caller_model(
+                values=self._caller_codec.decode(item), position=position))
+
+        return models.Page(
+            res, version=version, etag=_get_etag(epoch, version))
+
+    @_retry_on_moved
+    def join_distributors(self, node_id, ttl):
+        """Register a distributor node for ttl seconds, or renew it.
+
+        :returns: The sorted ids of the registered distributor nodes,
+                  those which did not renew their registration in time
+                  left out.
+        """
+        timestamp = timeutils.utcnow_ts(microsecond=True)
+        pipe = self._get_session(queue_id=DISTRIBUTORS_KEY).pipeline()
+        pipe.zremrangebyscore(DISTRIBUTORS_KEY, '-inf', timestamp)
+        pipe.zadd(DISTRIBUTORS_KEY, timestamp + ttl, node_id)
+        pipe.zrange(DISTRIBUTORS_KEY, 0, -1)
+
+        return sorted(pipe.execute()[-1])
+
+    @_retry_on_moved
+    def leave_distributors(self, node_id):
+        """Unregister a distributor node."""
+        self._get_session(queue_id=DISTRIBUTORS_KEY).zrem(
+            DISTRIBUTORS_KEY, node_id)
+
+    @_retry_on_moved
+    def list_queue_members(
+            self, queue_id, status=None, limit=None, marker=None,
+            min_wait=None, max_wait=None, master=False):
+        """Retrieve a list of queue members.
+
+        Takes the same paging arguments as list_queue_callers(), the wait
+        of a member counts from when it joined the queue or, with status,
+        from when it entered that status.
+        """
+        key = self._get_members_namespace(queue_id=queue_id)
+        session = self._get_read_session(queue_id=queue_id, master=master)
+
+        if status:
+            page_key = self._get_members_status_namespace(
+                queue_id=queue_id, status=status)
+        else:
+            page_key = key
+        version, epoch, data = self._list_page_script(
+            session=session, key=page_key, namespace=key, limit=limit,
+            marker=marker, min_wait=min_wait, max_wait=max_wait)
+        if epoch is None:
+            epoch = self._get_epoch(queue_id=queue_id, key=key)
+
+        pipe = session.pipeline(transaction=False)
         for uuid in data:
-            res.append(self.get_queue_caller(
-                queue_id=queue_id, uuid=uuid))
+            pipe.hgetall('%s:%s' % (key, uuid))
+
+        res = []
+        for item in pipe.execute():
+            # Skip members deleted between ZRANGE and HGETALL.
+            if not self._member_codec.exists(item):
+                continue
+            res.append(self._get_queue_member_model(
+                values=self._member_codec.decode(item)))
+
+        return models.Page(
+            res, version=version, etag=_get_etag(epoch, version))
+
+    @_retry_on_moved
+    def list_queue_timers(self, queue_ids):
+        """Return the epoch seconds the next timer of each queue is due at.
+
+        Queues without timers are left out. Takes a round trip per Redis
+        node, however many queues there are.
+        """
+        pipes = dict()
+        for queue_id in queue_ids:
+            session = self._get_session(queue_id=queue_id)
+            if session not in pipes:
+                pipes[session] = (session.pipeline(transaction=False), [])
+            pipe, ids = pipes[session]
+            ids.append(queue_id)
+            for key in [
+                    self._get_callers_namespace(queue_id=queue_id),
+                    self._get_members_namespace(queue_id=queue_id)]:
+                pipe.zrange('%s:timers' % key, 0, 0, withscores=True)
+
+        res = dict()
+        for pipe, ids in pipes.values():
+            data = pipe.execute()
+            for queue_id, callers, members in zip(
+                    ids, data[::2], data[1::2]):
+                timers = [x[1] for x in callers + members]
+                if timers:
+                    res[queue_id] = min(timers)
 
         return res
 
-    def list_queue_members(self, queue_id, status=None):
-        """Retrieve a list of queue members."""
-        if status:
-            data = self._list_queue_members_status(
-                queue_id=queue_id, status=status)
+    @_retry_on_moved
+    def match_queue_caller(self, queue_id, strategy=None):
+        """Ring an available member for the longest waiting caller.
+
+        Both are moved from waiting to ringing and the caller is linked to
+        the member in a single server side script, so concurrent
+        distributors never hand out the same caller or member twice. An
+        agent is claimed along with its member, so it is only ever offered
+        by one queue at a time, see payload.cache.scripts.
+
+        :param strategy: A payload.server.strategies.Strategy picking the
+                         member, the longest idle member if None.
+        :returns: A (caller, member) tuple, or None if either no caller or
+                  no unpaused member is waiting.
+        """
+        name, select, args = self._get_strategy_select(strategy=strategy)
+        if name not in self._matches:
+            self._matches[name] = self._session.register_script(
+                scripts.match(select))
+
+        timestamp = timeutils.utcnow_ts(microsecond=True)
+        res = self._matches[name](
+            client=self._get_session(queue_id=queue_id),
+            keys=[
+                self._get_callers_namespace(queue_id=queue_id),
+                self._get_members_namespace(queue_id=queue_id),
+            ],
+            args=[
+                QueueCallerStatus.WAITING, QueueCallerStatus.RINGING,
+                QueueMemberStatus.WAITING, QueueMemberStatus.RINGING,
+                timestamp, self._caller_codec.encode_timestamp(timestamp),
+                self._caller_codec.fields['status'],
+                self._caller_codec.fields['status_at'],
+                self._caller_codec.fields['member_uuid'],
+                self._caller_codec.fields['skills'],
+                self._get_caller_fields(), self._get_member_fields(),
+            ] + args)
+
+        if res is None:
+            return None
+
+        return self._get_match(*res)
+
+    @_retry_on_moved
+    def match_queue_callers(self, strategies, limit=1000):
+        """Ring available members for the waiting callers of several queues.
+
+        Every queue is matched as by match_queue_caller() until either its
+        callers or its members run out, in a single script per Redis node.
+        In cluster mode, where every queue lives in a slot of its own, the
+        script runs once per queue instead, pipelined per node.
+
+        :param strategies: A dict of queue ids mapped to the
+                           payload.server.strategies.Strategy of the
+                           queue, or None for longest idle.
+        :param limit: The most pairs matched by a script.
+        :returns: A (matches, pending) tuple of a list of (caller, member)
+                  tuples, and the ids of the queues left with callers to
+                  match as the limit was reached.
+        """
+        selects = dict()
+        queues = dict()
+        for queue_id, strategy in sorted(strategies.iteritems()):
+            name, select, args = self._get_strategy_select(strategy=strategy)
+            selects[name] = select
+            session = self._get_session(queue_id=queue_id)
+            queues.setdefault(session, []).append([queue_id, name, args])
+
+        names = tuple(sorted(selects))
+        if names not in self._match_queues:
+            self._match_queues[names] = self._session.register_script(
+                scripts.match_queues(selects))
+        script = self._match_queues[names]
+
+        timestamp = timeutils.utcnow_ts(microsecond=True)
+        args = [
+            QueueCallerStatus.WAITING, QueueCallerStatus.RINGING,
+            QueueMemberStatus.WAITING, QueueMemberStatus.RINGING,
+            timestamp, self._caller_codec.encode_timestamp(timestamp),
+            self._caller_codec.fields['status'],
+            self._caller_codec.fields['status_at'],
+            self._caller_codec.fields['member_uuid'],
+            self._caller_codec.fields['skills'],
+            self._get_caller_fields(), self._get_member_fields(), limit,
+        ]
+
+        def _match(client, batch):
+            keys = []
+            for queue_id, name, strategy_args in batch:
+                keys.append(self._get_callers_namespace(queue_id=queue_id))
+                keys.append(self._get_members_namespace(queue_id=queue_id))
+
+            return script(
+                client=client, keys=keys, args=args + [json.dumps(batch)])
+
+        res = []
+        for session, batch in queues.iteritems():
+            if self._router is None:
+                res.append(_match(client=session, batch=batch))
+                continue
+
+            pipe = session.pipeline(transaction=False)
+            for item in batch:
+                _match(client=pipe, batch=[item])
+            res.extend(pipe.execute())
+
+        matches = []
+        pending = []
+        for pairs, unfinished in res:
+            for queue_id, position, caller, member in pairs:
+                match = self._get_match(position, caller, member)
+                if match is not None:
+                    matches.append(match)
+            pending.extend(unfinished)
+
+        return matches, pending
+
+    @_retry_on_moved
+    def overflow_queue_callers(
+            self, queue_id, target_queue_id, max_callers=None,
+            max_wait=None, limit=100):
+        """Move waiting callers over the thresholds of a queue to another.
+
+        Callers who waited max_wait seconds or more move first, then the
+        callers last in line until at most max_callers are left waiting.
+        Moved callers join the other queue as if they just arrived, so that
+        max_wait starts over there, and keep their timers. Callers move in
+        a single script, except in cluster mode where the other queue lives
+        on another node. They are then taken out of line, written to the
+        other queue, and only then deleted. Moves left unfinished, by a
+        lost connection or process, are finished by the next call for the
+        queue.
+
+        :param limit: The most callers to move at once.
+        :returns: The epoch seconds the next caller reaches max_wait at,
+                  now if callers are left to move, or None.
+        """
+        timestamp = timeutils.utcnow_ts(microsecond=True)
+        keys = [self._get_callers_namespace(queue_id=queue_id)]
+        if self._router is None:
+            keys.append(
+                self._get_callers_namespace(queue_id=target_queue_id))
         else:
-            data = self._list_queue_members(queue_id=queue_id)
+            self._resume_overflow(queue_id=queue_id)
+
+        res = self._overflow_callers(
+            client=self._get_session(queue_id=queue_id), keys=keys,
+            args=[
+                target_queue_id,
+                '' if max_callers is None else max_callers,
+                '' if max_wait is None else max_wait,
+                timestamp, limit, self._get_caller_fields(),
+                self._caller_codec.encode_timestamp(timestamp),
+            ])
+        next_check, callers = res[0], res[1:]
+
+        if callers and self._router is not None:
+            self._move_overflow(
+                queue_id=queue_id, target_queue_id=target_queue_id,
+                callers=[
+                    (x[0], x[1:4], dict(zip(x[4][::2], x[4][1::2])))
+                    for x in callers])
+
+        if callers:
+            _send_notification('callers.overflow', {
+                'callers': [x[0] for x in callers],
+                'queue_id': queue_id,
+                'target_queue_id': target_queue_id,
+            })
+
+        if next_check is None:
+            return None
+
+        return float(next_check)
+
+    @_retry_on_moved
+    def release_queue_lease(self, queue_id, owner):
+        """Give up the lease of owner on a queue, if it still holds it."""
+        self._release_lease(
+            client=self._get_session(queue_id=queue_id),
+            keys=[self._get_lease_key(queue_id=queue_id)], args=[owner])
+
+    @_retry_on_moved
+    def renew_queue_leases(self, queue_ids, owner, ttl):
+        """Renew the leases of owner on several queues.
+
+        Takes a round trip per Redis node, however many queues there are.
+
+        :returns: The ids of the queues owner still holds the lease of.
+        """
+        pipes = dict()
+        for queue_id in queue_ids:
+            session = self._get_session(queue_id=queue_id)
+            if session not in pipes:
+                pipes[session] = (session.pipeline(transaction=False), [])
+            pipe, ids = pipes[session]
+            ids.append(queue_id)
+            self._lease(
+                client=pipe, keys=[self._get_lease_key(queue_id=queue_id)],
+                args=[owner, int(ttl * 1000)])
 
         res = []
-        for uuid in data:
-            res.append(self.get_queue_member(
-                queue_id=queue_id, uuid=uuid))
+        for pipe, ids in pipes.values():
+            for queue_id, held in zip(ids, pipe.execute()):
+                if held:
+                    res.append(queue_id)
 
         return res
 
+    @_retry_on_moved
+    def update_agent_presence(self, agent_uuid, status):
+        """Give an agent, and all its queue members, a new status.
+
+        Every member of the agent leaves or enters its waiting status at
+        once, so an agent ringing in one queue is never offered by
+        another. In cluster mode the queues of an agent live on different
+        nodes, and the members are updated one queue at a time instead.
+        """
+        timestamp = timeutils.utcnow_ts(microsecond=True)
+        key = self._get_agent_namespace(agent_uuid=agent_uuid)
+        session = self._get_session(queue_id=agent_uuid)
+
+        if self._router is None:
+            self._agent_status(
+                client=session,
+                keys=[key, '%s:members' % key, '%s:offer' % key],
+                args=[
+                    agent_uuid, status, timestamp,
+                    self._member_codec.encode_timestamp(timestamp),
+                    self._get_member_fields(),
+                ])
+        else:
+            pipe = session.pipeline()
+            pipe.hmset(key, {
+                'status': status,
+                'status_at': self._member_codec.encode_timestamp(timestamp),
+            })
+            if status != QueueMemberStatus.RINGING:
+                pipe.delete('%s:offer' % key)
+            pipe.execute()
+            members = session.hgetall('%s:members' % key)
+            for queue_id, uuid in sorted(members.iteritems()):
+                try:
+                    self._update_queue_member_status(
+                        queue_id=queue_id, status=status,
+                        timestamp=timestamp, uuid=uuid)
+                except exception.QueueMemberNotFound:
+                    LOG.warn(
+                        'Agent %s member %s of queue %s is gone' % (
+                            agent_uuid, uuid, queue_id))
+                    continue
+                if status == QueueMemberStatus.WAITING:
+                    self._publish_event(queue_id=queue_id)
+
+        _send_notification(
+            'agent.update',
+            self.get_agent_presence(agent_uuid=agent_uuid).as_dict())
+
+    def subscribe_queue_changes(self):
+        """Return a PubSub subscribed to the changes of every queue.
+
+        A message is published on the version channel of the callers or
+        members of a queue as they change, see get_changed_queue(). The
+        confirmation of the subscription comes through as a message of its
+        own. In cluster mode any node sees every message, see
+        get_watcher().
+        """
+        res = self._get_pubsub_session().pubsub()
+        res.psubscribe('%s:*:version' % self._queue_namespace)
+
+        return res
+
+    def subscribe_queue_events(self):
+        """Return a PubSub subscribed to the queue events channel.
+
+        Every message carries the id of a queue which gained a waiting
+        caller or member. In cluster mode any node sees every message, see
+        get_watcher().
+        """
+        res = self._get_pubsub_session().pubsub(
+            ignore_subscribe_messages=True)
+        res.subscribe(EVENTS_CHANNEL)
+
+        return res
+
+    @_retry_on_moved
     def update_queue_caller(
             self, queue_id, uuid, member_uuid=None, name=None, number=None,
-            status=None):
+            status=None, skills=None):
         timestamp = timeutils.utcnow_ts(microsecond=True)
         key = self._get_callers_namespace(queue_id=queue_id)
         caller = '%s:%s' % (key, uuid)
@@ -253,111 +1393,438 @@ class Connection(object):
             data['name'] = name
         if number is not None:
             data['number'] = number
+        if skills is not None:
+            data['skills'] = skills
         if data:
-            self._session.hmset(caller, data)
+            pipe = self._get_session(queue_id=queue_id).pipeline()
+            pipe.hmset(caller, self._caller_codec.encode(data))
+            self._bump_version(key=key, session=pipe)
+            pipe.execute()
 
         if status is not None:
-            self._update_queue_caller_status(
+            res = self._update_queue_caller_status(
                 queue_id=queue_id, status=status, timestamp=timestamp,
                 uuid=uuid)
+        else:
+            res = self.get_queue_caller(
+                queue_id=queue_id, uuid=uuid, master=True)
 
-        res = self.get_queue_caller(
-            queue_id=queue_id, uuid=uuid)
+        if res.status == QueueCallerStatus.WAITING:
+            self._publish_event(queue_id=queue_id)
 
-        _send_notification('caller.update', res.__dict__)
+        _send_notification('caller.update', res.as_dict())
 
+    @_retry_on_moved
     def update_queue_member(
-            self, queue_id, uuid, number=None, paused=None, status=None):
+            self, queue_id, uuid, number=None, paused=None, status=None,
+            weight=None, skills=None):
         timestamp = timeutils.utcnow_ts(microsecond=True)
-        key = self._get_members_namespace(queue_id=queue_id)
-        member = '%s:%s' % (key, uuid)
         data = dict()
 
         if number is not None:
             data['number'] = number
         if paused is not None:
             data['paused'] = paused
-            data['paused_at'] = timeutils.iso8601_from_timestamp(
-                timestamp, microsecond=True)
-        if data:
-            self._session.hmset(member, data)
+            data['paused_at'] = timestamp
+        if skills is not None:
+            data['skills'] = skills
+        if weight is not None:
+            self._validate_weight(weight=weight)
+        if data or weight is not None:
+            self._update_member_script(
+                queue_id=queue_id, uuid=uuid, data=data, weight=weight)
 
         if status is not None:
-            self._update_queue_member_status(
+            res = self._update_queue_member_status(
                 queue_id=queue_id, status=status, timestamp=timestamp,
                 uuid=uuid)
+        else:
+            res = self.get_queue_member(
+                queue_id=queue_id, uuid=uuid, master=True)
 
-        res = self.get_queue_member(
-            queue_id=queue_id, uuid=uuid)
+        if res.status == QueueMemberStatus.WAITING:
+            self._publish_event(queue_id=queue_id)
 
-        _send_notification('member.update', res.__dict__)
+        _send_notification('member.update', res.as_dict())
 
-    def _create_queue_caller_status(self, queue_id, timestamp, status, uuid):
-        values = {
-            'status': status,
-            'status_at': timeutils.iso8601_from_timestamp(
-                timestamp, microsecond=True),
-        }
-        key = self._get_callers_status_namespace(
-            queue_id=queue_id, status=status)
+        if (status is not None and self._router is not None and
+                _has_agent(res.as_dict())):
+            self.update_agent_presence(
+                agent_uuid=res.agent_uuid, status=status)
 
-        self._session.zadd(key, timestamp, uuid)
+    @_retry_on_moved
+    def wait_queue_callers(self, queue_id, version, timeout, epoch=None):
+        """Wait for the callers of a queue to change past a version.
 
+        Returns as soon as get_queue_callers_version() is above version,
+        or the epoch is no longer the one given, if any, or after timeout
+        seconds. Waits only block the calling thread, see
+        payload.cache.watch.
+        """
         key = self._get_callers_namespace(queue_id=queue_id)
-        caller = '%s:%s' % (key, uuid)
-        self._session.hmset(caller, values)
+        self._wait_version(
+            queue_id=queue_id, key=key, version=version, timeout=timeout,
+            epoch=epoch)
+
+    @_retry_on_moved
+    def wait_queue_members(self, queue_id, version, timeout, epoch=None):
+        """Wait for the members of a queue to change past a version.
+
+        See wait_queue_callers().
+        """
+        key = self._get_members_namespace(queue_id=queue_id)
+        self._wait_version(
+            queue_id=queue_id, key=key, version=version, timeout=timeout,
+            epoch=epoch)
+
+    def _create_queue_caller(
+            self, session, queue_id, timestamp, uuid=None, member_uuid=None,
+            name=None, number=None, status=1, skills=None, priority=0):
+        if priority not in range(0, MAX_CALLER_PRIORITY + 1):
+            raise exception.QueueCallerPriorityInvalid(
+                priority=priority, max_priority=MAX_CALLER_PRIORITY)
 
-    def _create_queue_member_status(self, queue_id, timestamp, status, uuid):
         values = {
+            'created_at': timestamp,
+            'member_uuid': member_uuid,
+            'name': name,
+            'number': number,
+            'priority': priority,
+            'queue_id': queue_id,
+            'skills': skills,
             'status': status,
-            'status_at': timeutils.iso8601_from_timestamp(
-                timestamp, microsecond=True),
+            'status_at': timestamp,
         }
-        key = self._get_members_status_namespace(
-            queue_id=queue_id, status=status)
+        if uuid:
+            values['uuid'] = uuid
+        else:
+            values['uuid'] = uuidutils.generate_uuid()
 
-        self._session.zadd(key, timestamp, uuid)
+        score = _get_caller_score(timestamp=timestamp, priority=priority)
+        key = self._get_callers_namespace(queue_id=queue_id)
+        session.zadd(key, score, values['uuid'])
 
-        key = self._get_members_namespace(queue_id=queue_id)
-        member = '%s:%s' % (key, uuid)
-        self._session.hmset(member, values)
+        caller = '%s:%s' % (key, values['uuid'])
+        session.hmset(caller, self._caller_codec.encode(values))
 
-    def _delete_queue_caller_status(self, queue_id, status, uuid):
+        status_key = self._get_callers_status_namespace(
+            queue_id=queue_id, status=status)
+        session.zadd(status_key, score, values['uuid'])
+
+        # Timeouts counted from the arrival of the caller and from its
+        # status change are one and the same here.
+        timer = self._get_caller_timers().get(str(status))
+        if timer is not None:
+            session.zadd('%s:timers' % key, timestamp + timer[0],
+                         values['uuid'])
+        self._bump_version(key=key, session=session)
+
+        return values
+
+    def _bump_version(self, key, session):
+        # See C:version and P:version in payload.cache.scripts.
+        version = '%s:version' % key
+        session.incr(version)
+        session.publish(version, '')
+
+    def _delete_queue_caller_status(self, queue_id, status, uuid,
+                                    session=None):
+        session = session or self._get_session(queue_id=queue_id)
         key = self._get_callers_status_namespace(
             queue_id=queue_id, status=status)
-        self._session.zrem(key, uuid)
+        session.zrem(key, uuid)
+
+    def _move_overflow(self, queue_id, target_queue_id, callers):
+        # Write callers taken out of line by the overflow script to the
+        # other queue, then drop them from the queue, see
+        # overflow_queue_callers(). Writing them again is harmless.
+        target = self._get_callers_namespace(queue_id=target_queue_id)
+        status = self._get_callers_status_namespace(
+            queue_id=target_queue_id, status=QueueCallerStatus.WAITING)
+        pipe = self._get_session(queue_id=target_queue_id).pipeline()
+        for uuid, (score, waiting, timer), values in callers:
+            values[self._caller_codec.fields['queue_id']] = target_queue_id
+            pipe.zadd(target, score, uuid)
+            pipe.zadd(status, waiting, uuid)
+            if timer is not None:
+                pipe.zadd('%s:timers' % target, timer, uuid)
+            pipe.hmset('%s:%s' % (target, uuid), values)
+        self._bump_version(key=target, session=pipe)
+        pipe.publish(EVENTS_CHANNEL, target_queue_id)
+        pipe.execute()
+
+        gone = self._finish_overflow_script(
+            queue_id=queue_id, uuids=[x[0] for x in callers])
+        if not gone:
+            return
+
+        # NOTE(pabelanger): Callers who hung up while moving.
+        pipe = self._get_session(queue_id=target_queue_id).pipeline()
+        for uuid in gone:
+            pipe.zrem(target, uuid)
+            pipe.zrem(status, uuid)
+            pipe.zrem('%s:timers' % target, uuid)
+            pipe.delete('%s:%s' % (target, uuid))
+        self._bump_version(key=target, session=pipe)
+        pipe.execute()
+
+    def _finish_overflow_script(self, queue_id, uuids):
+        key = self._get_callers_namespace(queue_id=queue_id)
+        keys = ['%s:overflow' % key]
+        keys.extend('%s:%s' % (key, x) for x in uuids)
+
+        return self._finish_overflow(
+            client=self._get_session(queue_id=queue_id), keys=keys,
+            args=uuids)
+
+    def _resume_overflow(self, queue_id):
+        # Finish the moves of an earlier overflow_queue_callers() call left
+        # unfinished, in cluster mode.
+        key = self._get_callers_namespace(queue_id=queue_id)
+        session = self._get_session(queue_id=queue_id)
+        pending = session.hgetall('%s:overflow' % key)
+        if not pending:
+            return
+
+        LOG.info('Resuming the overflow of %d callers of queue %s' % (
+            len(pending), queue_id))
+        pipe = session.pipeline(transaction=False)
+        for uuid in pending:
+            pipe.hgetall('%s:%s' % (key, uuid))
+        gone = []
+        targets = dict()
+        for uuid, values in zip(pending, pipe.execute()):
+            if not values:
+                gone.append(uuid)
+                continue
+            move = json.loads(pending[uuid])
+            # NOTE(pabelanger): Scores missing from a sorted set are false.
+            scores = [None if x is False else x for x in move[1:]]
+            targets.setdefault(move[0], []).append((uuid, scores, values))
+
+        if gone:
+            self._finish_overflow_script(queue_id=queue_id, uuids=gone)
+        for target_queue_id, callers in sorted(targets.items()):
+            self._move_overflow(
+                queue_id=queue_id, target_queue_id=target_queue_id,
+                callers=callers)
 
     def _delete_queue_member_status(self, queue_id, status, uuid):
         key = self._get_members_status_namespace(
             queue_id=queue_id, status=status)
-        self._session.zrem(key, uuid)
+        self._get_session(queue_id=queue_id).zrem(key, uuid)
+
+    def _list_page_script(
+            self, session, key, namespace, limit, marker, min_wait, max_wait,
+            priorities=0):
+        # Scores are the epoch seconds at which the wait started, shifted
+        # down by one band per caller priority.
+        ranges = ['-inf', '+inf']
+        if min_wait is not None or max_wait is not None:
+            now = timeutils.utcnow_ts(microsecond=True)
+            ranges = []
+            for priority in range(priorities, -1, -1):
+                offset = _get_caller_score(timestamp=0, priority=priority)
+                if max_wait is not None:
+                    lowest = repr(offset + now - max_wait)
+                elif priorities:
+                    lowest = repr(offset)
+                else:
+                    lowest = '-inf'
+                if min_wait is None:
+                    highest = '(%r' % (offset + CALLER_PRIORITY_BAND)
+                else:
+                    highest = repr(offset + now - min_wait)
+                ranges.extend([lowest, highest])
+
+        res = self._list_page(
+            client=session,
+            keys=[key, '%s:version' % namespace, '%s:epoch' % namespace],
+            args=[marker or '', -1 if limit is None else limit] + ranges)
+
+        if res is None:
+            raise exception.MarkerNotFound(marker=marker)
+
+        return res[0], res[1], res[2]
 
-    def _list_queue_callers(self, queue_id):
-        key = self._get_callers_namespace(queue_id=queue_id)
+    def _get_queue_namespace(self, queue_id):
+        if self._router is not None:
+            # Hash tag the queue id so every key of a queue maps to the
+            # same slot.
+            if not _is_hash_tag(queue_id):
+                raise exception.QueueIdInvalid(queue_id=queue_id)
+            return '%s:{%s}' % (self._queue_namespace, queue_id)
 
-        return self._session.zrange(key, 0, -1)
+        name = '%s:%s' % (self._queue_namespace, queue_id)
 
-    def _list_queue_callers_status(self, queue_id, status):
-        key = self._get_callers_status_namespace(
-            queue_id=queue_id, status=status)
+        return name
 
-        return self._session.zrange(key, 0, 1)
+    def _get_lease_key(self, queue_id):
+        name = self._get_queue_namespace(queue_id=queue_id)
 
-    def _list_queue_members(self, queue_id):
-        key = self._get_members_namespace(queue_id=queue_id)
+        return '%s:lease' % name
+
+    def _get_agent_namespace(self, agent_uuid):
+        if self._router is not None:
+            if not _is_hash_tag(agent_uuid):
+                raise exception.AgentUuidInvalid(uuid=agent_uuid)
+            return '%s:{%s}' % (self._agent_namespace, agent_uuid)
+
+        return '%s:%s' % (self._agent_namespace, agent_uuid)
+
+    def _get_epoch(self, queue_id, key):
+        # Return the epoch of a version, set on the master if there is none
+        # yet, see get_queue_callers_etag().
+        epoch = '%s:epoch' % key
+        pipe = self._get_session(queue_id=queue_id).pipeline()
+        pipe.setnx(epoch, uuidutils.generate_uuid()[:8])
+        pipe.get(epoch)
+
+        return pipe.execute()[-1]
+
+    def _get_caller_fields(self):
+        # See payload.cache.scripts.
+        res = dict(
+            (k, self._caller_codec.fields[k])
+            for k in ['priority', 'queue_id', 'status', 'status_at'])
+        res['band'] = CALLER_PRIORITY_BAND
+        res['channel'] = EVENTS_CHANNEL
+        if self._keeps_dirty_queues():
+            res['dirty'] = DIRTY_KEY
+        res['expire'] = {
+            QueueCallerStatus.RINGING: QueueCallerStatus.WAITING,
+            QueueCallerStatus.TIMEOUT: '',
+            QueueCallerStatus.WAITING: QueueCallerStatus.TIMEOUT,
+        }
+        res['priorities'] = MAX_CALLER_PRIORITY
+        res['timers'] = self._get_caller_timers()
+        res['waiting'] = QueueCallerStatus.WAITING
+
+        return json.dumps(res)
+
+    def _get_caller_timers(self):
+        return _get_timers({
+            QueueCallerStatus.RINGING: [CONF.timers.ring_timeout],
+            QueueCallerStatus.TIMEOUT: [CONF.timers.timeout_retention],
+            QueueCallerStatus.WAITING: [
+                CONF.timers.max_wait, self._caller_codec.fields['created_at'],
+            ],
+        })
+
+    def _get_match(self, position, caller, member):
+        caller = self._get_queue_caller_model(
+            values=self._caller_codec.decode(
+                dict(zip(caller[::2], caller[1::2]))),
+            position=position)
+        member = self._get_queue_member_model(
+            values=self._member_codec.decode(
+                dict(zip(member[::2], member[1::2]))))
+
+        if (self._router is not None and _has_agent(member.as_dict()) and
+                not self._claim_agent(caller=caller, member=member)):
+            return None
+
+        _send_notification('caller.update', caller.as_dict())
+        _send_notification('member.update', member.as_dict())
+
+        # NOTE(pabelanger): In cluster mode the other members of the agent
+        # keep waiting until this catches up with them.
+        if self._router is not None and _has_agent(member.as_dict()):
+            self.update_agent_presence(
+                agent_uuid=member.agent_uuid, status=member.status)
+
+        return caller, member
+
+    def _claim_agent(self, caller, member):
+        # Claim the agent of a member matched in cluster mode, see
+        # payload.cache.scripts. The match is undone if another queue
+        # claimed the agent first.
+        key = self._get_agent_namespace(agent_uuid=member.agent_uuid)
+        claim = '%s:%s' % (
+            self._get_members_namespace(queue_id=member.queue_id),
+            member.uuid)
+        pipe = self._get_session(queue_id=member.agent_uuid).pipeline()
+        pipe.set('%s:offer' % key, claim, nx=True)
+        pipe.get('%s:offer' % key)
+        pipe.hget(key, 'status')
+        claimed, holder, status = pipe.execute()
+        if claimed or holder == claim:
+            return True
+
+        LOG.info('Agent %s was offered by another queue, unmatching %s' % (
+            member.agent_uuid, caller.uuid))
+        timestamp = timeutils.utcnow_ts(microsecond=True)
+        callers = self._get_callers_namespace(queue_id=member.queue_id)
+        members = self._get_members_namespace(queue_id=member.queue_id)
+        self._unmatch(
+            client=self._get_session(queue_id=member.queue_id),
+            keys=[
+                callers, members, '%s:%s' % (callers, caller.uuid),
+                '%s:%s' % (members, member.uuid),
+            ],
+            args=[
+                member.queue_id, caller.uuid, member.uuid,
+                status or QueueMemberStatus.RINGING, timestamp,
+                self._caller_codec.encode_timestamp(timestamp),
+                self._get_caller_fields(), self._get_member_fields(),
+            ])
+
+        return False
+
+    def _get_member_fields(self):
+        # See payload.cache.scripts, the namespace formats are left out in
+        # cluster mode so members are only ever changed one queue at a time.
+        res = dict(
+            (k, self._member_codec.fields[k])
+            for k in ['agent_uuid', 'paused', 'status', 'status_at'])
+        res['channel'] = EVENTS_CHANNEL
+        res['expire'] = {
+            QueueMemberStatus.RINGING: QueueMemberStatus.WAITING,
+            QueueMemberStatus.WRAPUP: QueueMemberStatus.WAITING,
+        }
+        res['ringing'] = QueueMemberStatus.RINGING
+        res['timers'] = self._get_member_timers()
+        res['waiting'] = QueueMemberStatus.WAITING
 
-        return self._session.zrange(key, 0, -1)
+        if self._keeps_dirty_queues():
+            res['dirty'] = DIRTY_KEY
+        if self._router is None:
+            res['agents'] = self._get_agent_namespace(agent_uuid='%s')
+            res['members'] = self._get_members_namespace(queue_id='%s')
 
-    def _list_queue_members_status(self, queue_id, status):
-        key = self._get_members_status_namespace(
-            queue_id=queue_id, status=status)
+        return json.dumps(res)
 
-        return self._session.zrange(key, 0, 1)
+    def _get_member_timers(self):
+        return _get_timers({
+            QueueMemberStatus.RINGING: [CONF.timers.ring_timeout],
+            QueueMemberStatus.WRAPUP: [CONF.timers.wrapup_time],
+        })
 
-    def _get_queue_namespace(self, queue_id):
-        name = '%s:%s' % (self._queue_namespace, queue_id)
+    def _get_pubsub_session(self):
+        if self._router is None:
+            return self._session
 
-        return name
+        return self._router.get_node_session()
+
+    def _get_read_session(self, queue_id, master):
+        if not master and self._replicas is not None:
+            session = self._replicas.get_session()
+            if session is not None:
+                return session
+
+        return self._get_session(queue_id=queue_id)
+
+    def _get_session(self, queue_id):
+        if self._router is not None:
+            return self._router.get_session(queue_id=queue_id)
+
+        return self._session
+
+    def _get_strategy_select(self, strategy):
+        if strategy is None:
+            return 'longest-idle', scripts.LONGEST_IDLE, []
+
+        return strategy.name, strategy.select, strategy.get_args()
 
     def _get_callers_namespace(self, queue_id):
         name = self._get_queue_namespace(queue_id=queue_id)
@@ -383,16 +1850,137 @@ class Connection(object):
 
         return key
 
+    def _keeps_dirty_queues(self):
+        # See list_dirty_queues(). In cluster mode the queues live on
+        # different nodes, so only queue events name the queues to match.
+        return self._router is None and CONF.distributor.batch_matching
+
+    def _publish_event(self, queue_id, session=None):
+        pipe = session
+        if pipe is None:
+            pipe = self._get_session(queue_id=queue_id).pipeline(
+                transaction=False)
+
+        pipe.publish(EVENTS_CHANNEL, queue_id)
+        if self._keeps_dirty_queues():
+            pipe.sadd(DIRTY_KEY, queue_id)
+
+        if session is None:
+            pipe.execute()
+
+    def _get_queue_caller_model(self, values, position):
+        caller = models.QueueCaller(
+            uuid=values['uuid'], created_at=values['created_at'],
+            member_uuid=values['member_uuid'], name=values['name'],
+            number=values['number'], position=position,
+            priority=values.get('priority', 0), queue_id=values['queue_id'],
+            skills=values.get('skills'), status=values['status'],
+            status_at=values['status_at'])
+
+        return caller
+
+    def _get_queue_member_model(self, values):
+        member = models.QueueMember(
+            uuid=values['uuid'], created_at=values['created_at'],
+            number=values['number'], paused=values['paused'],
+            paused_at=values['paused_at'], queue_id=values['queue_id'],
+            skills=values.get('skills'), status=values['status'],
+            status_at=values['status_at'],
+            agent_uuid=values.get('agent_uuid'))
+
+        return member
+
     def _update_queue_caller_status(self, queue_id, status, timestamp, uuid):
-        res = self.get_queue_caller(queue_id=queue_id, uuid=uuid).__dict__
-        self._delete_queue_caller_status(
-            queue_id=queue_id, status=res['status'], uuid=uuid)
-        self._create_queue_caller_status(
-            queue_id=queue_id, status=status, timestamp=timestamp, uuid=uuid)
+        key = self._get_callers_namespace(queue_id=queue_id)
+        res = self._update_status_script(
+            queue_id=queue_id, key=key, status=status, timestamp=timestamp,
+            uuid=uuid, record_codec=self._caller_codec)
+
+        if res is None:
+            raise exception.QueueCallerNotFound(uuid=uuid)
+
+        position, values = res
+
+        return self._get_queue_caller_model(values=values, position=position)
 
     def _update_queue_member_status(self, queue_id, status, timestamp, uuid):
-        res = self.get_queue_member(queue_id=queue_id, uuid=uuid).__dict__
-        self._delete_queue_member_status(
-            queue_id=queue_id, status=res['status'], uuid=uuid)
-        self._create_queue_member_status(
-            queue_id=queue_id, status=status, timestamp=timestamp, uuid=uuid)
+        key = self._get_members_namespace(queue_id=queue_id)
+        res = self._update_status_script(
+            queue_id=queue_id, key=key, status=status, timestamp=timestamp,
+            uuid=uuid, record_codec=self._member_codec)
+
+        if res is None:
+            raise exception.QueueMemberNotFound(uuid=uuid)
+
+        return self._get_queue_member_model(values=res[1])
+
+    def _update_member_script(self, queue_id, uuid, data, weight):
+        key = self._get_members_namespace(queue_id=queue_id)
+        args = [
+            uuid, QueueMemberStatus.WAITING,
+            self._member_codec.fields['status'],
+            self._member_codec.fields['paused'],
+            '' if weight is None else weight,
+            self._member_codec.fields['skills'],
+        ]
+        for k, v in self._member_codec.encode(data).iteritems():
+            args.extend([k, v])
+
+        res = self._update_member(
+            client=self._get_session(queue_id=queue_id),
+            keys=['%s:%s' % (key, uuid), key], args=args)
+
+        if res is None:
+            raise exception.QueueMemberNotFound(uuid=uuid)
+
+    def _update_status_script(
+            self, queue_id, key, status, timestamp, uuid, record_codec):
+        # Only members are kept in the available sorted sets, and only
+        # callers have a priority.
+        if record_codec is self._member_codec:
+            fields = [self._get_member_fields(), '']
+        else:
+            fields = ['', self._get_caller_fields()]
+
+        res = self._update_status(
+            client=self._get_session(queue_id=queue_id),
+            keys=['%s:%s' % (key, uuid), key],
+            args=[
+                uuid, status, timestamp,
+                record_codec.encode_timestamp(timestamp),
+                record_codec.fields['status'],
+                record_codec.fields['status_at'],
+            ] + fields)
+
+        if res is None:
+            return None
+
+        position, data = res
+        values = record_codec.decode(dict(zip(data[::2], data[1::2])))
+
+        return position, values
+
+    def _get_version_etag(self, queue_id, key, master):
+        session = self._get_read_session(queue_id=queue_id, master=master)
+        epoch, version = session.mget('%s:epoch' % key, '%s:version' % key)
+        if epoch is None:
+            epoch = self._get_epoch(queue_id=queue_id, key=key)
+
+        return _get_etag(epoch, int(version or 0))
+
+    def _wait_version(self, queue_id, key, version, timeout, epoch=None):
+        session = self._get_session(queue_id=queue_id)
+        keys = ['%s:epoch' % key, '%s:version' % key]
+
+        def _check():
+            current, res = session.mget(keys)
+            if epoch is not None and current != epoch:
+                return True
+            return int(res or 0) > version
+
+        get_watcher().wait(channel=keys[1], check=_check, timeout=timeout)
+
+    def _validate_weight(self, weight):
+        if weight not in range(1, MAX_MEMBER_WEIGHT + 1):
+            raise exception.QueueMemberWeightInvalid(
+                weight=weight, max_weight=MAX_MEMBER_WEIGHT)
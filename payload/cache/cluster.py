@@ -0,0 +1,154 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Routing of per queue traffic to the owning Redis Cluster node.
+
+Every key of a queue carries the queue id as its hash tag, so all of them
+live in one slot and a queue can be served by a plain connection to the
+master owning that slot. This lets pipelines and scripts run unchanged.
+"""
+
+import redis
+
+from payload.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+SLOTS = 16384
+
+
+def crc16(data):
+    """CRC16-CCITT (XMODEM), as used by Redis Cluster."""
+    crc = 0
+    for c in data:
+        crc ^= ord(c) << 8
+        for x in range(0, 8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xffff
+            else:
+                crc = (crc << 1) & 0xffff
+
+    return crc
+
+
+def key_slot(key):
+    """Return the cluster slot of a key, honouring {hash tags}."""
+    start = key.find('{')
+    if start > -1:
+        end = key.find('}', start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+
+    return crc16(key) % SLOTS
+
+
+class Router(object):
+    """Map slots to the sessions of the masters serving them."""
+
+    def __init__(self, nodes, pool_class, **kwargs):
+        """Create a router, the slot map is loaded on first use.
+
+        :param nodes: A list of 'host:port' seed nodes.
+        :param pool_class: The connection pool class to use per master.
+        :param kwargs: Passed to pool_class for every master.
+        """
+        self.nodes = nodes
+        self.pool_class = pool_class
+        self.pool_kwargs = kwargs
+        self.sessions = dict()
+        self.slots = None
+        self._queues = dict()
+
+    def disconnect(self):
+        for session in self.sessions.values():
+            session.connection_pool.disconnect()
+        self.sessions = dict()
+        self.slots = None
+        self._queues = dict()
+
+    def get_session(self, queue_id):
+        """Return the session of the master owning the queue."""
+        if self.slots is None:
+            self.refresh()
+
+        slot = self._queues.get(queue_id)
+        if slot is None:
+            slot = key_slot(str(queue_id))
+            self._queues[queue_id] = slot
+
+        session = self.slots[slot]
+        if session is None:
+            raise redis.ConnectionError(
+                'Redis Cluster slot %d is not served by any node' % slot)
+
+        return session
+
+    def get_node_session(self):
+        """Return the session of a master of the cluster.
+
+        Any node sees every message published in the cluster, so one will
+        do for subscriptions.
+        """
+        if self.slots is None:
+            self.refresh()
+
+        for session in self.slots:
+            if session is not None:
+                return session
+
+        raise redis.ConnectionError(
+            'No Redis Cluster slot is served by any node')
+
+    def get_stats(self):
+        res = dict()
+        for node, session in self.sessions.iteritems():
+            res[node] = session.connection_pool.get_stats()
+
+        return res
+
+    def refresh(self):
+        """Reload the slot map from the first reachable node."""
+        for node in self.nodes:
+            session = self._get_node_session(node)
+            try:
+                data = session.execute_command('CLUSTER SLOTS')
+            except redis.ConnectionError:
+                LOG.warn('Unable to reach Redis Cluster node %s' % node)
+                continue
+            break
+        else:
+            raise redis.ConnectionError(
+                'Unable to reach any Redis Cluster node')
+
+        slots = [None] * SLOTS
+        for item in data:
+            start, end, master = item[0], item[1], item[2]
+            node = '%s:%s' % (master[0], master[1])
+            session = self._get_node_session(node)
+            for slot in range(start, end + 1):
+                slots[slot] = session
+
+        self.slots = slots
+
+    def _get_node_session(self, node):
+        if node not in self.sessions:
+            host, port = node.rsplit(':', 1)
+            pool = self.pool_class(
+                host=host, port=int(port), **self.pool_kwargs)
+            self.sessions[node] = redis.StrictRedis(connection_pool=pool)
+
+        return self.sessions[node]
@@ -0,0 +1,150 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Encoding of queue caller and member records stored as Redis hashes.
+"""
+
+import json
+
+QUEUE_CALLER_FIELDS = {
+    'created_at': 'c',
+    'member_uuid': 'm',
+    'name': 'n',
+    'number': '#',
+    'priority': 'r',
+    'queue_id': 'q',
+    'skills': 'k',
+    'status': 's',
+    'status_at': 't',
+    'uuid': 'u',
+}
+
+QUEUE_MEMBER_FIELDS = {
+    'agent_uuid': 'g',
+    'created_at': 'c',
+    'number': '#',
+    'paused': 'p',
+    'paused_at': 'a',
+    'queue_id': 'q',
+    'skills': 'k',
+    'status': 's',
+    'status_at': 't',
+    'uuid': 'u',
+}
+
+INTEGER_FIELDS = ('priority',)
+
+# Stored as JSON, so the scripts can read them with cjson.
+JSON_FIELDS = ('skills',)
+
+TIMESTAMP_FIELDS = ('created_at', 'paused_at', 'status_at')
+
+
+def _encode(value):
+    """Return value the way redis hands it back from HGETALL."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    return str(value)
+
+
+class HashCodec(object):
+    """Store records with their full field names."""
+
+    def __init__(self, fields):
+        self.fields = dict((k, k) for k in fields)
+        self.names = dict((v, k) for k, v in self.fields.iteritems())
+
+    def decode(self, data):
+        """Return the record fields of a HGETALL result.
+
+        Timestamps are returned as microseconds since the epoch. Records
+        written before timestamps were stored as integers keep their
+        ISO 8601 strings.
+        """
+        res = dict()
+        for k, v in data.iteritems():
+            k = self.names[k]
+            if k in TIMESTAMP_FIELDS and v.isdigit():
+                v = int(v)
+            elif k in INTEGER_FIELDS:
+                v = int(v)
+            elif k in JSON_FIELDS:
+                v = json.loads(v)
+            res[k] = v
+
+        return res
+
+    def encode(self, values):
+        """Return the hash fields for values.
+
+        Timestamps are given as epoch seconds.
+        """
+        res = dict()
+        for k, v in values.iteritems():
+            if k in TIMESTAMP_FIELDS:
+                v = self.encode_timestamp(v)
+            elif k in JSON_FIELDS:
+                v = json.dumps(v, sort_keys=True)
+            res[self.fields[k]] = v
+
+        return res
+
+    def encode_timestamp(self, value):
+        return int(round(value * 1000000))
+
+    def exists(self, data):
+        """Return True if the HGETALL result holds a record."""
+        return self.fields['uuid'] in data
+
+    def load(self, values):
+        """Return values as a HGETALL of the encoded record would."""
+        data = dict((k, _encode(v)) for k, v in self.encode(values).items())
+
+        return self.decode(data)
+
+
+class CompactCodec(HashCodec):
+    """Store records with short field names.
+
+    Unset fields are not stored at all, which keeps records small enough
+    for Redis to store them as compact ziplist encoded hashes.
+    """
+
+    def __init__(self, fields):
+        self.fields = dict(fields)
+        self.names = dict((v, k) for k, v in self.fields.iteritems())
+        self.defaults = dict(
+            (k, 'None') for k in self.fields
+            if k not in TIMESTAMP_FIELDS + INTEGER_FIELDS + JSON_FIELDS)
+
+    def decode(self, data):
+        res = dict(self.defaults)
+        res.update(super(CompactCodec, self).decode(data))
+
+        return res
+
+    def encode(self, values):
+        values = dict((k, v) for k, v in values.iteritems() if v is not None)
+
+        return super(CompactCodec, self).encode(values)
+
+
+FORMATS = {
+    'compact': CompactCodec,
+    'hash': HashCodec,
+}
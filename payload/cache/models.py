@@ -13,32 +13,126 @@
 # limitations under the License.
 
 
-class QueueCaller(object):
+import time
+
+# Same output as timeutils.isotime(at, subsecond=True) for a UTC datetime.
+ISO8601_FORMAT = '%04d-%02d-%02dT%02d:%02d:%02d.%06dZ'
+
+
+def iso8601_from_microseconds(value):
+    """Return an ISO 8601 string for microseconds since the epoch."""
+    seconds, microseconds = divmod(value, 1000000)
+
+    return ISO8601_FORMAT % (time.gmtime(seconds)[:6] + (microseconds,))
+
+
+class Timestamp(object):
+    """A timestamp attribute rendered as ISO 8601 on first access.
+
+    The cache layer hands out microseconds since the epoch. Formatting is
+    deferred until something reads the attribute, and the rendered string
+    replaces the integer so it only happens once per object.
+    """
+
+    def __init__(self, name):
+        self.key = '_%s' % name
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+
+        value = getattr(obj, self.key)
+        if isinstance(value, (int, long)):
+            value = iso8601_from_microseconds(value)
+            setattr(obj, self.key, value)
+
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.key, value)
+
+
+class Base(object):
+
+    fields = ()
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.fields)
+
+
+class Page(list):
+    """A page of queue callers or members.
+
+    Carries the version of the listing it was read at, and the ETag made of
+    it, see payload.cache.api.Connection.get_queue_callers_etag().
+    """
+
+    def __init__(self, items, version, etag=None):
+        super(Page, self).__init__(items)
+        self.etag = etag
+        self.version = version
+
+
+class AgentPresence(Base):
+
+    fields = ('queue_ids', 'status', 'status_at', 'uuid')
+
+    status_at = Timestamp('status_at')
+
+    def __init__(self, uuid, queue_ids, status, status_at):
+        self.queue_ids = queue_ids
+        self.status = status
+        self.status_at = status_at
+        self.uuid = uuid
+
+
+class QueueCaller(Base):
+
+    fields = (
+        'created_at', 'member_uuid', 'name', 'number', 'position',
+        'priority', 'queue_id', 'skills', 'status', 'status_at', 'uuid',
+    )
+
+    created_at = Timestamp('created_at')
+    status_at = Timestamp('status_at')
 
     def __init__(
             self, uuid, created_at, member_uuid, name, number, position,
-            queue_id, status, status_at):
+            queue_id, status, status_at, skills=None, priority=0):
         self.created_at = created_at
         self.member_uuid = member_uuid
         self.name = name
         self.number = number
         self.position = position
+        self.priority = priority
         self.queue_id = queue_id
+        self.skills = skills
         self.status = status
         self.status_at = status_at
         self.uuid = uuid
 
 
-class QueueMember(object):
+class QueueMember(Base):
+
+    fields = (
+        'agent_uuid', 'created_at', 'number', 'paused', 'paused_at',
+        'queue_id', 'skills', 'status', 'status_at', 'uuid',
+    )
+
+    created_at = Timestamp('created_at')
+    paused_at = Timestamp('paused_at')
+    status_at = Timestamp('status_at')
 
     def __init__(
             self, uuid, created_at, number, paused, paused_at, queue_id,
-            status, status_at):
+            status, status_at, skills=None, agent_uuid=None):
+        self.agent_uuid = agent_uuid
         self.created_at = created_at
         self.number = number
         self.paused = paused
         self.paused_at = paused_at
         self.queue_id = queue_id
+        self.skills = skills
         self.status = status
         self.status_at = status_at
         self.uuid = uuid
@@ -0,0 +1,156 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Selection of Redis replicas fresh enough to serve cache reads.
+"""
+
+import threading
+import time
+
+import redis
+
+from payload.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class ReplicaSet(object):
+    """Hand out sessions of replicas within the staleness bound.
+
+    Replicas are checked by a background thread, so reads never wait on a
+    health check, and are read from once the first check finds them fresh.
+    """
+
+    # Seconds a replication health check is trusted for.
+    check_interval = 1
+
+    def __init__(self, nodes, max_lag, pool_class, timeout=None, **kwargs):
+        """Create a replica set, replicas are checked once first used.
+
+        :param nodes: A list of 'host:port' replicas.
+        :param max_lag: Seconds since a replica last heard from its master
+                        after which it is no longer read from.
+        :param pool_class: The connection pool class to use per replica.
+        :param timeout: Seconds to wait for a replica to connect, or to
+                        answer a health check.
+        :param kwargs: Passed to pool_class for every replica.
+        """
+        self.max_lag = max_lag
+        self.checks = dict()
+        self.sessions = dict()
+        checks = dict(kwargs)
+        if timeout is not None:
+            kwargs['socket_connect_timeout'] = timeout
+            checks['socket_connect_timeout'] = timeout
+            checks['socket_timeout'] = timeout
+        for node in nodes:
+            host, port = node.rsplit(':', 1)
+            pool = pool_class(host=host, port=int(port), **kwargs)
+            self.sessions[node] = redis.StrictRedis(connection_pool=pool)
+            # NOTE(pabelanger): Health checks get their own connections, so
+            # a replica slow to answer them is given up on sooner than
+            # reads are.
+            pool = pool_class(host=host, port=int(port), **checks)
+            self.checks[node] = redis.StrictRedis(connection_pool=pool)
+        self.available = []
+        self.checked_at = None
+        self.thread = None
+        self._next = 0
+        self._stopped = None
+
+    def check(self):
+        """Reload the list of replicas fit to serve reads."""
+        available = []
+        for node, session in sorted(self.checks.iteritems()):
+            try:
+                info = session.info('replication')
+            except (redis.ConnectionError, redis.TimeoutError):
+                LOG.warn('Unable to reach Redis replica %s' % node)
+                continue
+
+            if self.is_fresh(info):
+                available.append(self.sessions[node])
+            else:
+                LOG.debug('Not reading from stale Redis replica %s' % node)
+
+        self.available = available
+        self.checked_at = time.time()
+
+    def disconnect(self):
+        if self._stopped is not None:
+            self._stopped.set()
+        self.thread = None
+        for session in self.checks.values() + self.sessions.values():
+            session.connection_pool.disconnect()
+        self.available = []
+        self.checked_at = None
+
+    def get_session(self):
+        """Return the session of a fresh replica, or None if there is none.
+
+        Reads are spread over the fresh replicas in turn. None is also
+        returned until the first check, or when the checks fell behind.
+        """
+        if self.thread is None:
+            self.start()
+
+        if (self.checked_at is None or
+                time.time() - self.checked_at > self.check_interval * 3):
+            return None
+
+        available = self.available
+        if not available:
+            return None
+
+        self._next = (self._next + 1) % len(available)
+
+        return available[self._next]
+
+    def get_stats(self):
+        res = dict()
+        for node, session in self.sessions.iteritems():
+            res[node] = session.connection_pool.get_stats()
+
+        return res
+
+    def is_fresh(self, info):
+        """Return True if INFO replication shows an up to date replica."""
+        if info.get('role') != 'slave':
+            return False
+        if info.get('master_link_status') != 'up':
+            return False
+        if info.get('master_sync_in_progress'):
+            return False
+
+        lag = info.get('master_last_io_seconds_ago', -1)
+
+        return 0 <= lag <= self.max_lag
+
+    def start(self):
+        """Check the replicas every check_interval in the background."""
+        self._stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=[self._stopped])
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, stopped):
+        while not stopped.is_set():
+            try:
+                self.check()
+            except Exception:
+                LOG.exception('Unable to check Redis replicas')
+            stopped.wait(self.check_interval)
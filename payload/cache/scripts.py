@@ -0,0 +1,1058 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Lua scripts executed server side by payload.cache.api.
+
+Scripts are registered with redis.StrictRedis.register_script(), which
+issues EVALSHA and falls back to SCRIPT LOAD on NOSCRIPT.
+
+Scripts get every key known before they run in KEYS. Keys only found as
+they run, such as the hash of a caller picked from a sorted set or the
+status sorted set named in a hash, are named after one of KEYS. In cluster
+mode they share its {queue id} hash tag, and so its slot, see
+payload.cache.api. Keys of agents and of other queues are only reached
+through the namespace formats below, which are left out in cluster mode.
+
+Members which are waiting and not paused are kept in the available sorted
+sets below, so member selection strategies never have to scan members.
+Every script changing the status or paused state of a member keeps them up
+to date through the functions of _FUNCTIONS. With P the members
+namespace:
+
+P:available            - scored by the time the member started waiting.
+P:available:created    - scored by the time the member joined the queue.
+P:available:calls      - scored by the number of calls of the member.
+P:available:weight:<n> - members of weight n, scored like P:available.
+P:calls                - number of calls of every member.
+P:weights              - weight of every member, 1 if unset.
+P:last                 - join time of the member last rung by round-robin.
+P:version              - bumped by every change to the members.
+P:epoch                - random token set along with the first read of
+                         P:version, see payload.cache.api.
+
+Callers have C:version and C:epoch of their own, with C the callers
+namespace, so listings can tell whether anything changed since they were
+last read. A version only counts within its epoch, which is lost along
+with the version if the keys are flushed or a failover drops them.
+Every bump is published on the channel named after the version key, for
+payload.cache.watch to wake whoever waits for a change.
+
+Members are also kept in P:skill:<name>, scored by their level of the
+skill, whatever their status. Callers needing skills are only matched
+with available members found in all of them at the required level.
+
+Members of an agent share the status of the agent across queues. With A
+the agent namespace, A is a hash of the agent status and A:members maps
+the id of every queue the agent is a member of to the member uuid. A:offer
+names the member hash of the agent being rung, claimed by the match script
+or, in cluster mode, payload.cache.api before the agent is offered, and
+dropped as the agent leaves its ringing status. Member status changes go
+through update_member_status(), which changes every member of the agent
+at once. It takes a table of the names of the member
+fields and, unless in cluster mode where the agent and its queues live on
+different nodes, the namespace formats, passed to the scripts as JSON:
+
+status, status_at, paused, agent_uuid - names of the member fields
+waiting, ringing                      - member waiting and ringing status
+agents                                - format of A, for the agent uuid
+members                               - format of P, for the queue id
+channel                               - payload.cache.api.EVENTS_CHANNEL
+dirty                                 - payload.cache.api.DIRTY_KEY
+timers                                - see below
+expire                                - see below
+
+Callers get a table of their own, without the agent fields:
+
+status, status_at, priority, queue_id - names of the caller fields
+waiting                               - caller waiting status
+band                                  - CALLER_PRIORITY_BAND
+priorities                            - MAX_CALLER_PRIORITY
+channel, dirty                        - as for members
+timers, expire                        - see below
+
+Every queue event published on the channel also adds the queue to the
+dirty set, left out without batch matching and in cluster mode, for the
+script of match_queues() to pick up.
+
+Callers and members with a timeout for their status are kept in
+C:timers and P:timers, scored by the epoch seconds they time out at. The
+timers table maps a status to the seconds it times out after and, if the
+timeout runs from the time in a field rather than from the status change,
+the name of that field. The expire table maps a status to the one a
+caller or member moves to when it times out, or to an empty string for
+callers deleted as they time out, see EXPIRE_TIMERS.
+"""
+
+_FUNCTIONS = """
+local function is_paused(value)
+    return value and value ~= '0' and value ~= 'False' and value ~= 'None'
+end
+
+local function decode_skills(value)
+    if not value or value == 'null' then
+        return {}
+    end
+
+    return cjson.decode(value)
+end
+
+-- Return the score of a caller in a status sorted set, see
+-- payload.cache.api.CALLER_PRIORITY_BAND. Scores are formatted here as
+-- redis.call() would otherwise round them to 14 digits.
+local function prioritize(key, field, band, timestamp)
+    local priority = tonumber(redis.call('HGET', key, field)) or 0
+
+    return string.format('%.17g', timestamp - priority * band)
+end
+
+local function set_timer(prefix, uuid, status, at, timers)
+    local key = prefix .. ':timers'
+    local timer = timers[status]
+    if not timer then
+        redis.call('ZREM', key, uuid)
+        return
+    end
+
+    local start = tonumber(at)
+    if timer[2] then
+        start = tonumber(
+            redis.call('HGET', prefix .. ':' .. uuid, timer[2])) or start
+    end
+
+    local deadline = start / 1000000 + timer[1]
+    redis.call('ZADD', key, string.format('%.17g', deadline), uuid)
+end
+
+-- Bump the version of the callers or members of a queue.
+local function bump(prefix)
+    local key = prefix .. ':version'
+    redis.call('INCR', key)
+    redis.call('PUBLISH', key, '')
+end
+
+local function set_caller_status(prefix, uuid, status, score, at, fields)
+    local key = prefix .. ':' .. uuid
+    local old = redis.call('HGET', key, fields.status)
+
+    redis.call('ZREM', prefix .. ':status:' .. old, uuid)
+    redis.call('ZADD', prefix .. ':status:' .. status, score, uuid)
+    redis.call('HMSET', key, fields.status, status, fields.status_at, at)
+    set_timer(prefix, uuid, status, at, fields.timers)
+    bump(prefix)
+end
+
+-- Tell payload-distributor a queue gained a waiting caller or member.
+local function publish(fields, queue_id)
+    redis.call('PUBLISH', fields.channel, queue_id)
+    if fields.dirty then
+        redis.call('SADD', fields.dirty, queue_id)
+    end
+end
+
+local function get_weight(prefix, uuid)
+    return redis.call('ZSCORE', prefix .. ':weights', uuid) or '1'
+end
+
+local function set_available(prefix, uuid, score)
+    local available = prefix .. ':available'
+    local calls = redis.call('ZSCORE', prefix .. ':calls', uuid) or 0
+    local weight = get_weight(prefix, uuid)
+
+    redis.call('ZADD', available, score, uuid)
+    redis.call(
+        'ZADD', available .. ':created', redis.call('ZSCORE', prefix, uuid),
+        uuid)
+    redis.call('ZADD', available .. ':calls', calls, uuid)
+    redis.call('ZADD', available .. ':weight:' .. weight, score, uuid)
+end
+
+local function unset_available(prefix, uuid)
+    local available = prefix .. ':available'
+    local weight = get_weight(prefix, uuid)
+
+    redis.call('ZREM', available, uuid)
+    redis.call('ZREM', available .. ':created', uuid)
+    redis.call('ZREM', available .. ':calls', uuid)
+    redis.call('ZREM', available .. ':weight:' .. weight, uuid)
+end
+
+local function set_member_status(prefix, uuid, status, score, at, fields)
+    local key = prefix .. ':' .. uuid
+    local old = redis.call('HGET', key, fields.status)
+    if not old then
+        return
+    end
+
+    redis.call('ZREM', prefix .. ':status:' .. old, uuid)
+    redis.call('ZADD', prefix .. ':status:' .. status, score, uuid)
+    redis.call('HMSET', key, fields.status, status, fields.status_at, at)
+    set_timer(prefix, uuid, status, at, fields.timers)
+    bump(prefix)
+
+    local paused = redis.call('HGET', key, fields.paused)
+    if status == fields.waiting and not is_paused(paused) then
+        set_available(prefix, uuid, score)
+    else
+        unset_available(prefix, uuid)
+    end
+end
+
+local function set_agent_status(agent, status, score, at, fields)
+    local key = string.format(fields.agents, agent)
+    redis.call('HMSET', key, 'status', status, 'status_at', at)
+    if status ~= fields.ringing then
+        redis.call('DEL', key .. ':offer')
+    end
+
+    local members = redis.call('HGETALL', key .. ':members')
+    for i = 1, #members, 2 do
+        local prefix = string.format(fields.members, members[i])
+        set_member_status(prefix, members[i + 1], status, score, at, fields)
+        if status == fields.waiting then
+            publish(fields, members[i])
+        end
+    end
+end
+
+local function update_member_status(prefix, uuid, status, score, at, fields)
+    local agent
+    if fields.agents then
+        agent = redis.call('HGET', prefix .. ':' .. uuid, fields.agent_uuid)
+    end
+
+    if agent and agent ~= 'None' then
+        set_agent_status(agent, status, score, at, fields)
+    else
+        set_member_status(prefix, uuid, status, score, at, fields)
+    end
+end
+"""
+
+# Move a caller or member between status sorted sets and stamp the new
+# status on its hash.
+#
+# KEYS[1] - the caller or member hash.
+# KEYS[2] - the callers or members namespace, also used as the prefix of
+#           the status sorted sets.
+# ARGV[1] - uuid
+# ARGV[2] - new status
+# ARGV[3] - score for the new status sorted set
+# ARGV[4] - status_at
+# ARGV[5] - name of the status field
+# ARGV[6] - name of the status_at field
+# ARGV[7] - member fields as JSON, see above, or an empty string for
+#           callers
+# ARGV[8] - caller fields as JSON, see above, or an empty string for
+#           members
+#
+# Returns nil if the hash does not exist, otherwise the rank of the uuid
+# in KEYS[2] followed by the contents of the hash.
+UPDATE_STATUS = _FUNCTIONS + """
+local old = redis.call('HGET', KEYS[1], ARGV[5])
+if not old then
+    return nil
+end
+
+if ARGV[7] ~= '' then
+    update_member_status(
+        KEYS[2], ARGV[1], ARGV[2], ARGV[3], ARGV[4], cjson.decode(ARGV[7]))
+else
+    local fields = cjson.decode(ARGV[8])
+    local score = prioritize(KEYS[1], fields.priority, fields.band, ARGV[3])
+    set_caller_status(KEYS[2], ARGV[1], ARGV[2], score, ARGV[4], fields)
+end
+
+local rank = redis.call('ZRANK', KEYS[2], ARGV[1])
+
+return {rank, redis.call('HGETALL', KEYS[1])}
+"""
+
+# Give an agent, and every queue member of the agent, a new status.
+#
+# KEYS[1] - the agent hash.
+# KEYS[2] - the agent members hash.
+# KEYS[3] - the agent offer key.
+# ARGV[1] - agent uuid
+# ARGV[2] - new status
+# ARGV[3] - score for the new member status sorted sets
+# ARGV[4] - status_at
+# ARGV[5] - member fields as JSON, see above
+#
+# Returns the ids of the queues the agent is a member of.
+AGENT_STATUS = _FUNCTIONS + """
+set_agent_status(ARGV[1], ARGV[2], ARGV[3], ARGV[4], cjson.decode(ARGV[5]))
+
+return redis.call('HKEYS', KEYS[2])
+"""
+
+# Take a queue member out of its agent, dropping the agent once it has no
+# members left.
+#
+# KEYS[1] - the agent hash.
+# KEYS[2] - the agent members hash.
+# KEYS[3] - the agent offer key.
+# ARGV[1] - queue id
+# ARGV[2] - member hash
+LEAVE_AGENT = """
+redis.call('HDEL', KEYS[2], ARGV[1])
+if redis.call('GET', KEYS[3]) == ARGV[2] then
+    redis.call('DEL', KEYS[3])
+end
+if redis.call('HLEN', KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[1], KEYS[3])
+end
+"""
+
+# Move the callers and members of a queue whose timers are due to the
+# status their status expires to, see above. Callers going back to waiting
+# keep their place in the queue, members start waiting anew. Callers with
+# nothing to move to are deleted.
+#
+# KEYS[1] - the callers namespace.
+# KEYS[2] - the members namespace.
+# ARGV[1] - queue id
+# ARGV[2] - epoch seconds, timers due by then expire
+# ARGV[3] - status_at
+# ARGV[4] - maximum number of callers, and of members, to expire
+# ARGV[5] - caller fields as JSON, see above
+# ARGV[6] - member fields as JSON, see above
+#
+# Returns the uuids of the expired callers, those of the expired members,
+# and the epoch seconds the next timer of the queue is due at, or nil if
+# there is none.
+EXPIRE_TIMERS = _FUNCTIONS + """
+local callers = cjson.decode(ARGV[5])
+local members = cjson.decode(ARGV[6])
+local waiting = false
+
+local function expire(prefix, fields, change)
+    local res = {}
+    local key = prefix .. ':timers'
+    local due = redis.call(
+        'ZRANGEBYSCORE', key, '-inf', ARGV[2], 'LIMIT', 0, ARGV[4])
+    for _, uuid in ipairs(due) do
+        redis.call('ZREM', key, uuid)
+        local status = redis.call('HGET', prefix .. ':' .. uuid, fields.status)
+        local new = status and fields.expire[status]
+        if new then
+            change(uuid, new)
+            waiting = waiting or new == fields.waiting
+            table.insert(res, uuid)
+        end
+    end
+
+    return res
+end
+
+local function next_timer(prefix, next)
+    local timer = redis.call('ZRANGE', prefix .. ':timers', 0, 0, 'WITHSCORES')
+    if timer[2] and (not next or tonumber(timer[2]) < tonumber(next)) then
+        return timer[2]
+    end
+
+    return next
+end
+
+local expired_callers = expire(KEYS[1], callers, function(uuid, status)
+    if status == '' then
+        local key = KEYS[1] .. ':' .. uuid
+        local old = redis.call('HGET', key, callers.status)
+        redis.call('ZREM', KEYS[1], uuid)
+        redis.call('ZREM', KEYS[1] .. ':status:' .. old, uuid)
+        redis.call('HDEL', KEYS[1] .. ':overflow', uuid)
+        redis.call('DEL', key)
+        bump(KEYS[1])
+        return
+    end
+
+    local score
+    if status == callers.waiting then
+        score = redis.call('ZSCORE', KEYS[1], uuid)
+    else
+        score = prioritize(
+            KEYS[1] .. ':' .. uuid, callers.priority, callers.band, ARGV[2])
+    end
+    set_caller_status(KEYS[1], uuid, status, score, ARGV[3], callers)
+end)
+
+local expired_members = expire(KEYS[2], members, function(uuid, status)
+    update_member_status(KEYS[2], uuid, status, ARGV[2], ARGV[3], members)
+end)
+
+if waiting then
+    publish(members, ARGV[1])
+end
+
+return {
+    expired_callers, expired_members,
+    next_timer(KEYS[2], next_timer(KEYS[1], false)),
+}
+"""
+
+# Move the waiting callers of a queue over its overflow thresholds to
+# another queue. Callers join the other queue as if they arrived at ARGV[4],
+# in the order they left in, so that they wait there anew rather than
+# overflow again straight away. They keep their timers.
+#
+# KEYS[1] - the callers namespace.
+# KEYS[2] - the callers namespace of the other queue, left out in cluster
+#           mode where it lives on another node. Callers are then only
+#           taken out of line, and their hash kept along with their scores
+#           in P:overflow until FINISH_OVERFLOW once they were written to
+#           the other queue.
+# ARGV[1] - id of the other queue
+# ARGV[2] - most callers left waiting, or an empty string
+# ARGV[3] - seconds after which waiting callers move, or an empty string
+# ARGV[4] - epoch seconds
+# ARGV[5] - maximum number of callers to move
+# ARGV[6] - caller fields as JSON, see above
+# ARGV[7] - encoded ARGV[4]
+#
+# Callers who waited the longest move first, then the callers last in line
+# until at most ARGV[2] are left. Returns the epoch seconds the next
+# caller will have waited ARGV[3] seconds at, now if callers are left to
+# move, or nil. It is followed by the uuid, the scores in KEYS[1], the
+# waiting sorted set and the timers, and the contents of the hash of every
+# caller moved.
+OVERFLOW_CALLERS = _FUNCTIONS + """
+local fields = cjson.decode(ARGV[6])
+local waiting = ':status:' .. fields.waiting
+local limit = tonumber(ARGV[5])
+local res = {false}
+
+local function move(uuid)
+    local key = KEYS[1] .. ':' .. uuid
+    -- A microsecond apart, to keep the callers moved at once in order.
+    local arrived = prioritize(
+        key, fields.priority, fields.band, tonumber(ARGV[4]) + #res * 1e-6)
+    local scores = {
+        arrived, arrived, redis.call('ZSCORE', KEYS[1] .. ':timers', uuid),
+    }
+    redis.call('HSET', key, fields.status_at, ARGV[7])
+    for i, suffix in ipairs({'', waiting, ':timers'}) do
+        redis.call('ZREM', KEYS[1] .. suffix, uuid)
+        if KEYS[2] and scores[i] then
+            redis.call('ZADD', KEYS[2] .. suffix, scores[i], uuid)
+        end
+    end
+
+    table.insert(res, {
+        uuid, scores[1], scores[2], scores[3], redis.call('HGETALL', key),
+    })
+    if KEYS[2] then
+        local target = KEYS[2] .. ':' .. uuid
+        redis.call('RENAME', key, target)
+        redis.call('HSET', target, fields.queue_id, ARGV[1])
+    else
+        redis.call(
+            'HSET', KEYS[1] .. ':overflow', uuid,
+            cjson.encode({ARGV[1], scores[1], scores[2], scores[3]}))
+    end
+end
+
+-- See payload.cache.api.CALLER_PRIORITY_BAND, each priority is waited
+-- for in a band of its own.
+local function bands(callback)
+    for priority = fields.priorities, 0, -1 do
+        callback(-priority * fields.band)
+    end
+end
+
+local function remaining()
+    return limit - #res + 1
+end
+
+local now = tonumber(ARGV[4])
+if ARGV[3] ~= '' then
+    local wait = tonumber(ARGV[3])
+    bands(function(offset)
+        if remaining() == 0 then
+            return
+        end
+
+        local highest = string.format('%.17g', offset + now - wait)
+        local due = redis.call(
+            'ZRANGEBYSCORE', KEYS[1] .. waiting, offset, highest,
+            'LIMIT', 0, remaining())
+        for _, uuid in ipairs(due) do
+            move(uuid)
+        end
+    end)
+end
+
+if ARGV[2] ~= '' then
+    local excess = redis.call('ZCARD', KEYS[1] .. waiting) - tonumber(ARGV[2])
+    excess = math.min(excess, remaining())
+    if excess > 0 then
+        local last = redis.call('ZRANGE', KEYS[1] .. waiting, -excess, -1)
+        for _, uuid in ipairs(last) do
+            move(uuid)
+        end
+    end
+end
+
+if #res > 1 then
+    bump(KEYS[1])
+    if KEYS[2] then
+        bump(KEYS[2])
+        publish(fields, ARGV[1])
+    end
+end
+
+if remaining() == 0 then
+    res[1] = ARGV[4]
+elseif ARGV[3] ~= '' then
+    bands(function(offset)
+        local first = redis.call(
+            'ZRANGEBYSCORE', KEYS[1] .. waiting, offset,
+            '(' .. (offset + fields.band), 'LIMIT', 0, 1, 'WITHSCORES')
+        if first[2] then
+            local due = first[2] - offset + tonumber(ARGV[3])
+            if not res[1] or due < tonumber(res[1]) then
+                res[1] = string.format('%.17g', due)
+            end
+        end
+    end)
+end
+
+return res
+"""
+
+# Drop the callers of a queue moved to another queue by OVERFLOW_CALLERS in
+# cluster mode, once written to the other queue.
+#
+# KEYS[1] - the overflow hash of the callers namespace.
+# KEYS[2...] - the hash of every caller.
+# ARGV[1...] - uuids, in the order of their hashes
+#
+# Returns the uuids of the callers deleted from the queue in the meantime,
+# which are to be deleted from the other queue too.
+FINISH_OVERFLOW = """
+local res = {}
+for i, uuid in ipairs(ARGV) do
+    if redis.call('HDEL', KEYS[1], uuid) == 1 then
+        redis.call('DEL', KEYS[i + 1])
+    else
+        table.insert(res, uuid)
+    end
+end
+
+return res
+"""
+
+# Lease a key to an owner, or renew the lease of its owner.
+#
+# KEYS[1] - the lease.
+# ARGV[1] - owner
+# ARGV[2] - milliseconds the lease lasts
+#
+# Returns 1 if the owner holds the lease, 0 if another does.
+LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+
+return 0
+"""
+
+# Give up a lease, unless it already passed to another owner.
+#
+# KEYS[1] - the lease.
+# ARGV[1] - owner
+RELEASE_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+
+return 0
+"""
+
+# Return a page of the members of a sorted set within score ranges, in
+# score order, along with the version and epoch of the listing.
+#
+# KEYS[1] - the sorted set.
+# KEYS[2] - the version of the callers or members, see above.
+# KEYS[3] - the epoch of the version.
+# ARGV[1] - member the previous page ended with, or an empty string
+# ARGV[2] - maximum number of members to return, -1 for all of them
+# ARGV[3...] - lowest and highest score pairs, in ascending order and not
+#              overlapping, in ZRANGEBYSCORE syntax
+#
+# Every range is turned into a range of ranks, so the page resumes right
+# after the marker even if it shares its score with others. Returns nil if
+# the marker is not in the sorted set, otherwise the version, the epoch or
+# nil if there is none yet, and the page.
+LIST_PAGE = """
+local version = tonumber(redis.call('GET', KEYS[2])) or 0
+local epoch = redis.call('GET', KEYS[3])
+local after = -1
+if ARGV[1] ~= '' then
+    after = redis.call('ZRANK', KEYS[1], ARGV[1])
+    if not after then
+        return false
+    end
+end
+
+local limit = tonumber(ARGV[2])
+local res = {}
+for i = 3, #ARGV, 2 do
+    local min = ARGV[i]
+    local below = 0
+    if string.sub(min, 1, 1) == '(' then
+        below = redis.call('ZCOUNT', KEYS[1], '-inf', string.sub(min, 2))
+    elseif min ~= '-inf' then
+        below = redis.call('ZCOUNT', KEYS[1], '-inf', '(' .. min)
+    end
+
+    local start = math.max(below, after + 1)
+    local stop = below + redis.call('ZCOUNT', KEYS[1], min, ARGV[i + 1]) - 1
+    if limit >= 0 then
+        stop = math.min(stop, start + limit - #res - 1)
+    end
+
+    if start <= stop then
+        for _, member in ipairs(redis.call('ZRANGE', KEYS[1], start, stop)) do
+            table.insert(res, member)
+        end
+    end
+    if #res == limit then
+        break
+    end
+end
+
+return {version, epoch, res}
+"""
+
+# Update fields of a member, and its weight, keeping it available only while
+# it is waiting and not paused.
+#
+# KEYS[1] - the member hash.
+# KEYS[2] - the members namespace.
+# ARGV[1] - uuid
+# ARGV[2] - member waiting status
+# ARGV[3] - name of the status field
+# ARGV[4] - name of the paused field
+# ARGV[5] - new weight, or an empty string to keep it
+# ARGV[6] - name of the skills field
+# ARGV[7...] - field and value pairs to set on the hash
+#
+# Returns nil if the hash does not exist.
+UPDATE_MEMBER = _FUNCTIONS + """
+local status = redis.call('HGET', KEYS[1], ARGV[3])
+if not status then
+    return nil
+end
+
+unset_available(KEYS[2], ARGV[1])
+if ARGV[5] ~= '' then
+    redis.call('ZADD', KEYS[2] .. ':weights', ARGV[5], ARGV[1])
+end
+
+for i = 7, #ARGV, 2 do
+    if ARGV[i] == ARGV[6] then
+        local old = redis.call('HGET', KEYS[1], ARGV[6])
+        for skill in pairs(decode_skills(old)) do
+            redis.call('ZREM', KEYS[2] .. ':skill:' .. skill, ARGV[1])
+        end
+        for skill, level in pairs(decode_skills(ARGV[i + 1])) do
+            redis.call('ZADD', KEYS[2] .. ':skill:' .. skill, level, ARGV[1])
+        end
+    end
+end
+
+if #ARGV > 6 then
+    redis.call('HMSET', KEYS[1], unpack(ARGV, 7))
+end
+
+if status == ARGV[2] and not is_paused(redis.call('HGET', KEYS[1], ARGV[4]))
+then
+    local waiting = KEYS[2] .. ':status:' .. ARGV[2]
+    set_available(KEYS[2], ARGV[1], redis.call('ZSCORE', waiting, ARGV[1]))
+end
+bump(KEYS[2])
+
+return 1
+"""
+
+# Index the waiting members of a queue which are not paused in the
+# available sorted sets, see above. Members which started waiting before
+# the available sorted sets were kept are otherwise only indexed once they
+# next enter the waiting status.
+#
+# KEYS[1] - the members namespace.
+# ARGV[1] - member waiting status
+# ARGV[2] - name of the paused field
+#
+# Returns the number of members indexed.
+INDEX_MEMBERS = _FUNCTIONS + """
+local waiting = redis.call(
+    'ZRANGE', KEYS[1] .. ':status:' .. ARGV[1], 0, -1, 'WITHSCORES')
+local count = 0
+for i = 1, #waiting, 2 do
+    local paused = redis.call('HGET', KEYS[1] .. ':' .. waiting[i], ARGV[2])
+    if not is_paused(paused) then
+        set_available(KEYS[1], waiting[i], waiting[i + 1])
+        count = count + 1
+    end
+end
+
+return count
+"""
+
+# Match the longest waiting caller of a queue with the available member
+# picked by a selection strategy, moving both to their ringing status.
+# Callers needing skills no available member has are passed over, for up
+# to MATCH_LOOKAHEAD callers.
+#
+# KEYS[1] - the callers namespace.
+# KEYS[2] - the members namespace.
+# ARGV[1] - caller waiting status
+# ARGV[2] - caller ringing status
+# ARGV[3] - member waiting status
+# ARGV[4] - member ringing status
+# ARGV[5] - score for the ringing sorted sets
+# ARGV[6] - status_at
+# ARGV[7] - name of the status field, the same for callers and members
+# ARGV[8] - name of the status_at field, the same for callers and members
+# ARGV[9] - name of the caller member_uuid field
+# ARGV[10] - name of the skills field, the same for callers and members
+# ARGV[11] - caller fields as JSON, see above
+# ARGV[12] - member fields as JSON, see above
+# ARGV[13...] - arguments of the selection strategy
+#
+# The strategy is Lua setting member to the uuid of a member, or leaving it
+# nil, given its arguments in args. It reads the available sorted set named
+# index(suffix), for example index(':calls') for P:available:calls, which
+# only holds the members with the skills of the caller. See match().
+#
+# Members of an agent are only picked if the agent can be claimed, see
+# above. Those of an agent claimed by another queue are taken out of the
+# available sorted sets, and another member picked.
+#
+# Returns nil if there is no match, otherwise the rank of the caller in
+# KEYS[1] followed by the contents of the caller and member hashes.
+MATCH_LOOKAHEAD = 10
+
+_MATCH = _FUNCTIONS + """
+local function claim(members_key, member, fields)
+    if not fields.agents then
+        return true
+    end
+
+    local member_key = members_key .. ':' .. member
+    local agent = redis.call('HGET', member_key, fields.agent_uuid)
+    if not agent or agent == 'None' then
+        return true
+    end
+
+    local key = string.format(fields.agents, agent) .. ':offer'
+    return redis.call('SET', key, member_key, 'NX') ~= false
+end
+
+local function attempt(callers_key, members_key, select, args)
+    local callers = redis.call(
+        'ZRANGE', callers_key .. ':status:' .. ARGV[1], 0, %d)
+    if #callers == 0 then
+        return nil
+    end
+
+    local available = members_key .. ':available'
+    if redis.call('ZCARD', available) == 0 then
+        return nil
+    end
+
+    local eligible = members_key .. ':eligible'
+    local skilled = false
+    local temporary = {}
+
+    local function index(suffix)
+        if not skilled then
+            return available .. suffix
+        end
+
+        local key = eligible .. suffix
+        if suffix ~= '' then
+            redis.call(
+                'ZINTERSTORE', key, 2, available .. suffix, eligible,
+                'WEIGHTS', 1, 0)
+            table.insert(temporary, key)
+        end
+
+        return key
+    end
+
+    local caller
+    local member
+    for _, candidate in ipairs(callers) do
+        local required = decode_skills(
+            redis.call('HGET', callers_key .. ':' .. candidate, ARGV[10]))
+
+        skilled = next(required) ~= nil
+        if skilled then
+            table.insert(temporary, eligible)
+            redis.call('ZINTERSTORE', eligible, 1, available)
+            for skill, level in pairs(required) do
+                redis.call(
+                    'ZINTERSTORE', eligible, 2, eligible,
+                    members_key .. ':skill:' .. skill, 'WEIGHTS', 0, 1)
+                redis.call('ZREMRANGEBYSCORE', eligible, '-inf', '(' .. level)
+            end
+            redis.call(
+                'ZINTERSTORE', eligible, 2, eligible, available,
+                'WEIGHTS', 0, 1)
+        end
+
+        member = select({callers_key, members_key}, args, index)
+        if member then
+            caller = candidate
+            break
+        end
+
+        -- Callers further down cannot do better than one needing no skills.
+        if not skilled then
+            break
+        end
+    end
+
+    if #temporary > 0 then
+        redis.call('DEL', unpack(temporary))
+    end
+
+    if not member then
+        return nil
+    end
+
+    local members = cjson.decode(ARGV[12])
+    if not claim(members_key, member, members) then
+        unset_available(members_key, member)
+        return false
+    end
+
+    local caller_key = callers_key .. ':' .. caller
+    local member_key = members_key .. ':' .. member
+
+    local fields = cjson.decode(ARGV[11])
+    local score = prioritize(caller_key, fields.priority, fields.band, ARGV[5])
+    set_caller_status(callers_key, caller, ARGV[2], score, ARGV[6], fields)
+    redis.call('HSET', caller_key, ARGV[9], member)
+
+    redis.call('ZINCRBY', members_key .. ':calls', 1, member)
+    update_member_status(
+        members_key, member, ARGV[4], ARGV[5], ARGV[6], members)
+
+    return {
+        redis.call('ZRANK', callers_key, caller),
+        redis.call('HGETALL', caller_key),
+        redis.call('HGETALL', member_key),
+    }
+end
+
+local function match(callers_key, members_key, select, args)
+    while true do
+        local res = attempt(callers_key, members_key, select, args)
+        if res ~= false then
+            return res
+        end
+    end
+end
+
+local selects = {}
+""" % (MATCH_LOOKAHEAD - 1)
+
+# The select Lua of a strategy, run with the keys of the queue in KEYS.
+_SELECT = """
+selects['%s'] = function(KEYS, args, index)
+    local member
+%s
+    return member
+end
+"""
+
+# Match the waiting callers of several queues with their available members
+# like the match script, until either run out in every queue or ARGV[13]
+# pairs are matched.
+#
+# KEYS[2n-1] - the callers namespace of the nth queue.
+# KEYS[2n] - the members namespace of the nth queue.
+# ARGV[1...12] - as for the match script.
+# ARGV[13] - maximum number of pairs to match
+# ARGV[14] - the id, strategy name and strategy arguments of every queue,
+#            as a JSON list of lists
+#
+# Queues with nothing left to match are taken out of the dirty queues set
+# named by the caller fields, if any. Returns the queue id, the rank of the
+# caller and the contents of the caller and member hashes of every pair
+# matched, followed by the ids of the queues left unfinished as ARGV[13]
+# pairs were matched.
+_MATCH_QUEUES = """
+local limit = tonumber(ARGV[13])
+local dirty = cjson.decode(ARGV[11]).dirty
+local matches = {}
+local pending = {}
+
+for i, queue in ipairs(cjson.decode(ARGV[14])) do
+    while true do
+        if #matches >= limit then
+            table.insert(pending, queue[1])
+            break
+        end
+
+        local res = match(
+            KEYS[2 * i - 1], KEYS[2 * i], selects[queue[2]], queue[3])
+        if not res then
+            if dirty then
+                redis.call('SREM', dirty, queue[1])
+            end
+            break
+        end
+
+        table.insert(res, 1, queue[1])
+        table.insert(matches, res)
+    end
+end
+
+return {matches, pending}
+"""
+
+# Undo a match in cluster mode, where the agent of the member is claimed
+# by payload.cache.api after the match script, and was claimed by another
+# queue first. The caller waits again in its place in line, and the member
+# takes on the status of the agent.
+#
+# KEYS[1] - the callers namespace.
+# KEYS[2] - the members namespace.
+# KEYS[3] - the caller hash.
+# KEYS[4] - the member hash.
+# ARGV[1] - queue id
+# ARGV[2] - caller uuid
+# ARGV[3] - member uuid
+# ARGV[4] - status of the agent
+# ARGV[5] - score for the member status sorted set
+# ARGV[6] - status_at
+# ARGV[7] - caller fields as JSON, see above
+# ARGV[8] - member fields as JSON, see above
+UNMATCH = _FUNCTIONS + """
+local callers = cjson.decode(ARGV[7])
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    set_caller_status(
+        KEYS[1], ARGV[2], callers.waiting,
+        redis.call('ZSCORE', KEYS[1], ARGV[2]), ARGV[6], callers)
+    publish(callers, ARGV[1])
+end
+
+if redis.call('EXISTS', KEYS[4]) == 1 then
+    redis.call('ZINCRBY', KEYS[2] .. ':calls', -1, ARGV[3])
+    update_member_status(
+        KEYS[2], ARGV[3], ARGV[4], ARGV[5], ARGV[6], cjson.decode(ARGV[8]))
+end
+"""
+
+
+# Member selection strategies, see payload.server.strategies.
+
+# Ring the member waiting the longest.
+LONGEST_IDLE = """
+member = redis.call('ZRANGE', index(''), 0, 0)[1]
+"""
+
+# Ring the member with the fewest calls, ties are broken by uuid.
+FEWEST_CALLS = """
+member = redis.call('ZRANGE', index(':calls'), 0, 0)[1]
+"""
+
+# Ring members in the order they joined the queue, starting after the last
+# member rung.
+ROUND_ROBIN = """
+local created = index(':created')
+local last = redis.call('GET', KEYS[2] .. ':last')
+local min = '-inf'
+if last then
+    min = '(' .. last
+end
+
+member = redis.call(
+    'ZRANGEBYSCORE', created, min, '+inf', 'LIMIT', 0, 1)[1]
+if not member then
+    member = redis.call('ZRANGE', created, 0, 0)[1]
+end
+if member then
+    local score = redis.call('ZSCORE', created, member)
+    redis.call('SET', KEYS[2] .. ':last', score)
+end
+"""
+
+# Ring a random member.
+#
+# args[1] - a random number in [0, 1)
+RANDOM = """
+local count = redis.call('ZCARD', index(''))
+if count > 0 then
+    local rank = math.floor(tonumber(args[1]) * count)
+    member = redis.call('ZRANGE', index(''), rank, rank)[1]
+end
+"""
+
+# Ring a random member, picking each with a probability proportional to its
+# weight.
+#
+# args[1] - a random number in [0, 1)
+# args[2] - the highest weight
+WEIGHTED = """
+local buckets = {}
+local counts = {}
+local total = 0
+for weight = 1, tonumber(args[2]) do
+    buckets[weight] = index(':weight:' .. weight)
+    counts[weight] = redis.call('ZCARD', buckets[weight])
+    total = total + weight * counts[weight]
+end
+
+local pick = tonumber(args[1]) * total
+for weight = 1, #counts do
+    local share = weight * counts[weight]
+    if pick < share then
+        local rank = math.floor(pick / weight)
+        member = redis.call('ZRANGE', buckets[weight], rank, rank)[1]
+        break
+    end
+    pick = pick - share
+end
+"""
+
+
+def match(select):
+    """Return the match script using the select Lua of a strategy."""
+    return _MATCH + _SELECT % ('', select) + """
+return match(KEYS[1], KEYS[2], selects[''], {unpack(ARGV, 13)})
+"""
+
+
+def match_queues(selects):
+    """Return the script matching several queues at once.
+
+    :param selects: A dict of strategy names mapped to their select Lua.
+    """
+    res = [_MATCH]
+    for name, select in sorted(selects.iteritems()):
+        res.append(_SELECT % (name, select))
+    res.append(_MATCH_QUEUES)
+
+    return ''.join(res)
@@ -0,0 +1,144 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Waiting for changes announced on Redis channels.
+
+Every change to the callers or members of a queue bumps their version and
+publishes a message on the channel named after the version key, see
+payload.cache.scripts. A watcher subscribes to the channels being waited
+on over a single connection, and wakes the threads waiting on a channel
+as its messages arrive. Under eventlet those are green threads, so a
+process holds thousands of waits on one Redis connection.
+"""
+
+import threading
+import time
+
+import redis
+
+from payload.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class _Channel(object):
+
+    def __init__(self):
+        # Set once Redis confirmed the subscription.
+        self.subscribed = threading.Event()
+        self.waiters = set()
+
+
+class Watcher(object):
+    """Wake threads waiting on Redis channels, sharing one subscription."""
+
+    # Seconds between checks for stop().
+    poll_interval = 1.0
+
+    def __init__(self, session):
+        self.channels = dict()
+        self.pubsub = session.pubsub()
+        self.stopped = False
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """Stop listening, leaving the threads still waiting to time out."""
+        self.stopped = True
+        if self.thread is not None:
+            # Wakes up _run() with the reply.
+            self.pubsub.unsubscribe()
+            self.thread.join()
+        self.pubsub.close()
+
+    def wait(self, channel, check, timeout):
+        """Wait until check() returns True, or for timeout seconds.
+
+        check() is called once subscribed to channel, and again after every
+        message on it, so a change made before the first call is not
+        missed.
+        """
+        deadline = time.time() + timeout
+        event = threading.Event()
+        state = self._subscribe(channel=channel, event=event)
+        try:
+            state.subscribed.wait(timeout)
+            while not check():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                event.wait(remaining)
+                event.clear()
+        finally:
+            self._unsubscribe(channel=channel, event=event)
+
+    def _dispatch(self, message):
+        state = self.channels.get(message['channel'])
+        if state is None:
+            return
+
+        if message['type'] == 'subscribe':
+            with self._lock:
+                state.subscribed.set()
+                # NOTE(pabelanger): Left by every waiter while subscribing,
+                # see _unsubscribe().
+                if not state.waiters:
+                    self._drop(channel=message['channel'])
+        elif message['type'] == 'message':
+            for event in list(state.waiters):
+                event.set()
+
+    def _run(self):
+        while not self.stopped:
+            try:
+                message = self.pubsub.get_message(timeout=self.poll_interval)
+            except (redis.ConnectionError, redis.TimeoutError) as e:
+                LOG.warn('Lost queue versions, reconnecting: %s' % e)
+                # NOTE(pabelanger): Anything may have changed meanwhile.
+                for state in self.channels.values():
+                    for event in list(state.waiters):
+                        event.set()
+                time.sleep(1)
+                continue
+
+            if message is not None:
+                self._dispatch(message)
+
+    def _subscribe(self, channel, event):
+        with self._lock:
+            state = self.channels.get(channel)
+            if state is None:
+                state = self.channels[channel] = _Channel()
+                self.pubsub.subscribe(channel)
+            state.waiters.add(event)
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+
+        return state
+
+    def _drop(self, channel):
+        del self.channels[channel]
+        self.pubsub.unsubscribe(channel)
+
+    def _unsubscribe(self, channel, event):
+        with self._lock:
+            state = self.channels[channel]
+            state.waiters.discard(event)
+            # NOTE(pabelanger): A channel is only dropped once subscribed,
+            # otherwise the reply to its SUBSCRIBE could be taken for that
+            # of the next subscription to the same channel.
+            if not state.waiters and state.subscribed.is_set():
+                self._drop(channel=channel)
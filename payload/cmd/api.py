@@ -19,15 +19,21 @@
 Payload Service API
 """
 
+import eventlet
+eventlet.monkey_patch()
+
 import sys
 
 from payload.api import app
 from payload import config
 from payload.openstack.common import log as logging
+from payload.openstack.common import service
 
 
 def main():
     config.prepare_args(sys.argv)
     logging.setup('payload')
     srv = app.build_server()
-    srv.serve_forever()
+    launcher = service.launch(
+        app.WSGIService(srv), workers=app.get_workers())
+    launcher.wait()
@@ -0,0 +1,36 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Payload Distributor
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import sys
+
+from payload import config
+from payload.openstack.common import log as logging
+from payload.openstack.common import service
+from payload.server import distributor
+
+
+def main():
+    config.prepare_args(sys.argv)
+    logging.setup('payload')
+    launcher = service.launch(distributor.Distributor())
+    launcher.wait()
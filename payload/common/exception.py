@@ -84,6 +84,37 @@ class PayloadException(Exception):
             return unicode(self)
 
 
+class Invalid(PayloadException):
+    code = 400
+    message = 'Unacceptable parameters'
+
+
+class AgentUuidInvalid(Invalid):
+    message = 'Agent uuid %(uuid)r is empty or holds a brace'
+
+
+class MarkerNotFound(Invalid):
+    message = 'Marker %(marker)s could not be found'
+
+
+class QueueCallerCreatedAtInvalid(Invalid):
+    message = 'Queue caller created_at %(created_at)s is not an ISO 8601 time'
+
+
+class QueueCallerPriorityInvalid(Invalid):
+    message = ('Queue caller priority %(priority)s is not between 0 and '
+               '%(max_priority)s')
+
+
+class QueueIdInvalid(Invalid):
+    message = 'Queue id %(queue_id)r is empty or holds a brace'
+
+
+class QueueMemberWeightInvalid(Invalid):
+    message = ('Queue member weight %(weight)s is not between 1 and '
+               '%(max_weight)s')
+
+
 class NotFound(PayloadException):
     code = 404
     message = 'Resource could not be found'
@@ -27,18 +27,33 @@ IMPL = db_api.DBAPI(backend_mapping=_BACKEND_MAPPING)
 LOG = logging.getLogger(__name__)
 
 
-def create_agent(user_id, project_id):
-    """Create a new agent."""
+def create_agent(user_id, project_id, skills=None):
+    """Create a new agent.
 
-    return IMPL.create_agent(user_id=user_id, project_id=project_id)
+    :param skills: A dict of skill names mapped to the agent's level.
+    """
 
+    return IMPL.create_agent(
+        user_id=user_id, project_id=project_id, skills=skills)
 
-def create_queue(name, user_id, project_id, description='', disabled=False):
-    """Create a new queue."""
+
+def create_queue(
+        name, user_id, project_id, description='', disabled=False,
+        strategy='longest-idle', overflow_queue_id=None,
+        overflow_max_callers=None, overflow_max_wait=None):
+    """Create a new queue.
+
+    :param overflow_queue_id: The queue waiting callers overflow to, once
+                              more than overflow_max_callers are waiting
+                              or they waited overflow_max_wait seconds.
+    """
 
     return IMPL.create_queue(
         name=name, user_id=user_id, project_id=project_id,
-        description=description, disabled=disabled)
+        description=description, disabled=disabled, strategy=strategy,
+        overflow_queue_id=overflow_queue_id,
+        overflow_max_callers=overflow_max_callers,
+        overflow_max_wait=overflow_max_wait)
 
 
 def create_queue_member(agent_uuid, queue_uuid):
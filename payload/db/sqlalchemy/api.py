@@ -48,10 +48,11 @@ def _model_query(model, *args, **kwargs):
     return query
 
 
-def create_agent(user_id, project_id):
+def create_agent(user_id, project_id, skills=None):
     """Create a new agent."""
     values = {
         'project_id': project_id,
+        'skills': skills,
         'user_id': user_id,
     }
 
@@ -61,13 +62,20 @@ def create_agent(user_id, project_id):
     return res
 
 
-def create_queue(name, user_id, project_id, description='', disabled=False):
+def create_queue(
+        name, user_id, project_id, description='', disabled=False,
+        strategy='longest-idle', overflow_queue_id=None,
+        overflow_max_callers=None, overflow_max_wait=None):
     """Create a new queue."""
     values = {
         'description': description,
         'disabled': disabled,
         'name': name,
+        'overflow_max_callers': overflow_max_callers,
+        'overflow_max_wait': overflow_max_wait,
+        'overflow_queue_id': overflow_queue_id,
         'project_id': project_id,
+        'strategy': strategy,
         'user_id': user_id,
     }
 
@@ -0,0 +1,43 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from sqlalchemy import Column
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    queues = Table('queues', meta, autoload=True)
+    strategy = Column('strategy', String(length=255))
+    strategy.create(queues)
+    queues.update().values(strategy='longest-idle').execute()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    queues = Table('queues', meta, autoload=True)
+    if migrate_engine.name == 'sqlite':
+        # NOTE(pabelanger): sqlalchemy-migrate drops SQLite columns by
+        # renaming the table aside, which newer SQLite versions follow with
+        # the foreign keys of queue_members unless told otherwise.
+        migrate_engine.execute('PRAGMA legacy_alter_table = ON')
+    queues.c.strategy.drop()
@@ -0,0 +1,46 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    queues = Table('queues', meta, autoload=True)
+    for column in [
+            Column('overflow_max_callers', Integer),
+            Column('overflow_max_wait', Integer),
+            Column('overflow_queue_id', String(length=255))]:
+        column.create(queues)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    queues = Table('queues', meta, autoload=True)
+    if migrate_engine.name == 'sqlite':
+        # NOTE(pabelanger): See 002_add_queue_strategy.
+        migrate_engine.execute('PRAGMA legacy_alter_table = ON')
+    queues.c.overflow_max_callers.drop()
+    queues.c.overflow_max_wait.drop()
+    queues.c.overflow_queue_id.drop()
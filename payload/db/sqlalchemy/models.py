@@ -58,6 +58,7 @@ class Agent(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     project_id = Column(String(255))
+    skills = Column(JSONEncodedDict)
     user_id = Column(String(255))
     uuid = Column(String(255), unique=True)
 
@@ -69,7 +70,11 @@ class Queue(Base):
     description = Column(JSONEncodedDict)
     disabled = Column(Boolean, default=False)
     name = Column(String(80))
+    overflow_max_callers = Column(Integer)
+    overflow_max_wait = Column(Integer)
+    overflow_queue_id = Column(String(255))
     project_id = Column(String(255))
+    strategy = Column(String(255), default='longest-idle')
     user_id = Column(String(255))
     uuid = Column(String(255), unique=True)
 
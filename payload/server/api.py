@@ -10,19 +10,37 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import time
+
 from payload.cache import api
 from payload.cache.api import QueueCallerStatus
 from payload.cache.api import QueueMemberStatus
+from payload.common import exception
+from payload.db import api as db_api
+from payload.openstack.common import log as logging
+from payload.server import strategies
+
+LOG = logging.getLogger(__name__)
 
 
 class API(object):
 
+    # Seconds the settings of a queue, such as its member selection
+    # strategy, are cached for.
+    queue_ttl = 10
+
+    # Most callers an overflow rule moves at once.
+    overflow_limit = 100
+
     def __init__(self):
         self.cache_api = api.get_instance()
+        self._queues = dict()
+        self._strategies = dict()
 
     def get_available_queue_caller(self, queue_id):
         callers = self.cache_api.list_queue_callers(
-            queue_id=queue_id, status=QueueCallerStatus.WAITING)
+            queue_id=queue_id, status=QueueCallerStatus.WAITING,
+            limit=1, master=True)
 
         if any(callers):
             return callers[0].uuid
@@ -31,9 +49,106 @@ class API(object):
 
     def get_available_queue_member(self, queue_id):
         members = self.cache_api.list_queue_members(
-            queue_id=queue_id, status=QueueMemberStatus.WAITING)
+            queue_id=queue_id, status=QueueMemberStatus.WAITING,
+            limit=1, master=True)
 
         if any(members):
             return members[0].uuid
 
         return None
+
+    def match(self, queue_id):
+        """Ring the next available member for the next available caller.
+
+        :returns: A (caller, member) tuple of the matched pair, both now
+                  ringing, or None if there is nothing to match.
+        """
+        return self.cache_api.match_queue_caller(
+            queue_id=queue_id, strategy=self.get_strategy(queue_id=queue_id))
+
+    def match_queues(self, queue_ids, limit):
+        """Ring available members for the waiting callers of several queues.
+
+        :param limit: The most pairs matched per Redis node.
+        :returns: A (matches, pending) tuple of a list of (caller, member)
+                  tuples, and the ids of the queues left to match once the
+                  limit was reached.
+        """
+        res = dict((x, self.get_strategy(queue_id=x)) for x in queue_ids)
+
+        return self.cache_api.match_queue_callers(strategies=res, limit=limit)
+
+    def get_overflow(self, queue_id):
+        """Return the overflow rule of a queue.
+
+        :returns: A (queue_id, max_callers, max_wait) tuple of the queue
+                  waiting callers overflow to and the thresholds, either
+                  of which may be None, or None if the queue has no rule.
+        """
+        queue = self._get_queue(queue_id=queue_id)
+        if queue is None or not queue.overflow_queue_id:
+            return None
+        # NOTE(pabelanger): Rules made before the API refused them.
+        if queue.overflow_queue_id == queue.uuid:
+            return None
+        if (queue.overflow_max_callers is None and
+                queue.overflow_max_wait is None):
+            return None
+
+        return (
+            queue.overflow_queue_id, queue.overflow_max_callers,
+            queue.overflow_max_wait)
+
+    def get_strategy(self, queue_id):
+        """Return the member selection strategy of a queue.
+
+        Queues not in the database use the default strategy.
+        """
+        queue = self._get_queue(queue_id=queue_id)
+        name = queue and queue.strategy
+
+        return self._load_strategy(name=name or strategies.DEFAULT)
+
+    def overflow(self, queue_id):
+        """Move the callers of a queue over its thresholds to another queue.
+
+        :returns: The epoch seconds the next waiting caller reaches the
+                  max_wait of the queue at, or None if there is no such
+                  caller or threshold.
+        """
+        rule = self.get_overflow(queue_id=queue_id)
+        if rule is None:
+            return None
+
+        target, max_callers, max_wait = rule
+
+        return self.cache_api.overflow_queue_callers(
+            queue_id=queue_id, target_queue_id=target,
+            max_callers=max_callers, max_wait=max_wait,
+            limit=self.overflow_limit)
+
+    def _get_queue(self, queue_id):
+        now = time.time()
+        cached = self._queues.get(queue_id)
+        if cached is not None and now - cached[0] < self.queue_ttl:
+            return cached[1]
+
+        try:
+            res = db_api.get_queue(uuid=queue_id)
+        except exception.QueueNotFound:
+            res = None
+        self._queues[queue_id] = (now, res)
+
+        return res
+
+    def _load_strategy(self, name):
+        if name not in self._strategies:
+            try:
+                self._strategies[name] = strategies.get_strategy(name=name)
+            except RuntimeError:
+                LOG.warn(
+                    'Member selection strategy %s is not installed, using '
+                    '%s' % (name, strategies.DEFAULT))
+                return self._load_strategy(name=strategies.DEFAULT)
+
+        return self._strategies[name]
@@ -0,0 +1,294 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Distribute queue callers to queue members as they arrive.
+"""
+
+import os
+import socket
+import time
+
+from oslo.config import cfg
+import redis
+
+from payload.db import api as db_api
+from payload.openstack.common import log as logging
+from payload.openstack.common import service
+from payload.openstack.common import timeutils
+from payload.server import api
+from payload.server import partition
+
+LOG = logging.getLogger(__name__)
+
+distributor_opts = [
+    cfg.IntOpt(
+        'sweep_interval', default=60,
+        help='Seconds between matching every enabled queue, which catches '
+        'queue events missed while disconnected from Redis'),
+    cfg.IntOpt(
+        'batch_size', default=1000,
+        help='Most callers matched by a batch matching script'),
+    cfg.StrOpt(
+        'node_id', default=None,
+        help='Unique id of this node among the distributor nodes sharing '
+        'the queues, defaults to the host name and process id'),
+    cfg.IntOpt(
+        'lease_ttl', default=10,
+        help='Seconds a node holds the queues it distributes without '
+        'renewing its lease, queues of a failed node wait this long for '
+        'another node'),
+    cfg.IntOpt(
+        'ring_replicas', default=64,
+        help='Number of places of each node on the hash ring dividing the '
+        'queues between distributor nodes'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(distributor_opts, 'distributor')
+CONF.import_opt('batch_matching', 'payload.cache.api', group='distributor')
+
+
+class Distributor(service.Service):
+    """Match callers with members of the queues named by queue events.
+
+    Distributor nodes divide the queues between them, each only matching
+    the queues it holds the lease of. With batch matching, queues are
+    matched in bulk at every tick instead, see tick().
+    """
+
+    # Most seconds between attempts to listen while they keep failing.
+    max_backoff = 30
+
+    def __init__(self):
+        super(Distributor, self).__init__()
+        self.server_api = api.API()
+        node_id = CONF.distributor.node_id
+        if node_id is None:
+            node_id = '%s:%d' % (socket.gethostname(), os.getpid())
+        self.partitioner = partition.Partitioner(
+            cache_api=self.server_api.cache_api, node_id=node_id,
+            ttl=CONF.distributor.lease_ttl,
+            replicas=CONF.distributor.ring_replicas)
+        # Epoch seconds the overflow rule of a queue is next due at, queues
+        # are otherwise only checked on queue events.
+        self.overflows = dict()
+        # Ids of the queues named by queue events since the last tick.
+        self.pending = set()
+        self.heartbeat_interval = CONF.distributor.lease_ttl / 3.0
+        self.indexed = False
+        self.swept_at = 0
+        self._reset_stats()
+
+    def start(self):
+        super(Distributor, self).start()
+        self.tg.add_timer(self.heartbeat_interval, self.heartbeat)
+        self.tg.add_thread(self.run)
+
+    def stop(self):
+        try:
+            self.partitioner.stop()
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            LOG.warn('Unable to release queue leases: %s' % e)
+        super(Distributor, self).stop()
+
+    def distribute(self, queue_id):
+        """Ring members for waiting callers until either runs out.
+
+        The callers left waiting then overflow to another queue if the
+        queue has an overflow rule.
+        """
+        while True:
+            res = self.server_api.match(queue_id=queue_id)
+            if res is None:
+                self.overflow(queue_id=queue_id)
+                break
+
+            self._record(caller=res[0], member=res[1])
+
+    def distribute_queues(self, queue_ids):
+        """Ring members for the waiting callers of several queues in bulk.
+
+        Queues left unfinished once a batch is full are matched again, and
+        the overflow rules of the others applied, see distribute().
+        """
+        queue_ids = set(queue_ids)
+        while queue_ids:
+            matches, pending = self.server_api.match_queues(
+                queue_ids=sorted(queue_ids),
+                limit=CONF.distributor.batch_size)
+            for caller, member in matches:
+                self._record(caller=caller, member=member)
+
+            pending = set(pending)
+            for queue_id in sorted(queue_ids - pending):
+                self.overflow(queue_id=queue_id)
+            queue_ids = pending
+
+    def get_stats(self):
+        """Return match latency from enqueue to ring since the last sweep."""
+        res = {
+            'latency_avg': 0.0,
+            'latency_max': self.latency_max,
+            'matches': self.matches,
+        }
+        if self.matches:
+            res['latency_avg'] = self.latency_total / self.matches
+
+        return res
+
+    def get_timeout(self):
+        """Return the seconds until the next sweep or overflow is due.
+
+        Never more than a heartbeat away, so a sweep asked for by
+        heartbeat() is not held up until the previous one is due.
+        """
+        due = [
+            self.swept_at + CONF.distributor.sweep_interval,
+            time.time() + self.heartbeat_interval,
+        ]
+        due.extend(self.overflows.values())
+
+        return max(min(due) - time.time(), 0)
+
+    def heartbeat(self):
+        """Renew the queue leases, sweeping when queues change hands."""
+        try:
+            if self.partitioner.heartbeat():
+                # NOTE(pabelanger): Queues handed to us were missed while
+                # another node held them.
+                self.swept_at = 0
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            LOG.warn('Unable to renew queue leases: %s' % e)
+        except Exception:
+            # NOTE(pabelanger): Raising would stop the heartbeat for good,
+            # and our queues with it once the leases expire.
+            LOG.exception('Unable to renew queue leases')
+
+    def overflow(self, queue_id):
+        """Apply the overflow rule of a queue, see API.overflow()."""
+        res = self.server_api.overflow(queue_id=queue_id)
+        if res is None:
+            self.overflows.pop(queue_id, None)
+        else:
+            self.overflows[queue_id] = res
+
+    def run(self):
+        delay = 1
+        while True:
+            started = time.time()
+            try:
+                self._listen()
+            except (redis.ConnectionError, redis.TimeoutError) as e:
+                LOG.warn('Lost queue events, reconnecting: %s' % e)
+            except Exception:
+                LOG.exception('Unable to distribute queue callers')
+
+            # NOTE(pabelanger): Every attempt starts with a sweep, back off
+            # while they keep failing straight away.
+            if time.time() - started > self.max_backoff:
+                delay = 1
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    def sweep(self):
+        """Match every enabled queue this node holds the lease of."""
+        stats = self.get_stats()
+        LOG.info(
+            'Matched %(matches)d callers, latency avg %(latency_avg).3fs max '
+            '%(latency_max).3fs' % stats)
+        self._reset_stats()
+
+        queue_ids = [x.uuid for x in db_api.list_queues() if not x.disabled]
+        if not self.indexed:
+            # NOTE(pabelanger): Every queue, whichever node holds it, so
+            # members waiting since before the upgrade can be matched.
+            for queue_id in queue_ids:
+                self.server_api.cache_api.index_queue_members(
+                    queue_id=queue_id)
+            self.indexed = True
+
+        queue_ids = [x for x in queue_ids if self.partitioner.owns(x)]
+        if CONF.distributor.batch_matching:
+            self.distribute_queues(queue_ids=queue_ids)
+        else:
+            for queue_id in queue_ids:
+                self.distribute(queue_id=queue_id)
+        self.swept_at = time.time()
+
+    def tick(self):
+        """Match the queues named by queue events or left dirty in Redis.
+
+        The dirty queues are those which gained a waiting caller or member
+        since they were last matched, kept by payload.cache.api.
+        """
+        queue_ids = self.pending.union(
+            self.server_api.cache_api.list_dirty_queues())
+        self.pending = set()
+        self.distribute_queues(
+            queue_ids=[x for x in queue_ids if self.partitioner.owns(x)])
+
+    def _add_pending(self, queue_id):
+        # NOTE(pabelanger): Queues held by other nodes are left to them,
+        # rather than taking up room in the batch.
+        if self.partitioner.owns(queue_id):
+            self.pending.add(queue_id)
+
+    def _listen(self):
+        pubsub = self.server_api.cache_api.subscribe_queue_events()
+        try:
+            # Anything published before we subscribed is picked up here.
+            self.sweep()
+            while True:
+                message = pubsub.get_message(timeout=self.get_timeout())
+                if CONF.distributor.batch_matching:
+                    # NOTE(pabelanger): Take whatever else already arrived
+                    # along into the batch.
+                    while (message is not None and
+                           len(self.pending) < CONF.distributor.batch_size):
+                        self._add_pending(queue_id=message['data'])
+                        message = pubsub.get_message()
+                    if message is not None:
+                        self._add_pending(queue_id=message['data'])
+                    self.tick()
+                elif (message is not None and
+                        self.partitioner.owns(message['data'])):
+                    self.distribute(queue_id=message['data'])
+
+                now = time.time()
+                for queue_id, due in self.overflows.items():
+                    if due > now:
+                        continue
+                    if self.partitioner.owns(queue_id):
+                        self.distribute(queue_id=queue_id)
+                    else:
+                        del self.overflows[queue_id]
+                if now - self.swept_at >= CONF.distributor.sweep_interval:
+                    self.sweep()
+        finally:
+            pubsub.close()
+
+    def _record(self, caller, member):
+        latency = timeutils.delta_seconds(
+            timeutils.parse_isotime(caller.created_at),
+            timeutils.parse_isotime(caller.status_at))
+        self.matches += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        LOG.debug(
+            'Ringing member %s for caller %s of queue %s after %.3fs' % (
+                member.uuid, caller.uuid, caller.queue_id, latency))
+
+    def _reset_stats(self):
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+        self.matches = 0
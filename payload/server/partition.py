@@ -0,0 +1,159 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Partitioning of queues across payload-distributor nodes.
+
+Every node registers itself in Redis and places the registered nodes on a
+consistent hash ring, which names the node owning each queue. Nodes agree
+on the ring only once they have all seen the same registrations, so a node
+also holds a lease on every queue it matches. A queue is only ever leased
+to one node at a time, and passes to its new owner once the old one lets
+go of it or its lease runs out.
+"""
+
+import bisect
+import hashlib
+import time
+
+from payload.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def _hash(key):
+    return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """A consistent hash ring of nodes.
+
+    Each node is placed on the ring replicas times, so keys spread evenly
+    over the nodes and only the keys of a node joining or leaving the ring
+    change hands.
+    """
+
+    def __init__(self, nodes, replicas):
+        self.nodes = sorted(nodes)
+        self._points = sorted(
+            (_hash('%s-%d' % (node, x)), node)
+            for node in self.nodes for x in range(0, replicas))
+        self._hashes = [x[0] for x in self._points]
+
+    def get_node(self, key):
+        """Return the node owning key, or None if the ring is empty."""
+        if not self._points:
+            return None
+
+        index = bisect.bisect(self._hashes, _hash(str(key)))
+
+        return self._points[index % len(self._points)][1]
+
+
+class Partitioner(object):
+    """Lease the queues a node owns on the ring of the registered nodes."""
+
+    def __init__(self, cache_api, node_id, ttl, replicas):
+        """Create a partitioner, owning every queue until heartbeat().
+
+        :param cache_api: A payload.cache.api.Connection.
+        :param node_id: The unique id of this node.
+        :param ttl: Seconds registrations and leases last without renewal.
+        :param replicas: Number of places of each node on the ring.
+        """
+        self.cache_api = cache_api
+        self.node_id = node_id
+        self.ttl = ttl
+        self.replicas = replicas
+        self.ring = HashRing(nodes=[node_id], replicas=replicas)
+        # Queue ids mapped to the epoch seconds their lease runs out at.
+        self.leases = dict()
+        # Ids of the queues this node owns on the ring while another node
+        # still holds their lease, retried at every heartbeat.
+        self.pending = set()
+
+    def heartbeat(self):
+        """Renew the registration and leases of this node.
+
+        Must run more often than every ttl seconds. Leases of queues now
+        owned by another node are given up, and those of the queues another
+        node held when owns() was called are taken if it let go of them.
+
+        :returns: True if the registered nodes changed, or queues were
+                  handed to this node.
+        """
+        nodes = self.cache_api.join_distributors(
+            node_id=self.node_id, ttl=self.ttl)
+        changed = nodes != self.ring.nodes
+        if changed:
+            LOG.info('Distributing queues across %s' % ', '.join(nodes))
+            self.ring = HashRing(nodes=nodes, replicas=self.replicas)
+
+        for queue_id in self.leases.keys():
+            if self.ring.get_node(queue_id) != self.node_id:
+                self.release(queue_id=queue_id)
+        self.pending = set(
+            x for x in self.pending if self.ring.get_node(x) == self.node_id)
+
+        expires = time.time() + self.ttl
+        held = self.cache_api.renew_queue_leases(
+            queue_ids=self.leases.keys(), owner=self.node_id, ttl=self.ttl)
+        self.leases = dict((x, expires) for x in held)
+
+        handed = False
+        for queue_id in sorted(self.pending):
+            if self.cache_api.acquire_queue_lease(
+                    queue_id=queue_id, owner=self.node_id, ttl=self.ttl):
+                LOG.info('Queue %s was handed over' % queue_id)
+                self.leases[queue_id] = expires
+                self.pending.discard(queue_id)
+                handed = True
+
+        return changed or handed
+
+    def owns(self, queue_id):
+        """Return True if this node holds the lease of a queue.
+
+        The lease is taken if this node owns the queue on the ring and no
+        other node holds it, or by a later heartbeat() once the other node
+        lets go of it.
+        """
+        if self.ring.get_node(queue_id) != self.node_id:
+            return False
+
+        now = time.time()
+        if self.leases.get(queue_id, 0) > now:
+            return True
+
+        if self.cache_api.acquire_queue_lease(
+                queue_id=queue_id, owner=self.node_id, ttl=self.ttl):
+            self.leases[queue_id] = now + self.ttl
+            self.pending.discard(queue_id)
+            return True
+
+        self.leases.pop(queue_id, None)
+        self.pending.add(queue_id)
+
+        return False
+
+    def release(self, queue_id):
+        """Give up the lease of a queue."""
+        self.leases.pop(queue_id, None)
+        self.cache_api.release_queue_lease(
+            queue_id=queue_id, owner=self.node_id)
+
+    def stop(self):
+        """Give up every lease and unregister this node."""
+        for queue_id in self.leases.keys():
+            self.release(queue_id=queue_id)
+        self.pending = set()
+        self.cache_api.leave_distributors(node_id=self.node_id)
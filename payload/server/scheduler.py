@@ -0,0 +1,223 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Time out ringing, wrap-up and waiting queue callers and members.
+
+Timers are kept in Redis by payload.cache.api, scored by when they are
+due. The scheduler loads the next due time of every queue into a hashed
+timing wheel, and expires the timers of the queues due at each tick in
+bulk. Between full loads, only the queues announced as changed on their
+version channels are loaded again.
+"""
+
+import math
+
+from oslo.config import cfg
+import redis
+
+from payload.db import api as db_api
+from payload.openstack.common import log as logging
+from payload.openstack.common import service
+from payload.openstack.common import timeutils
+from payload.server import api
+
+LOG = logging.getLogger(__name__)
+
+scheduler_opts = [
+    cfg.FloatOpt(
+        'tick_interval', default=0.1,
+        help='Seconds between ticks of the timing wheel, timers fire up to '
+        'this late'),
+    cfg.IntOpt(
+        'wheel_size', default=600,
+        help='Number of slots of the timing wheel'),
+    cfg.IntOpt(
+        'load_interval', default=1,
+        help='Seconds between loading the timers of the queues which '
+        'changed, timers set in the meantime fire up to this late'),
+    cfg.IntOpt(
+        'reload_interval', default=60,
+        help='Seconds between loading the timers of every enabled queue, '
+        'queues enabled or disabled in the meantime are picked up this '
+        'late'),
+    cfg.IntOpt(
+        'batch_size', default=1000,
+        help='Most callers, and members, of a queue timed out per tick'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(scheduler_opts, 'scheduler')
+
+
+class TimingWheel(object):
+    """A hashed timing wheel of items due at given times.
+
+    Items are hashed to a slot by the tick they are due at, so adding an
+    item and advancing the wheel by a tick take constant time however many
+    items are pending. Items due more than a revolution ahead wait in their
+    slot for the wheel to come around again.
+    """
+
+    def __init__(self, interval, size, now=None):
+        self.interval = interval
+        self.items = dict()
+        self.slots = [set() for x in range(0, size)]
+        if now is None:
+            now = timeutils.utcnow_ts(microsecond=True)
+        self.tick = int(now / interval)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, due, item):
+        """Add item due at the epoch seconds due.
+
+        An item already in the wheel keeps the earlier of its due times.
+        Items already due are returned by the next advance().
+        """
+        tick = max(int(math.ceil(due / self.interval)), self.tick + 1)
+        if item in self.items:
+            if self.items[item] <= tick:
+                return
+            self._get_slot(self.items[item]).discard(item)
+
+        self.items[item] = tick
+        self._get_slot(tick).add(item)
+
+    def advance(self, now=None):
+        """Turn the wheel to now and return the items due by then."""
+        if now is None:
+            now = timeutils.utcnow_ts(microsecond=True)
+        current = int(now / self.interval)
+
+        res = set()
+        start = max(self.tick + 1, current - len(self.slots) + 1)
+        for tick in range(start, current + 1):
+            slot = self._get_slot(tick)
+            for item in list(slot):
+                if self.items[item] <= current:
+                    slot.remove(item)
+                    del self.items[item]
+                    res.add(item)
+        self.tick = max(self.tick, current)
+
+        return res
+
+    def _get_slot(self, tick):
+        return self.slots[tick % len(self.slots)]
+
+
+class Scheduler(service.Service):
+    """Expire the timers of queue callers and members as they fall due."""
+
+    def __init__(self):
+        super(Scheduler, self).__init__()
+        self.server_api = api.API()
+        self.changes = None
+        self.loaded_at = 0
+        self.queue_ids = set()
+        self.refreshed_at = 0
+        self.wheel = TimingWheel(
+            interval=CONF.scheduler.tick_interval,
+            size=CONF.scheduler.wheel_size)
+
+    def start(self):
+        super(Scheduler, self).start()
+        self.tg.add_timer(CONF.scheduler.tick_interval, self.run)
+
+    def stop(self):
+        super(Scheduler, self).stop()
+        self._unsubscribe()
+
+    def expire(self, queue_id):
+        """Expire the due timers of a queue and schedule its next one."""
+        res = self.server_api.cache_api.expire_queue_timers(
+            queue_id=queue_id, limit=CONF.scheduler.batch_size)
+        if res is not None:
+            self.wheel.add(due=res, item=queue_id)
+
+    def load(self):
+        """Add the next timer of every enabled queue to the wheel.
+
+        Subscribes to the changes of the queues first, for refresh() to
+        pick up the timers set from then on.
+        """
+        if self.changes is None:
+            self.changes = self.server_api.cache_api.subscribe_queue_changes()
+        now = timeutils.utcnow_ts(microsecond=True)
+        self.queue_ids = set(
+            x.uuid for x in db_api.list_queues() if not x.disabled)
+        self._add(queue_ids=self.queue_ids)
+        self.loaded_at = self.refreshed_at = now
+
+    def refresh(self):
+        """Add the next timer of the queues changed since to the wheel."""
+        queue_ids = set()
+        message = self.changes.get_message()
+        while message is not None:
+            if message['type'] == 'pmessage':
+                queue_ids.add(self.server_api.cache_api.get_changed_queue(
+                    message=message))
+            message = self.changes.get_message()
+        self._add(queue_ids=queue_ids.intersection(self.queue_ids))
+        self.refreshed_at = timeutils.utcnow_ts(microsecond=True)
+
+    def run(self):
+        try:
+            now = timeutils.utcnow_ts(microsecond=True)
+            if (self.changes is None or
+                    now - self.loaded_at >= CONF.scheduler.reload_interval):
+                self.load()
+            elif now - self.refreshed_at >= CONF.scheduler.load_interval:
+                self.refresh()
+            self.tick()
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            LOG.warn('Unable to expire queue timers: %s' % e)
+            # NOTE(pabelanger): Changes were missed while disconnected, so
+            # start over with a full load.
+            self._unsubscribe()
+        except Exception:
+            # NOTE(pabelanger): Raising would stop the looping call, and
+            # no timer would fire again.
+            LOG.exception('Unable to expire queue timers')
+
+    def tick(self):
+        """Expire the timers of the queues due by now.
+
+        A queue failing to expire is left out of the wheel until the next
+        load(), rather than holding up the others.
+        """
+        for queue_id in self.wheel.advance():
+            try:
+                self.expire(queue_id=queue_id)
+            except (redis.ConnectionError, redis.TimeoutError):
+                raise
+            except Exception:
+                LOG.exception(
+                    'Unable to expire the timers of queue %s' % queue_id)
+
+    def _add(self, queue_ids):
+        timers = self.server_api.cache_api.list_queue_timers(
+            queue_ids=queue_ids)
+        for queue_id, due in timers.iteritems():
+            self.wheel.add(due=due, item=queue_id)
+
+    def _unsubscribe(self):
+        if self.changes is None:
+            return
+
+        try:
+            self.changes.close()
+        except Exception:
+            LOG.exception('Unable to close the queue changes subscription')
+        self.changes = None
@@ -0,0 +1,94 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Member selection strategies, loaded as stevedore plugins.
+
+A strategy picks the member to ring for a caller out of the available
+members of a queue. The pick runs inside the match script, so it only
+touches the sorted sets described in payload.cache.scripts and never
+scans members.
+"""
+
+import random
+
+from stevedore import driver
+from stevedore import extension
+
+from payload.cache import api
+from payload.cache import scripts
+
+NAMESPACE = 'payload.server.strategies'
+
+DEFAULT = 'longest-idle'
+
+
+def get_names():
+    """Return the names of the installed strategies."""
+    return extension.ExtensionManager(namespace=NAMESPACE).names()
+
+
+def get_strategy(name):
+    """Return an instance of the named strategy."""
+    return driver.DriverManager(
+        namespace=NAMESPACE, name=name, invoke_on_load=True).driver
+
+
+class Strategy(object):
+    """Base class of member selection strategies.
+
+    Subclasses set select to Lua assigning the uuid of the chosen member to
+    member, see payload.cache.scripts.match().
+    """
+
+    name = None
+    select = None
+
+    def get_args(self):
+        """Return the arguments passed to select as args."""
+        return []
+
+
+class LongestIdle(Strategy):
+
+    name = 'longest-idle'
+    select = scripts.LONGEST_IDLE
+
+
+class FewestCalls(Strategy):
+
+    name = 'fewest-calls'
+    select = scripts.FEWEST_CALLS
+
+
+class RoundRobin(Strategy):
+
+    name = 'round-robin'
+    select = scripts.ROUND_ROBIN
+
+
+class Random(Strategy):
+
+    name = 'random'
+    select = scripts.RANDOM
+
+    def get_args(self):
+        return [repr(random.random())]
+
+
+class Weighted(Strategy):
+
+    name = 'weighted'
+    select = scripts.WEIGHTED
+
+    def get_args(self):
+        return [repr(random.random()), api.MAX_MEMBER_WEIGHT]
@@ -28,6 +28,7 @@ from oslo.config import cfg
 from oslo.messaging import conffixture as messaging_conffixture
 import redis
 
+from payload.cache import api as cache_api
 from payload.common import paths
 from payload.db import migration
 from payload.openstack.common.db.sqlalchemy import session
@@ -99,6 +100,7 @@ class Redis(fixtures.Fixture):
 
     def setUp(self):
         super(Redis, self).setUp()
+        self.addCleanup(cache_api.cleanup)
 
         _session = redis.StrictRedis(
             host=CONF.redis.host, port=CONF.redis.port,
@@ -16,7 +16,10 @@
 # limitations under the License.
 
 import socket
+import time
 
+from eventlet.green import httplib
+import fixtures
 from oslo.config import cfg
 
 from payload.api import app
@@ -31,13 +34,99 @@ class TestCase(test.TestCase):
 
     def test_WSGI_address_family(self):
         self.CONF.set_override('host', '::', group='api')
-        server_cls = app.get_server_cls(cfg.CONF.api.host)
-        self.assertEqual(server_cls.address_family, socket.AF_INET6)
+        family = app.get_address_family(cfg.CONF.api.host)
+        self.assertEqual(family, socket.AF_INET6)
 
         self.CONF.set_override('host', '127.0.0.1', group='api')
-        server_cls = app.get_server_cls(cfg.CONF.api.host)
-        self.assertEqual(server_cls.address_family, socket.AF_INET)
+        family = app.get_address_family(cfg.CONF.api.host)
+        self.assertEqual(family, socket.AF_INET)
 
         self.CONF.set_override('host', 'ddddd', group='api')
-        server_cls = app.get_server_cls(cfg.CONF.api.host)
-        self.assertEqual(server_cls.address_family, socket.AF_INET)
+        family = app.get_address_family(cfg.CONF.api.host)
+        self.assertEqual(family, socket.AF_INET)
+
+    def test_build_server_reverse_dns_lookup(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'payload.api.app.load_app', lambda: None))
+        self.useFixture(fixtures.MonkeyPatch(
+            'payload.api.app.Server', lambda **kwargs: kwargs))
+        self.useFixture(fixtures.MonkeyPatch(
+            'oslo.config.cfg.CONF.log_opt_values', lambda *args: None))
+        logger = self.useFixture(fixtures.FakeLogger())
+
+        app.build_server()
+        self.assertNotIn('enable_reverse_dns_lookup', logger.output)
+
+        self.CONF.set_override(
+            'enable_reverse_dns_lookup', True, group='api')
+        app.build_server()
+        self.assertIn('enable_reverse_dns_lookup', logger.output)
+
+    def test_get_workers(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'multiprocessing.cpu_count', lambda: 4))
+        self.assertEqual(app.get_workers(), 4)
+
+        self.CONF.set_override('workers', 2, group='api')
+        self.assertEqual(app.get_workers(), 2)
+
+    def test_get_workers_unknown_cpus(self):
+        def _cpu_count():
+            raise NotImplementedError()
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'multiprocessing.cpu_count', _cpu_count))
+        self.assertEqual(app.get_workers(), 1)
+
+    def test_server_keep_alive(self):
+        def _app(environ, start_response):
+            start_response('200 OK', [('Content-Length', '2')])
+            return ['ok']
+
+        srv = app.Server(app=_app, host='127.0.0.1', port=0)
+        self.addCleanup(srv.socket.close)
+        srv.start()
+        self.addCleanup(srv.stop)
+
+        conn = httplib.HTTPConnection(*srv.socket.getsockname())
+        conn.request('GET', '/')
+        self.assertEqual(conn.getresponse().read(), 'ok')
+        sock = conn.sock
+        conn.request('GET', '/')
+        conn.getresponse().read()
+        self.assertTrue(conn.sock is sock)
+        conn.close()
+
+        # NOTE(pabelanger): The listen socket outlives the server, so it
+        # can start again once restarted.
+        srv.stop()
+        srv.wait()
+        srv.start()
+        conn = httplib.HTTPConnection(*srv.socket.getsockname())
+        conn.request('GET', '/')
+        self.assertEqual(conn.getresponse().read(), 'ok')
+        conn.close()
+
+    def test_server_stop_idle_keep_alive(self):
+        def _app(environ, start_response):
+            start_response('200 OK', [('Content-Length', '2')])
+            return ['ok']
+
+        self.CONF.set_override('shutdown_timeout', 1, group='api')
+        srv = app.Server(app=_app, host='127.0.0.1', port=0)
+        self.addCleanup(srv.socket.close)
+        srv.start()
+        self.addCleanup(srv.stop)
+
+        conn = httplib.HTTPConnection(*srv.socket.getsockname())
+        self.addCleanup(conn.close)
+        conn.request('GET', '/')
+        self.assertEqual(conn.getresponse().read(), 'ok')
+
+        # NOTE(pabelanger): The connection is kept open, idle, and would be
+        # waited for up to client_socket_timeout.
+        start = time.time()
+        srv.stop()
+        srv.wait()
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(conn.sock.recv(1), '')
@@ -30,6 +30,7 @@ class TestCase(base.FunctionalTest):
     def test_get_one_success(self):
         json = {
             'project_id': '5fccabbb-9d65-417f-8b0b-a2fc77b501e6',
+            'skills': None,
             'updated_at': None,
             'user_id': '09f07543-6dad-441b-acbf-1c61b5f4015e',
         }
@@ -52,6 +53,7 @@ class TestCase(base.FunctionalTest):
     def test_get_all_success(self):
         json = {
             'project_id': '5fccabbb-9d65-417f-8b0b-a2fc77b501e6',
+            'skills': None,
             'updated_at': None,
             'user_id': '09f07543-6dad-441b-acbf-1c61b5f4015e',
         }
@@ -23,6 +23,7 @@ class TestCase(base.FunctionalTest):
     def test_all_fields(self):
         json = {
             'project_id': '5fccabbb-9d65-417f-8b0b-a2fc77b501e6',
+            'skills': {'english': 3, 'sales': 1},
             'updated_at': None,
             'user_id': '09f07543-6dad-441b-acbf-1c61b5f4015e',
         }
@@ -32,7 +32,11 @@ class TestCase(base.FunctionalTest):
             'description': '24/7 support',
             'disabled': True,
             'name': 'support',
+            'overflow_max_callers': None,
+            'overflow_max_wait': None,
+            'overflow_queue_id': None,
             'project_id': '5fccabbb-9d65-417f-8b0b-a2fc77b501e6',
+            'strategy': 'longest-idle',
             'updated_at': None,
             'user_id': '09f07543-6dad-441b-acbf-1c61b5f4015e',
         }
@@ -66,7 +70,11 @@ class TestCase(base.FunctionalTest):
             'description': '24/7 support',
             'disabled': True,
             'name': 'support',
+            'overflow_max_callers': None,
+            'overflow_max_wait': None,
+            'overflow_queue_id': None,
             'project_id': '5fccabbb-9d65-417f-8b0b-a2fc77b501e6',
+            'strategy': 'longest-idle',
             'updated_at': None,
             'user_id': '09f07543-6dad-441b-acbf-1c61b5f4015e',
         }
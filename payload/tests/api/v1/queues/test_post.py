@@ -25,7 +25,11 @@ class TestCase(base.FunctionalTest):
             'description': '24/7 support',
             'disabled': True,
             'name': 'support',
+            'overflow_max_callers': None,
+            'overflow_max_wait': None,
+            'overflow_queue_id': None,
             'project_id': '5fccabbb-9d65-417f-8b0b-a2fc77b501e6',
+            'strategy': 'longest-idle',
             'updated_at': None,
             'user_id': '09f07543-6dad-441b-acbf-1c61b5f4015e',
         }
@@ -50,3 +54,55 @@ class TestCase(base.FunctionalTest):
 
         # NOTE(pabelanger): We add 2 because of created_at and uuid
         self.assertEqual(len(res), len(json) + 2)
+
+    def test_overflow(self):
+        queue = self.post_json('/queues', params={'name': 'overflow'})
+        params = {
+            'name': 'support',
+            'overflow_max_callers': 10,
+            'overflow_max_wait': 120,
+            'overflow_queue_id': queue['uuid'],
+        }
+        res = self.post_json('/queues', params=params, status=200)
+        for k, v in params.iteritems():
+            self.assertEqual(res[k], v)
+
+    def test_overflow_unknown_queue(self):
+        params = {
+            'name': 'support',
+            'overflow_max_callers': 10,
+            'overflow_queue_id': 'foobar',
+        }
+        res = self.post_json(
+            '/queues', params=params, expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+        self.assertTrue(res.json['error_message'])
+
+    def test_overflow_negative(self):
+        queue = self.post_json('/queues', params={'name': 'overflow'})
+        params = {
+            'name': 'support',
+            'overflow_max_wait': -1,
+            'overflow_queue_id': queue['uuid'],
+        }
+        res = self.post_json(
+            '/queues', params=params, expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+
+    def test_strategy(self):
+        params = {
+            'name': 'support',
+            'strategy': 'round-robin',
+        }
+        res = self.post_json('/queues', params=params, status=200)
+        self.assertEqual(res['strategy'], 'round-robin')
+
+    def test_strategy_unknown(self):
+        params = {
+            'name': 'support',
+            'strategy': 'foobar',
+        }
+        res = self.post_json(
+            '/queues', params=params, expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+        self.assertTrue(res.json['error_message'])
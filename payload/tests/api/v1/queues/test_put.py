@@ -0,0 +1,80 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2013 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from payload.tests.api.v1 import base
+
+
+class TestCase(base.FunctionalTest):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.target = self.post_json('/queues', params={'name': 'overflow'})
+        self.queue = self.post_json('/queues', params={
+            'name': 'support',
+            'overflow_max_callers': 10,
+            'overflow_queue_id': self.target['uuid'],
+        })
+        self.path = '/queues/%s' % self.queue['uuid']
+
+    def test_put(self):
+        res = self.put_json(self.path, params={
+            'description': 'Level 2', 'disabled': False,
+            'overflow_max_callers': 0,
+        })
+        self.assertEqual(res['description'], 'Level 2')
+        self.assertEqual(res['overflow_max_callers'], 0)
+        self.assertEqual(res['overflow_queue_id'], self.target['uuid'])
+
+    def test_put_clear_overflow(self):
+        res = self.put_json(self.path, params={
+            'overflow_max_callers': None, 'overflow_queue_id': None,
+        })
+        self.assertIsNone(res['overflow_max_callers'])
+        self.assertIsNone(res['overflow_queue_id'])
+        self.assertEqual(res['name'], 'support')
+
+    def test_put_overflow_self(self):
+        res = self.put_json(
+            self.path, params={'overflow_queue_id': self.queue['uuid']},
+            expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+
+        res = self.get_json(self.path)
+        self.assertEqual(res['overflow_queue_id'], self.target['uuid'])
+
+    def test_put_overflow_loop(self):
+        path = '/queues/%s' % self.target['uuid']
+        res = self.put_json(
+            path, params={'overflow_queue_id': self.queue['uuid']},
+            expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+
+        queue = self.post_json('/queues', params={
+            'name': 'sales', 'overflow_queue_id': self.queue['uuid'],
+        })
+        res = self.put_json(
+            path, params={'overflow_queue_id': queue['uuid']},
+            expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+
+        res = self.get_json(path)
+        self.assertIsNone(res['overflow_queue_id'])
+
+    def test_put_overflow_negative(self):
+        for name in ['overflow_max_callers', 'overflow_max_wait']:
+            res = self.put_json(
+                self.path, params={name: -1}, expect_errors=True)
+            self.assertEqual(res.status_int, 400)
@@ -14,7 +14,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import fixtures
+import wsme.rest.json
+from wsme import types as wtypes
+
+from payload.api.controllers.v1.queue import caller as caller_api
 from payload.cache import api
+from payload.openstack.common import jsonutils
 from payload.tests.api.v1 import base
 
 
@@ -49,7 +55,7 @@ class TestCase(base.FunctionalTest):
 
     def test_list_queue_callers(self):
         callers = self._create_queue_caller(queue_id=self.queue_id)
-        self._list_queue_callers([callers.__dict__])
+        self._list_queue_callers([callers.as_dict()])
 
     def test_get_queue_caller(self):
         caller = self._create_queue_caller(queue_id=self.queue_id)
@@ -60,6 +66,256 @@ class TestCase(base.FunctionalTest):
         )
         self.assertEqual(caller.uuid, res['uuid'])
 
+    def test_post_queue_callers(self):
+        json = [
+            {
+                'created_at': '2014-12-12T02:07:05Z',
+                'name': 'Leif Madsen',
+                'number': '9055555678',
+                'uuid': '5678',
+            },
+            {
+                'created_at': '2014-12-12T02:05:14Z',
+                'name': 'Paul Belanger',
+                'number': '6135551234',
+                'uuid': '1234',
+            },
+        ]
+        res = self.post_json(
+            '/queues/%s/callers' % self.queue_id, params=json, status=200)
+
+        self.assertEqual(len(res), 2)
+        self.assertEqual(res[0]['position'], 1)
+        self.assertEqual(res[1]['position'], 0)
+
+        res = self.get_json('/queues/%s/callers' % self.queue_id)
+        self.assertEqual([x['uuid'] for x in res], ['1234', '5678'])
+        self.assertEqual(res[0]['created_at'], '2014-12-12T02:05:14.000000Z')
+
+    def test_post_queue_callers_bad_created_at(self):
+        json = [
+            {
+                'created_at': 'yesterday',
+                'name': 'Paul Belanger',
+                'number': '6135551234',
+            },
+        ]
+        res = self.post_json(
+            '/queues/%s/callers' % self.queue_id, params=json,
+            expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+        self.assertIn('yesterday', res.json['error_message'])
+
+        res = self.get_json('/queues/%s/callers' % self.queue_id)
+        self.assertEqual(res, [])
+
+    def test_post_queue_callers_bad_priority(self):
+        for priority in [10, -1]:
+            json = [
+                {
+                    'name': 'Paul Belanger',
+                    'number': '6135551234',
+                    'priority': priority,
+                },
+            ]
+            res = self.post_json(
+                '/queues/%s/callers' % self.queue_id, params=json,
+                expect_errors=True)
+            self.assertEqual(res.status_int, 400)
+            self.assertIn(str(priority), res.json['error_message'])
+
+        res = self.get_json('/queues/%s/callers' % self.queue_id)
+        self.assertEqual(res, [])
+
+    def test_delete_queue_callers(self):
+        for uuid in ['1234', '5678', '9012']:
+            self.cache_api.create_queue_caller(
+                queue_id=self.queue_id, uuid=uuid)
+
+        res = self.post_json(
+            '/queues/%s/callers' % self.queue_id, params=['1234', '9012'],
+            method='delete', expect_errors=True)
+        self.assertEqual(res.status_int, 204)
+
+        res = self.get_json('/queues/%s/callers' % self.queue_id)
+        self.assertEqual([x['uuid'] for x in res], ['5678'])
+
+    def test_delete_queue_callers_not_found(self):
+        caller = self._create_queue_caller(queue_id=self.queue_id)
+
+        res = self.post_json(
+            '/queues/%s/callers' % self.queue_id,
+            params=[caller.uuid, 'foobar'], method='delete',
+            expect_errors=True)
+        self.assertEqual(res.status_int, 404)
+
+        res = self.get_json('/queues/%s/callers' % self.queue_id)
+        self.assertEqual(len(res), 1)
+
+    def test_list_queue_callers_limit(self):
+        for uuid in ['1234', '5678', '9012']:
+            self.cache_api.create_queue_caller(
+                queue_id=self.queue_id, uuid=uuid)
+
+        res = self.get_json(
+            '/queues/%s/callers?limit=2' % self.queue_id)
+        self.assertEqual([x['uuid'] for x in res], ['1234', '5678'])
+
+        res = self.get_json(
+            '/queues/%s/callers?limit=2&marker=5678' % self.queue_id)
+        self.assertEqual([x['uuid'] for x in res], ['9012'])
+        self.assertEqual(res[0]['position'], 2)
+
+    def test_list_queue_callers_status(self):
+        for uuid in ['1234', '5678', '9012']:
+            self.cache_api.create_queue_caller(
+                queue_id=self.queue_id, uuid=uuid)
+        self.cache_api.update_queue_caller(
+            queue_id=self.queue_id, uuid='5678',
+            status=api.QueueCallerStatus.RINGING)
+
+        res = self.get_json(
+            '/queues/%s/callers?status=%s' % (
+                self.queue_id, api.QueueCallerStatus.WAITING))
+        self.assertEqual([x['uuid'] for x in res], ['1234', '9012'])
+
+    def test_list_queue_callers_bad_marker(self):
+        self._create_queue_caller(queue_id=self.queue_id)
+
+        res = self.get_json(
+            '/queues/%s/callers?marker=foobar' % self.queue_id,
+            expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+
+    def test_list_queue_callers_bad_limit(self):
+        res = self.get_json(
+            '/queues/%s/callers?limit=foobar' % self.queue_id,
+            expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+        self.assertEqual(res.content_type, 'application/json')
+        self.assertIn('limit', res.json['error_message'])
+
+    def test_list_queue_callers_chunks(self):
+        self.useFixture(
+            fixtures.MonkeyPatch(
+                'payload.api.controllers.v1.base.CHUNK_SIZE', 2))
+        for uuid in ['1234', '5678', '9012']:
+            self.cache_api.create_queue_caller(
+                queue_id=self.queue_id, uuid=uuid)
+
+        res = self.get_json('/queues/%s/callers' % self.queue_id)
+        self.assertEqual(
+            [x['uuid'] for x in res], ['1234', '5678', '9012'])
+
+    def test_list_queue_callers_wsme(self):
+        for uuid in ['1234', '5678']:
+            self.cache_api.create_queue_caller(
+                queue_id=self.queue_id, uuid=uuid, name='Bob Smith',
+                skills={'french': 2})
+        callers = self.cache_api.list_queue_callers(queue_id=self.queue_id)
+        datatype = wtypes.registry.resolve_type([caller_api.QueueCaller])
+
+        res = self.get_json('/queues/%s/callers' % self.queue_id)
+        self.assertEqual(
+            res, jsonutils.loads(
+                wsme.rest.json.encode_result(callers, datatype)))
+
+    def test_list_queue_callers_etag(self):
+        caller = self._create_queue_caller(queue_id=self.queue_id)
+        path = '/queues/%s/callers' % self.queue_id
+
+        res = self.get_json(path, expect_errors=True)
+        self.assertEqual(res.status_int, 200)
+        etag = res.headers['ETag']
+
+        res = self.get_json(
+            path, headers={'If-None-Match': etag}, expect_errors=True)
+        self.assertEqual(res.status_int, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(res.body, '')
+
+        self.cache_api.update_queue_caller(
+            queue_id=self.queue_id, uuid=caller.uuid,
+            status=api.QueueCallerStatus.RINGING)
+        res = self.get_json(
+            path, headers={'If-None-Match': etag}, expect_errors=True)
+        self.assertEqual(res.status_int, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(
+            res.json[0]['status'], api.QueueCallerStatus.RINGING)
+
+    def test_list_queue_callers_etag_min_wait(self):
+        self._create_queue_caller(queue_id=self.queue_id)
+        res = self.get_json(
+            '/queues/%s/callers?min_wait=0' % self.queue_id,
+            headers={'If-None-Match': '*'}, expect_errors=True)
+        self.assertEqual(res.status_int, 200)
+        self.assertNotIn('ETag', res.headers)
+
+    def test_list_queue_callers_watch(self):
+        self.config(watch_timeout=0, group='api')
+        caller = self._create_queue_caller(queue_id=self.queue_id)
+        path = '/queues/%s/callers' % self.queue_id
+        version = self.cache_api.get_queue_callers_version(
+            queue_id=self.queue_id)
+        etag = self.cache_api.get_queue_callers_etag(queue_id=self.queue_id)
+
+        res = self.get_json(path, watch=version - 1)
+        self.assertEqual([x['uuid'] for x in res], [caller.uuid])
+
+        res = self.get_json(path, watch='"%s"' % etag, expect_errors=True)
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers['ETag'], '"%s"' % etag)
+
+    def test_list_queue_callers_watch_epoch(self):
+        self.config(watch_timeout=10, group='api')
+        caller = self._create_queue_caller(queue_id=self.queue_id)
+        version = self.cache_api.get_queue_callers_version(
+            queue_id=self.queue_id)
+
+        # NOTE(pabelanger): A version from another epoch, say before a
+        # flush, is no longer waited on.
+        res = self.get_json(
+            '/queues/%s/callers' % self.queue_id,
+            watch='0123abcd-%d' % version)
+        self.assertEqual([x['uuid'] for x in res], [caller.uuid])
+
+    def test_list_queue_callers_watch_etag(self):
+        self.config(watch_timeout=0, group='api')
+        self._create_queue_caller(queue_id=self.queue_id)
+        etag = self.cache_api.get_queue_callers_etag(queue_id=self.queue_id)
+        masters = []
+        get_etag = api.Connection.get_queue_callers_etag
+
+        def _get_queue_callers_etag(cache_api, queue_id, master=False):
+            masters.append(master)
+            return get_etag(cache_api, queue_id=queue_id, master=master)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'payload.cache.api.Connection.get_queue_callers_etag',
+            _get_queue_callers_etag))
+
+        # NOTE(pabelanger): The watch was woken by the master, a replica
+        # may still hold the version it was waiting on.
+        res = self.get_json(
+            '/queues/%s/callers' % self.queue_id, watch=etag,
+            headers={'If-None-Match': '"%s"' % etag}, expect_errors=True)
+        self.assertEqual(res.status_int, 304)
+        self.assertEqual(masters, [True])
+
+    def test_list_queue_callers_bad_watch(self):
+        for watch in ['-1', '0123abcd--1', '0123abcd-x']:
+            res = self.get_json(
+                '/queues/%s/callers?watch=%s' % (self.queue_id, watch),
+                expect_errors=True)
+            self.assertEqual(res.status_int, 400)
+
+    def test_list_queue_callers_negative_limit(self):
+        res = self.get_json(
+            '/queues/%s/callers?limit=-1' % self.queue_id,
+            expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+
     def _list_queue_callers(self, callers):
         res = self.get_json('/queues/%s/callers' % self.queue_id)
         self.assertEqual(res, callers)
@@ -14,7 +14,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import wsme.rest.json
+from wsme import types as wtypes
+
+from payload.api.controllers.v1.queue import member as member_api
 from payload.cache import api
+from payload.openstack.common import jsonutils
 from payload.tests.api.v1 import base
 
 
@@ -49,7 +54,7 @@ class TestCase(base.FunctionalTest):
 
     def test_list_queue_members(self):
         members = self._create_queue_member(queue_id=self.queue_id)
-        self._list_queue_members([members.__dict__])
+        self._list_queue_members([members.as_dict()])
 
     def test_get_queue_member(self):
         member = self._create_queue_member(queue_id=self.queue_id)
@@ -60,6 +65,64 @@ class TestCase(base.FunctionalTest):
         )
         self.assertEqual(member.uuid, res['uuid'])
 
+    def test_list_queue_members_limit(self):
+        for uuid in ['1234', '5678']:
+            self.cache_api.create_queue_member(
+                queue_id=self.queue_id, uuid=uuid, number='1000@example.org')
+
+        res = self.get_json(
+            '/queues/%s/members?limit=1&marker=1234' % self.queue_id)
+        self.assertEqual([x['uuid'] for x in res], ['5678'])
+
+    def test_list_queue_members_wsme(self):
+        for uuid in ['1234', '5678']:
+            self.cache_api.create_queue_member(
+                queue_id=self.queue_id, uuid=uuid, number='1000@example.org',
+                skills={'french': 2}, agent_uuid='9012')
+        self.cache_api.update_queue_member(
+            queue_id=self.queue_id, uuid='5678', paused=1)
+        members = self.cache_api.list_queue_members(queue_id=self.queue_id)
+        self.assertTrue(members[-1].paused_at)
+        datatype = wtypes.registry.resolve_type([member_api.QueueMember])
+
+        res = self.get_json('/queues/%s/members' % self.queue_id)
+        self.assertEqual(
+            res, jsonutils.loads(
+                wsme.rest.json.encode_result(members, datatype)))
+
+    def test_list_queue_members_etag(self):
+        member = self._create_queue_member(queue_id=self.queue_id)
+        path = '/queues/%s/members' % self.queue_id
+
+        etag = self.get_json(path, expect_errors=True).headers['ETag']
+        res = self.get_json(
+            path, headers={'If-None-Match': etag}, expect_errors=True)
+        self.assertEqual(res.status_int, 304)
+
+        self.cache_api.update_queue_member(
+            queue_id=self.queue_id, uuid=member.uuid, paused=1)
+        res = self.get_json(
+            path, headers={'If-None-Match': etag}, expect_errors=True)
+        self.assertEqual(res.status_int, 200)
+
+    def test_list_queue_members_min_wait(self):
+        member = self._create_queue_member(queue_id=self.queue_id)
+
+        res = self.get_json(
+            '/queues/%s/members?min_wait=0' % self.queue_id)
+        self.assertEqual([x['uuid'] for x in res], [member.uuid])
+
+        res = self.get_json(
+            '/queues/%s/members?min_wait=3600' % self.queue_id)
+        self.assertEqual(res, [])
+
+    def test_list_queue_members_bad_marker(self):
+        res = self.get_json(
+            '/queues/%s/members?marker=foobar' % self.queue_id,
+            expect_errors=True)
+        self.assertEqual(res.status_int, 400)
+        self.assertEqual(res.content_type, 'application/json')
+
     def _list_queue_members(self, members):
         res = self.get_json('/queues/%s/members' % self.queue_id)
         self.assertEqual(res, members)
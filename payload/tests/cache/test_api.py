@@ -14,8 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+import time
+
+import fixtures
+import redis
+
 from payload.cache import api
+from payload.cache import cluster
 from payload.common import exception
+from payload.openstack.common import timeutils
 from payload.tests import base
 
 
@@ -28,9 +36,70 @@ class TestCase(base.TestCase):
     def test_create_queue_caller(self):
         self._create_queue_caller()
 
+    def test_create_queue_caller_position(self):
+        for x in range(0, 3):
+            caller = self._create_queue_caller()
+            self.assertEqual(caller['position'], x)
+
+            res = self.cache_api.get_queue_caller(
+                queue_id=caller['queue_id'], uuid=caller['uuid']).as_dict()
+            self.assertEqual(res, caller)
+
+    def test_create_queue_callers(self):
+        json = [
+            {
+                'created_at': '2014-12-12T02:07:05.000100Z',
+                'name': 'Leif Madsen',
+                'number': '9055555678',
+            },
+            {
+                'name': 'Jim Smith',
+                'number': '6135550000',
+                'status': api.QueueCallerStatus.RINGING,
+            },
+            {
+                'created_at': '2014-12-12T02:05:14Z',
+                'name': 'Paul Belanger',
+                'number': '6135551234',
+                'uuid': '1234',
+            },
+        ]
+        res = self.cache_api.create_queue_callers(
+            queue_id='555', callers=json)
+
+        self.assertEqual([x.position for x in res], [1, 2, 0])
+        self.assertEqual(res[0].created_at, '2014-12-12T02:07:05.000100Z')
+        self.assertEqual(res[1].status, api.QueueCallerStatus.RINGING)
+        self.assertEqual(res[2].uuid, '1234')
+
+        callers = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual(
+            [x.as_dict() for x in callers],
+            [x.as_dict() for x in [res[2], res[0], res[1]]])
+
+        callers = self.cache_api.list_queue_callers(
+            queue_id='555', status=api.QueueCallerStatus.WAITING)
+        self.assertEqual(
+            [x.uuid for x in callers], [res[2].uuid, res[0].uuid])
+
+    def test_create_queue_callers_round_trips(self):
+        json = [{'name': 'Bob Smith'} for x in range(0, 50)]
+
+        res = self._count_round_trips(
+            self.cache_api.create_queue_callers, queue_id='555',
+            callers=json)
+        self.assertEqual(res, 1)
+
     def test_create_queue_member(self):
         self._create_queue_member()
 
+    def test_create_queue_member_matches_get(self):
+        member = self._create_queue_member()
+
+        res = self.cache_api.get_queue_member(
+            queue_id=member['queue_id'], uuid=member['uuid']).as_dict()
+        self.assertEqual(res, member)
+
     def test_delete_queue_caller(self):
         caller = self._create_queue_caller()
 
@@ -42,6 +111,39 @@ class TestCase(base.TestCase):
             self.cache_api.get_queue_caller,
             queue_id=caller['queue_id'], uuid=caller['uuid'])
 
+    def test_delete_queue_callers(self):
+        callers = dict()
+        for x in range(0, 3):
+            callers[x] = self._create_queue_caller()
+
+        self.cache_api.update_queue_caller(
+            queue_id='555', uuid=callers[2]['uuid'],
+            status=api.QueueCallerStatus.RINGING)
+        self.cache_api.delete_queue_callers(
+            queue_id='555', uuids=[callers[0]['uuid'], callers[2]['uuid']])
+
+        res = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual([x.uuid for x in res], [callers[1]['uuid']])
+
+        for status in [
+                api.QueueCallerStatus.WAITING, api.QueueCallerStatus.RINGING]:
+            res = self.cache_api.list_queue_callers(
+                queue_id='555', status=status)
+            self.assertEqual(
+                [x.uuid for x in res],
+                [callers[1]['uuid']] if status == '1' else [])
+
+    def test_delete_queue_callers_not_found(self):
+        caller = self._create_queue_caller()
+
+        self.assertRaises(
+            exception.QueueCallerNotFound,
+            self.cache_api.delete_queue_callers,
+            queue_id='555', uuids=[caller['uuid'], 'foobar'])
+
+        res = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual(len(res), 1)
+
     def test_delete_queue_member(self):
         member = self._create_queue_member()
 
@@ -53,6 +155,48 @@ class TestCase(base.TestCase):
             self.cache_api.get_queue_member,
             queue_id=member['queue_id'], uuid=member['uuid'])
 
+    def test_delete_queue_member_available(self):
+        member = self._create_queue_member()
+        self.cache_api.update_queue_member(
+            queue_id=member['queue_id'], uuid=member['uuid'], weight=3,
+            skills={'english': 3})
+
+        self.cache_api.delete_queue_member(
+            queue_id=member['queue_id'], uuid=member['uuid'])
+
+        # Only the version is kept, so it never goes back to an old one.
+        key = self.cache_api._get_members_namespace(queue_id='555')
+        session = self.cache_api._get_session(queue_id='555')
+        self.assertEqual(session.keys('%s*' % key), ['%s:version' % key])
+
+    def test_index_queue_members(self):
+        members = [self._create_queue_member() for x in range(0, 2)]
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=members[1]['uuid'], paused=1)
+        key = self.cache_api._get_members_namespace(queue_id='555')
+        session = self.cache_api._get_session(queue_id='555')
+        available = '%s:available' % key
+
+        # NOTE(pabelanger): Members stored before the available sorted sets
+        # were kept.
+        session.delete(*session.keys('%s*' % available))
+        self.assertIsNone(self.cache_api.match_queue_caller(queue_id='555'))
+
+        self.assertEqual(
+            self.cache_api.index_queue_members(queue_id='555'), 1)
+        self.assertEqual(
+            session.zrange(available, 0, -1, withscores=True),
+            session.zrange(
+                '%s:status:1' % key, 0, 0, withscores=True))
+        self.assertEqual(
+            session.zrange('%s:weight:1' % available, 0, -1),
+            [members[0]['uuid']])
+
+        caller = self._create_queue_caller()
+        res = self.cache_api.match_queue_caller(queue_id='555')
+        self.assertEqual(res[0].uuid, caller['uuid'])
+        self.assertEqual(res[1].uuid, members[0]['uuid'])
+
     def test_list_queue_callers(self):
         callers = dict()
         for x in range(0, 2):
@@ -82,6 +226,209 @@ class TestCase(base.TestCase):
             status=api.QueueCallerStatus.RINGING)
         self.assertEqual(len(res), 1)
 
+    def test_list_queue_callers_position(self):
+        callers = dict()
+        for x in range(0, 3):
+            callers[x] = self._create_queue_caller()
+
+        self.cache_api.update_queue_caller(
+            queue_id=callers[1]['queue_id'], uuid=callers[1]['uuid'],
+            status=api.QueueCallerStatus.RINGING)
+
+        res = self.cache_api.list_queue_callers(
+            queue_id=callers[0]['queue_id'])
+        self.assertEqual([x.position for x in res], [0, 1, 2])
+
+        res = self.cache_api.list_queue_callers(
+            queue_id=callers[0]['queue_id'],
+            status=api.QueueCallerStatus.WAITING)
+        self.assertEqual([x.position for x in res], [0, 2])
+
+    def test_list_queue_callers_status(self):
+        callers = [self._create_queue_caller() for x in range(0, 4)]
+
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', status=api.QueueCallerStatus.WAITING)
+        self.assertEqual(
+            [x.uuid for x in res], [x['uuid'] for x in callers])
+
+    def test_list_queue_callers_limit(self):
+        callers = [self._create_queue_caller() for x in range(0, 5)]
+
+        uuids = []
+        marker = None
+        while True:
+            res = self.cache_api.list_queue_callers(
+                queue_id='555', limit=2, marker=marker)
+            if not res:
+                break
+            self.assertTrue(len(res) <= 2)
+            for item in res:
+                self.assertEqual(item.position, len(uuids))
+                uuids.append(item.uuid)
+            marker = res[-1].uuid
+
+        self.assertEqual(uuids, [x['uuid'] for x in callers])
+
+    def test_list_queue_callers_limit_same_score(self):
+        # NOTE(pabelanger): Callers created together share their score.
+        callers = self.cache_api.create_queue_callers(
+            queue_id='555', callers=[dict() for x in range(0, 4)])
+        callers.sort(key=lambda x: x.position)
+
+        uuids = []
+        marker = None
+        for x in range(0, 4):
+            res = self.cache_api.list_queue_callers(
+                queue_id='555', status=api.QueueCallerStatus.WAITING,
+                limit=1, marker=marker)
+            self.assertEqual(res[0].position, x)
+            marker = res[0].uuid
+            uuids.append(marker)
+
+        self.assertEqual(uuids, [x.uuid for x in callers])
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', status=api.QueueCallerStatus.WAITING,
+            limit=1, marker=marker)
+        self.assertEqual(res, [])
+
+    def test_list_queue_callers_marker_not_found(self):
+        self._create_queue_caller()
+        self.assertRaises(
+            exception.MarkerNotFound, self.cache_api.list_queue_callers,
+            queue_id='555', marker='foobar')
+
+    def test_list_queue_callers_wait(self):
+        created_at = timeutils.iso8601_from_timestamp(
+            timeutils.utcnow_ts() - 3600)
+        callers = self.cache_api.create_queue_callers(
+            queue_id='555', callers=[{'created_at': created_at}, {}])
+
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', min_wait=60)
+        self.assertEqual([x.uuid for x in res], [callers[0].uuid])
+
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', max_wait=60)
+        self.assertEqual([x.uuid for x in res], [callers[1].uuid])
+        self.assertEqual(res[0].position, 1)
+
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', min_wait=60, max_wait=7200,
+            marker=callers[0].uuid)
+        self.assertEqual(res, [])
+
+    def test_list_queue_members_wait(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        member = self._create_queue_member()
+        timeutils.advance_time_seconds(120)
+
+        res = self.cache_api.list_queue_members(queue_id='555', min_wait=60)
+        self.assertEqual([x.uuid for x in res], [member['uuid']])
+
+        res = self.cache_api.list_queue_members(queue_id='555', max_wait=60)
+        self.assertEqual(res, [])
+
+    def test_list_queue_callers_priority(self):
+        created_at = timeutils.iso8601_from_timestamp(
+            timeutils.utcnow_ts() - 3600)
+        callers = self.cache_api.create_queue_callers(
+            queue_id='555', callers=[
+                {'created_at': created_at}, {}, {'priority': 2},
+                {'created_at': created_at, 'priority': 1}])
+        self.assertEqual(
+            [x.position for x in callers], [2, 3, 0, 1])
+        self.assertEqual(callers[2].priority, 2)
+
+        res = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual(
+            [(x.uuid, x.position) for x in res],
+            [(callers[x].uuid, y) for x, y in [(2, 0), (3, 1), (0, 2),
+                                               (1, 3)]])
+
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', min_wait=60)
+        self.assertEqual(
+            [(x.uuid, x.position) for x in res],
+            [(callers[3].uuid, 1), (callers[0].uuid, 2)])
+
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', max_wait=60, limit=1, marker=callers[2].uuid)
+        self.assertEqual([x.uuid for x in res], [callers[1].uuid])
+
+        # Callers keep their priority through status changes.
+        for caller in [callers[0], callers[2]]:
+            for status in [api.QueueCallerStatus.RINGING,
+                           api.QueueCallerStatus.WAITING]:
+                self.cache_api.update_queue_caller(
+                    queue_id='555', uuid=caller.uuid, status=status)
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', status=api.QueueCallerStatus.WAITING, min_wait=0)
+        self.assertEqual(
+            [x.uuid for x in res],
+            [callers[x].uuid for x in [2, 3, 1, 0]])
+
+    def test_create_queue_callers_created_at_invalid(self):
+        self.assertRaises(
+            exception.QueueCallerCreatedAtInvalid,
+            self.cache_api.create_queue_callers,
+            queue_id='555', callers=[{'created_at': 'yesterday'}])
+
+    def test_create_queue_caller_priority_invalid(self):
+        for priority in [-1, api.MAX_CALLER_PRIORITY + 1]:
+            self.assertRaises(
+                exception.QueueCallerPriorityInvalid,
+                self.cache_api.create_queue_caller,
+                queue_id='555', priority=priority)
+
+    def test_list_queue_members_limit(self):
+        members = [self._create_queue_member() for x in range(0, 3)]
+
+        res = self.cache_api.list_queue_members(
+            queue_id='555', status=api.QueueMemberStatus.WAITING, limit=2)
+        self.assertEqual(
+            [x.uuid for x in res], [x['uuid'] for x in members[:2]])
+
+        res = self.cache_api.list_queue_members(
+            queue_id='555', limit=2, marker=res[-1].uuid)
+        self.assertEqual([x.uuid for x in res], [members[2]['uuid']])
+
+    def test_list_queue_callers_round_trips(self):
+        caller = self._create_queue_caller()
+        queue_id = caller['queue_id']
+        # The first listing sets the epoch, see get_queue_callers_etag().
+        self.cache_api.list_queue_callers(queue_id=queue_id)
+
+        small = self._count_round_trips(
+            self.cache_api.list_queue_callers, queue_id=queue_id)
+
+        for x in range(0, 50):
+            self._create_queue_caller()
+
+        large = self._count_round_trips(
+            self.cache_api.list_queue_callers, queue_id=queue_id)
+
+        self.assertEqual(small, 2)
+        self.assertEqual(large, small)
+
+    def test_list_queue_members_round_trips(self):
+        member = self._create_queue_member()
+        queue_id = member['queue_id']
+        self.cache_api.list_queue_members(queue_id=queue_id)
+
+        small = self._count_round_trips(
+            self.cache_api.list_queue_members, queue_id=queue_id)
+
+        for x in range(0, 50):
+            self._create_queue_member()
+
+        large = self._count_round_trips(
+            self.cache_api.list_queue_members, queue_id=queue_id)
+
+        self.assertEqual(small, 2)
+        self.assertEqual(large, small)
+
     def test_list_queue_member(self):
         members = dict()
         for x in range(0, 2):
@@ -111,6 +458,450 @@ class TestCase(base.TestCase):
             status=api.QueueMemberStatus.RINGING)
         self.assertEqual(len(res), 1)
 
+    def test_match_queue_caller_round_trips(self):
+        for x in range(0, 2):
+            self._create_queue_caller()
+            self._create_queue_member()
+        self.cache_api.match_queue_caller(queue_id='555')
+
+        sent = self._count_round_trips(
+            self.cache_api.match_queue_caller, queue_id='555')
+        self.assertEqual(sent, 1)
+
+    def test_match_queue_callers(self):
+        for queue_id in ['555', '556', '557']:
+            for x in range(0, 2):
+                self.cache_api.create_queue_caller(queue_id=queue_id)
+            self.cache_api.create_queue_member(
+                queue_id=queue_id, number='1000')
+        self.cache_api.create_queue_member(queue_id='556', number='1001')
+
+        matches, pending = self.cache_api.match_queue_callers(
+            strategies={'555': None, '556': None, '558': None})
+        self.assertEqual(pending, [])
+        res = sorted(
+            (caller.queue_id, member.queue_id) for caller, member in matches)
+        self.assertEqual(res, [('555', '555'), ('556', '556'), ('556', '556')])
+        for caller, member in matches:
+            self.assertEqual(caller.status, api.QueueCallerStatus.RINGING)
+            self.assertEqual(caller.member_uuid, member.uuid)
+            self.assertEqual(member.status, api.QueueMemberStatus.RINGING)
+
+        res = self.cache_api.list_queue_callers(
+            queue_id='557', status=api.QueueCallerStatus.WAITING)
+        self.assertEqual(len(res), 2)
+
+    def test_match_queue_callers_limit(self):
+        for queue_id in ['555', '556']:
+            for x in range(0, 2):
+                self.cache_api.create_queue_caller(queue_id=queue_id)
+                self.cache_api.create_queue_member(
+                    queue_id=queue_id, number='1000')
+
+        matches, pending = self.cache_api.match_queue_callers(
+            strategies={'555': None, '556': None}, limit=3)
+        if self.cache_api._router is None:
+            self.assertEqual(len(matches), 3)
+            self.assertEqual(pending, ['556'])
+        else:
+            self.assertEqual(len(matches), 4)
+            self.assertEqual(pending, [])
+
+    def test_match_queue_callers_round_trips(self):
+        strategies = dict((x, None) for x in ['555', '556', '557'])
+        self.cache_api.match_queue_callers(strategies=strategies)
+
+        sent = self._count_round_trips(
+            self.cache_api.match_queue_callers, strategies=strategies)
+        if self.cache_api._router is None:
+            self.assertEqual(sent, 1)
+        else:
+            # NOTE(pabelanger): The pipeline checks for the script first.
+            self.assertEqual(sent, 2)
+
+    def test_list_dirty_queues(self):
+        # NOTE(pabelanger): Dirty queues are only kept for batch matching.
+        self._create_queue_caller()
+        self.assertEqual(self.cache_api.list_dirty_queues(), [])
+        self.assertEqual(self.cache_api._session.keys(api.DIRTY_KEY), [])
+
+        self.config(batch_matching=True, group='distributor')
+        self._create_queue_caller()
+        self.cache_api.create_queue_member(queue_id='556', number='1000')
+        if self.cache_api._router is not None:
+            self.assertEqual(self.cache_api.list_dirty_queues(), [])
+            return
+
+        self.assertEqual(self.cache_api.list_dirty_queues(), ['555', '556'])
+        self.cache_api.match_queue_callers(
+            strategies={'555': None, '556': None})
+        self.assertEqual(self.cache_api.list_dirty_queues(), [])
+
+    def test_queue_callers_version(self):
+        self.assertEqual(
+            self.cache_api.get_queue_callers_version(queue_id='555'), 0)
+        caller = self._create_queue_caller()
+        version = self.cache_api.get_queue_callers_version(queue_id='555')
+        self.assertTrue(version > 0)
+
+        res = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual(res.version, version)
+        self.cache_api.create_queue_member(queue_id='555', number='1000')
+        self.assertEqual(
+            self.cache_api.get_queue_callers_version(queue_id='555'), version)
+
+        for func, kwargs in [
+                (self.cache_api.update_queue_caller,
+                 {'uuid': caller['uuid'], 'name': 'Jim Smith'}),
+                (self.cache_api.match_queue_caller, {}),
+                (self.cache_api.delete_queue_caller,
+                 {'uuid': caller['uuid']}),
+                (self.cache_api.create_queue_caller, {}),
+                (self.cache_api.overflow_queue_callers,
+                 {'target_queue_id': '556', 'max_callers': 0})]:
+            func(queue_id='555', **kwargs)
+            res = self.cache_api.get_queue_callers_version(queue_id='555')
+            self.assertTrue(res > version)
+            version = res
+
+        self.assertTrue(
+            self.cache_api.get_queue_callers_version(queue_id='556') > 0)
+
+    def test_queue_callers_etag(self):
+        self._create_queue_caller()
+        version = self.cache_api.get_queue_callers_version(queue_id='555')
+        etag = self.cache_api.get_queue_callers_etag(queue_id='555')
+        self.assertTrue(etag.endswith('-%d' % version))
+        self.assertEqual(
+            self.cache_api.list_queue_callers(queue_id='555').etag, etag)
+
+        self._create_queue_caller()
+        self.assertNotEqual(
+            self.cache_api.get_queue_callers_etag(queue_id='555'), etag)
+
+        # A flush, failover or re-created queue loses the epoch along with
+        # the version, so the same version count gives another ETag.
+        key = self.cache_api._get_callers_namespace(queue_id='555')
+        session = self.cache_api._get_session(queue_id='555')
+        session.delete('%s:epoch' % key, '%s:version' % key)
+        session.set('%s:version' % key, version)
+        res = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual(res.version, version)
+        self.assertNotEqual(res.etag, etag)
+        self.assertEqual(
+            self.cache_api.get_queue_callers_etag(queue_id='555'), res.etag)
+
+    def test_queue_members_version(self):
+        member = self._create_queue_member()
+        version = self.cache_api.get_queue_members_version(queue_id='555')
+        self.assertTrue(version > 0)
+        self._create_queue_caller()
+        self.assertEqual(
+            self.cache_api.get_queue_members_version(queue_id='555'), version)
+
+        for kwargs in [{'paused': 1}, {'status': 2}]:
+            self.cache_api.update_queue_member(
+                queue_id='555', uuid=member['uuid'], **kwargs)
+            res = self.cache_api.get_queue_members_version(queue_id='555')
+            self.assertTrue(res > version)
+            version = res
+
+        res = self.cache_api.list_queue_members(queue_id='555', status=2)
+        self.assertEqual(res.version, version)
+
+        self.cache_api.delete_queue_member(
+            queue_id='555', uuid=member['uuid'])
+        self.assertTrue(
+            self.cache_api.get_queue_members_version(
+                queue_id='555') > version)
+
+    def test_subscribe_queue_changes(self):
+        pubsub = self.cache_api.subscribe_queue_changes()
+        self.addCleanup(pubsub.close)
+        self.assertEqual(pubsub.get_message(timeout=1)['type'], 'psubscribe')
+        self._create_queue_caller()
+        self._create_queue_member()
+
+        for x in range(0, 2):
+            res = pubsub.get_message(timeout=1)
+            self.assertEqual(
+                self.cache_api.get_changed_queue(message=res), '555')
+
+    def test_wait_queue_callers(self):
+        timer = threading.Timer(0.1, self._create_queue_caller)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        started = time.time()
+        self.cache_api.wait_queue_callers(
+            queue_id='555', version=0, timeout=10)
+        self.assertTrue(time.time() - started < 5)
+        self.assertEqual(
+            len(self.cache_api.list_queue_callers(queue_id='555')), 1)
+
+    def test_wait_queue_members_timeout(self):
+        self._create_queue_member()
+        version = self.cache_api.get_queue_members_version(queue_id='555')
+
+        started = time.time()
+        self.cache_api.wait_queue_members(
+            queue_id='555', version=version, timeout=0.2)
+        self.assertTrue(time.time() - started >= 0.2)
+
+        self.cache_api.wait_queue_members(
+            queue_id='555', version=version - 1, timeout=10)
+
+        started = time.time()
+        self.cache_api.wait_queue_members(
+            queue_id='555', version=version, timeout=10, epoch='0123abcd')
+        self.assertTrue(time.time() - started < 5)
+
+    def test_expire_queue_timers_ring_timeout(self):
+        self.config(ring_timeout=15, group='timers')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        callers = []
+        for x in range(0, 2):
+            callers.append(self._create_queue_caller())
+            timeutils.advance_time_seconds(1)
+        self._create_queue_member()
+        caller, member = self.cache_api.match_queue_caller(queue_id='555')
+
+        res = self.cache_api.list_queue_timers(queue_ids=['555', '556'])
+        self.assertEqual(res.keys(), ['555'])
+        self.assertEqual(
+            self.cache_api.expire_queue_timers(queue_id='555', limit=10),
+            res['555'])
+        self.assertEqual(caller.status, api.QueueCallerStatus.RINGING)
+
+        timeutils.advance_time_seconds(15)
+        self.assertIsNone(
+            self.cache_api.expire_queue_timers(queue_id='555', limit=10))
+
+        res = self.cache_api.get_queue_member(
+            queue_id='555', uuid=member.uuid)
+        self.assertEqual(res.status, api.QueueMemberStatus.WAITING)
+
+        # NOTE(pabelanger): The caller goes back to its place in line.
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', status=api.QueueCallerStatus.WAITING)
+        self.assertEqual(
+            [x.uuid for x in res], [x['uuid'] for x in callers])
+        self.assertEqual(
+            self.cache_api.list_queue_timers(queue_ids=['555']), {})
+
+    def test_expire_queue_timers_max_wait(self):
+        self.config(max_wait=60, ring_timeout=15, group='timers')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        caller = self._create_queue_caller()
+        self._create_queue_member()
+        self.cache_api.match_queue_caller(queue_id='555')
+
+        # NOTE(pabelanger): Going back to waiting does not restart the
+        # wait of the caller.
+        timeutils.advance_time_seconds(50)
+        res = self.cache_api.expire_queue_timers(queue_id='555', limit=10)
+        self.assertAlmostEqual(
+            res, self.cache_api.list_queue_timers(queue_ids=['555'])['555'])
+        self.assertAlmostEqual(
+            res - timeutils.utcnow_ts(microsecond=True), 10, places=3)
+
+        timeutils.advance_time_seconds(10)
+        self.cache_api.expire_queue_timers(queue_id='555', limit=10)
+        res = self.cache_api.get_queue_caller(
+            queue_id='555', uuid=caller['uuid'])
+        self.assertEqual(res.status, api.QueueCallerStatus.TIMEOUT)
+
+    def test_expire_queue_timers_timeout_retention(self):
+        self.config(max_wait=60, timeout_retention=30, group='timers')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        caller = self._create_queue_caller()
+
+        timeutils.advance_time_seconds(60)
+        res = self.cache_api.expire_queue_timers(queue_id='555', limit=10)
+        self.assertAlmostEqual(
+            res - timeutils.utcnow_ts(microsecond=True), 30, places=3)
+
+        timeutils.advance_time_seconds(30)
+        res = self.cache_api.expire_queue_timers(queue_id='555', limit=10)
+        self.assertIsNone(res)
+        self.assertRaises(
+            exception.QueueCallerNotFound, self.cache_api.get_queue_caller,
+            queue_id='555', uuid=caller['uuid'])
+        key = self.cache_api._get_callers_namespace(queue_id='555')
+        self.assertEqual(
+            self.cache_api._session.keys('%s*' % key), ['%s:version' % key])
+
+    def test_expire_queue_timers_wrapup(self):
+        self.config(wrapup_time=30, group='timers')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        member = self._create_queue_member()
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member['uuid'],
+            status=api.QueueMemberStatus.WRAPUP)
+
+        timeutils.advance_time_seconds(30)
+        self.cache_api.expire_queue_timers(queue_id='555', limit=10)
+        res = self.cache_api.get_queue_member(
+            queue_id='555', uuid=member['uuid'])
+        self.assertEqual(res.status, api.QueueMemberStatus.WAITING)
+
+    def test_expire_queue_timers_status_changed(self):
+        self.config(ring_timeout=15, group='timers')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self._create_queue_caller()
+        self._create_queue_member()
+        caller, member = self.cache_api.match_queue_caller(queue_id='555')
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member.uuid,
+            status=api.QueueMemberStatus.CONNECTED)
+        self.cache_api.delete_queue_caller(queue_id='555', uuid=caller.uuid)
+
+        self.assertEqual(
+            self.cache_api.list_queue_timers(queue_ids=['555']), {})
+
+    def test_expire_queue_timers_limit(self):
+        self.config(max_wait=60, group='timers')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        for x in range(0, 3):
+            self._create_queue_caller()
+
+        timeutils.advance_time_seconds(60)
+        res = self.cache_api.expire_queue_timers(queue_id='555', limit=2)
+        self.assertTrue(res <= timeutils.utcnow_ts(microsecond=True))
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', status=api.QueueCallerStatus.TIMEOUT)
+        self.assertEqual(len(res), 2)
+
+    def test_overflow_queue_callers_max_callers(self):
+        callers = [self._create_queue_caller() for x in range(0, 4)]
+        self.cache_api.create_queue_caller(
+            queue_id='556', name='Jim Smith', number='6135550000')
+
+        res = self.cache_api.overflow_queue_callers(
+            queue_id='555', target_queue_id='556', max_callers=2)
+        self.assertIsNone(res)
+
+        res = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual(
+            [x.uuid for x in res], [x['uuid'] for x in callers[:2]])
+
+        # NOTE(pabelanger): Moved callers join the line behind the callers
+        # already waiting, in the order they were in.
+        res = self.cache_api.list_queue_callers(
+            queue_id='556', status=api.QueueCallerStatus.WAITING)
+        self.assertEqual(
+            [x.uuid for x in res[1:]], [x['uuid'] for x in callers[2:]])
+        for caller, moved in zip(callers[2:], res[1:]):
+            self.assertEqual(moved.created_at, caller['created_at'])
+            self.assertEqual(moved.queue_id, '556')
+
+    def test_overflow_queue_callers_max_wait(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        old = self._create_queue_caller()
+        timeutils.advance_time_seconds(30)
+        new = self._create_queue_caller()
+
+        res = self.cache_api.overflow_queue_callers(
+            queue_id='555', target_queue_id='556', max_wait=60)
+        self.assertAlmostEqual(
+            res - timeutils.utcnow_ts(microsecond=True), 30, places=3)
+
+        timeutils.advance_time_seconds(30)
+        res = self.cache_api.overflow_queue_callers(
+            queue_id='555', target_queue_id='556', max_wait=60)
+        self.assertAlmostEqual(
+            res - timeutils.utcnow_ts(microsecond=True), 30, places=3)
+
+        res = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual([x.uuid for x in res], [new['uuid']])
+        res = self.cache_api.get_queue_caller(
+            queue_id='556', uuid=old['uuid'])
+        self.assertEqual(res.position, 0)
+
+        # NOTE(pabelanger): The wait starts over in the other queue.
+        res = self.cache_api.overflow_queue_callers(
+            queue_id='556', target_queue_id='557', max_wait=60)
+        self.assertAlmostEqual(
+            res - timeutils.utcnow_ts(microsecond=True), 60, places=3)
+        res = self.cache_api.list_queue_callers(queue_id='556')
+        self.assertEqual([x.uuid for x in res], [old['uuid']])
+
+    def test_overflow_queue_callers_limit(self):
+        for x in range(0, 3):
+            self._create_queue_caller()
+
+        res = self.cache_api.overflow_queue_callers(
+            queue_id='555', target_queue_id='556', max_callers=0, limit=2)
+        self.assertTrue(res <= timeutils.utcnow_ts(microsecond=True))
+        self.assertEqual(
+            len(self.cache_api.list_queue_callers(queue_id='555')), 1)
+
+    def test_overflow_queue_callers_timers(self):
+        self.config(max_wait=60, group='timers')
+        caller = self._create_queue_caller()
+        before = self.cache_api.list_queue_timers(queue_ids=['555'])
+
+        self.cache_api.overflow_queue_callers(
+            queue_id='555', target_queue_id='556', max_callers=0)
+        res = self.cache_api.list_queue_timers(queue_ids=['555', '556'])
+        self.assertEqual(res, {'556': before['555']})
+        self.assertRaises(
+            exception.QueueCallerNotFound, self.cache_api.get_queue_caller,
+            queue_id='555', uuid=caller['uuid'])
+
+    def test_queue_lease(self):
+        self.assertTrue(self.cache_api.acquire_queue_lease(
+            queue_id='555', owner='foo', ttl=10))
+        self.assertTrue(self.cache_api.acquire_queue_lease(
+            queue_id='555', owner='foo', ttl=10))
+        self.assertFalse(self.cache_api.acquire_queue_lease(
+            queue_id='555', owner='bar', ttl=10))
+
+        self.cache_api.release_queue_lease(queue_id='555', owner='bar')
+        self.assertFalse(self.cache_api.acquire_queue_lease(
+            queue_id='555', owner='bar', ttl=10))
+
+        self.cache_api.release_queue_lease(queue_id='555', owner='foo')
+        self.assertTrue(self.cache_api.acquire_queue_lease(
+            queue_id='555', owner='bar', ttl=10))
+
+    def test_renew_queue_leases(self):
+        self.cache_api.acquire_queue_lease(
+            queue_id='555', owner='foo', ttl=10)
+        self.cache_api.acquire_queue_lease(
+            queue_id='556', owner='bar', ttl=10)
+
+        res = self.cache_api.renew_queue_leases(
+            queue_ids=['555', '556', '557'], owner='foo', ttl=10)
+        self.assertEqual(sorted(res), ['555', '557'])
+        self.assertFalse(self.cache_api.acquire_queue_lease(
+            queue_id='557', owner='bar', ttl=10))
+
+    def test_join_distributors(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+        res = self.cache_api.join_distributors(node_id='foo', ttl=10)
+        self.assertEqual(res, ['foo'])
+        timeutils.advance_time_seconds(5)
+        res = self.cache_api.join_distributors(node_id='bar', ttl=10)
+        self.assertEqual(res, ['bar', 'foo'])
+
+        timeutils.advance_time_seconds(6)
+        res = self.cache_api.join_distributors(node_id='bar', ttl=10)
+        self.assertEqual(res, ['bar'])
+
+        self.cache_api.leave_distributors(node_id='bar')
+        res = self.cache_api.join_distributors(node_id='foo', ttl=10)
+        self.assertEqual(res, ['foo'])
+
     def test_update_queue_caller(self):
         caller = self._create_queue_caller()
 
@@ -119,7 +910,7 @@ class TestCase(base.TestCase):
             member_uuid='9876', name='Jim', number='1234', status=3)
 
         res = self.cache_api.get_queue_caller(
-            queue_id=caller['queue_id'], uuid=caller['uuid']).__dict__
+            queue_id=caller['queue_id'], uuid=caller['uuid']).as_dict()
 
         self.assertEqual(res['name'], 'Jim')
         self.assertEqual(res['number'], '1234')
@@ -140,11 +931,182 @@ class TestCase(base.TestCase):
             queue_id=caller['queue_id'], uuid=caller['uuid'], status=3)
 
         res = self.cache_api.get_queue_caller(
-            queue_id=caller['queue_id'], uuid=caller['uuid']).__dict__
+            queue_id=caller['queue_id'], uuid=caller['uuid']).as_dict()
 
         self.assertEqual(res['status'], '3')
         self.assertGreater(res['status_at'], caller['status_at'])
 
+    def test_update_queue_caller_status_script_flushed(self):
+        caller = self._create_queue_caller()
+
+        # Make sure we fall back to SCRIPT LOAD on NOSCRIPT.
+        self.cache_api._session.script_flush()
+        self.cache_api.update_queue_caller(
+            queue_id=caller['queue_id'], uuid=caller['uuid'],
+            status=api.QueueCallerStatus.RINGING)
+
+        res = self.cache_api.get_queue_caller(
+            queue_id=caller['queue_id'], uuid=caller['uuid']).as_dict()
+        self.assertEqual(res['status'], api.QueueCallerStatus.RINGING)
+
+        res = self.cache_api.list_queue_callers(
+            queue_id=caller['queue_id'],
+            status=api.QueueCallerStatus.WAITING)
+        self.assertEqual(res, [])
+
+    def test_update_queue_caller_status_not_found(self):
+        self.assertRaises(
+            exception.QueueCallerNotFound,
+            self.cache_api.update_queue_caller,
+            queue_id='foo', uuid='bar', status=3)
+
+        self.assertEqual(self.cache_api._session.keys(), [])
+
+    def test_agent_presence(self):
+        for queue_id in ['555', '556']:
+            self.cache_api.create_queue_member(
+                queue_id=queue_id, number='6135551234', agent_uuid='4321')
+            self.cache_api.create_queue_caller(
+                queue_id=queue_id, name='Bob Smith', number='6135559876')
+
+        res = self.cache_api.get_agent_presence(agent_uuid='4321')
+        self.assertEqual(res.queue_ids, ['555', '556'])
+        self.assertEqual(res.status, api.QueueMemberStatus.WAITING)
+
+        # NOTE(pabelanger): Ringing in one queue takes the agent out of
+        # every other queue.
+        caller, member = self.cache_api.match_queue_caller(queue_id='555')
+        self.assertEqual(member.agent_uuid, '4321')
+        self.assertIsNone(self.cache_api.match_queue_caller(queue_id='556'))
+        for queue_id in ['555', '556']:
+            res = self.cache_api.list_queue_members(
+                queue_id=queue_id, status=api.QueueMemberStatus.RINGING)
+            self.assertEqual(len(res), 1)
+
+        res = self.cache_api.get_agent_presence(agent_uuid='4321')
+        self.assertEqual(res.status, api.QueueMemberStatus.RINGING)
+
+        self.cache_api.update_agent_presence(
+            agent_uuid='4321', status=api.QueueMemberStatus.WAITING)
+        for queue_id in ['555', '556']:
+            res = self.cache_api.list_queue_members(
+                queue_id=queue_id, status=api.QueueMemberStatus.WAITING)
+            self.assertEqual(len(res), 1)
+        caller, member = self.cache_api.match_queue_caller(queue_id='556')
+        self.assertEqual(member.queue_id, '556')
+
+    def test_agent_presence_create_queue_member(self):
+        executed = []
+        execute = redis.client.BasePipeline.execute
+
+        def _execute(pipe, *args, **kwargs):
+            executed.append(pipe)
+            return execute(pipe, *args, **kwargs)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'redis.client.BasePipeline.execute', _execute))
+        member = self.cache_api.create_queue_member(
+            queue_id='555', number='6135551234', agent_uuid='4321')
+
+        # NOTE(pabelanger): The agent is written along with the member,
+        # except in cluster mode where it lives on another node.
+        if self.cache_api._router is None:
+            self.assertEqual(len(executed), 1)
+        else:
+            self.assertEqual(len(executed), 2)
+        res = self.cache_api.get_agent_presence(agent_uuid='4321')
+        self.assertEqual(res.queue_ids, ['555'])
+        self.assertEqual(res.status, member.status)
+
+    def test_agent_presence_create_queue_member_changed(self):
+        self.cache_api.create_queue_member(
+            queue_id='555', number='6135551234', agent_uuid='4321')
+        executed = []
+        execute = redis.client.BasePipeline.execute
+
+        def _execute(pipe, *args, **kwargs):
+            executed.append(pipe)
+            if len(executed) == 1:
+                # NOTE(pabelanger): The agent changes status while the
+                # member is written.
+                self.cache_api.update_agent_presence(
+                    agent_uuid='4321', status='3')
+            return execute(pipe, *args, **kwargs)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'redis.client.BasePipeline.execute', _execute))
+        res = self.cache_api.create_queue_member(
+            queue_id='556', number='6135551234', agent_uuid='4321')
+        self.assertEqual(res.status, '3')
+        res = self.cache_api.list_queue_members(queue_id='556', status=3)
+        self.assertEqual(len(res), 1)
+
+    def test_agent_presence_offered(self):
+        for queue_id in ['555', '556']:
+            member = self.cache_api.create_queue_member(
+                queue_id=queue_id, number='6135551234', agent_uuid='4321')
+            self.cache_api.create_queue_caller(
+                queue_id=queue_id, name='Bob Smith', number='6135559876')
+        self.cache_api.match_queue_caller(queue_id='555')
+
+        # NOTE(pabelanger): A stale member of the agent ringing in 555 is
+        # still available in 556, but the agent is not offered twice.
+        key = '%s:available' % self.cache_api._get_members_namespace(
+            queue_id='556')
+        self.cache_api._session.zadd(key, 0, member.uuid)
+        self.assertIsNone(self.cache_api.match_queue_caller(queue_id='556'))
+        self.assertEqual(self.cache_api._session.zcard(key), 0)
+        res = self.cache_api.list_queue_callers(
+            queue_id='556', status=api.QueueCallerStatus.WAITING)
+        self.assertEqual(len(res), 1)
+
+        # NOTE(pabelanger): The claim goes with the ringing status.
+        self.cache_api.update_agent_presence(
+            agent_uuid='4321', status=api.QueueMemberStatus.WAITING)
+        caller, member = self.cache_api.match_queue_caller(queue_id='556')
+        self.assertEqual(member.queue_id, '556')
+
+    def test_agent_presence_member_status(self):
+        for queue_id in ['555', '556']:
+            member = self.cache_api.create_queue_member(
+                queue_id=queue_id, number='6135551234', agent_uuid='4321')
+
+        self.cache_api.update_queue_member(
+            queue_id='556', uuid=member.uuid, status=3)
+        res = self.cache_api.list_queue_members(queue_id='555', status=3)
+        self.assertEqual(len(res), 1)
+
+        # NOTE(pabelanger): New members take on the status of the agent.
+        res = self.cache_api.create_queue_member(
+            queue_id='557', number='6135551234', agent_uuid='4321')
+        self.assertEqual(res.status, '3')
+
+    def test_agent_presence_not_found(self):
+        self.assertRaises(
+            exception.AgentNotFound, self.cache_api.get_agent_presence,
+            agent_uuid='4321')
+
+    def test_delete_queue_member_agent(self):
+        members = [
+            self.cache_api.create_queue_member(
+                queue_id=queue_id, number='6135551234', agent_uuid='4321')
+            for queue_id in ['555', '556']]
+
+        self.cache_api.delete_queue_member(
+            queue_id='556', uuid=members[1].uuid)
+        res = self.cache_api.get_agent_presence(agent_uuid='4321')
+        self.assertEqual(res.queue_ids, ['555'])
+
+        # NOTE(pabelanger): The agent goes with its last member.
+        self.cache_api.create_queue_caller(queue_id='555')
+        self.cache_api.match_queue_caller(queue_id='555')
+        self.cache_api.delete_queue_member(
+            queue_id='555', uuid=members[0].uuid)
+        self.assertRaises(
+            exception.AgentNotFound, self.cache_api.get_agent_presence,
+            agent_uuid='4321')
+        self.assertEqual(self.cache_api._session.keys('agent*'), [])
+
     def test_update_queue_member(self):
         member = self._create_queue_member()
 
@@ -153,7 +1115,7 @@ class TestCase(base.TestCase):
             number='1234', paused=1, status=3)
 
         res = self.cache_api.get_queue_member(
-            queue_id=member['queue_id'], uuid=member['uuid']).__dict__
+            queue_id=member['queue_id'], uuid=member['uuid']).as_dict()
 
         self.assertEqual(res['number'], '1234')
         self.assertEqual(res['paused'], '1')
@@ -173,7 +1135,7 @@ class TestCase(base.TestCase):
             paused=1)
 
         res = self.cache_api.get_queue_member(
-            queue_id=member['queue_id'], uuid=member['uuid']).__dict__
+            queue_id=member['queue_id'], uuid=member['uuid']).as_dict()
 
         self.assertEqual(res['paused'], '1')
         self.assertGreater(res['paused_at'], member['status_at'])
@@ -183,22 +1145,140 @@ class TestCase(base.TestCase):
             paused=0)
 
         res = self.cache_api.get_queue_member(
-            queue_id=member['queue_id'], uuid=member['uuid']).__dict__
+            queue_id=member['queue_id'], uuid=member['uuid']).as_dict()
 
         self.assertEqual(res['paused'], '0')
         self.assertGreater(res['paused_at'], member['status_at'])
 
+    def test_update_queue_member_available(self):
+        member = self._create_queue_member()
+        key = self.cache_api._get_members_namespace(queue_id='555')
+        session = self.cache_api._get_session(queue_id='555')
+        available = '%s:available' % key
+
+        def _assert_available(expected):
+            res = session.zrange(available, 0, -1)
+            self.assertEqual(res, [member['uuid']] if expected else [])
+
+        _assert_available(True)
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member['uuid'], paused=1)
+        _assert_available(False)
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member['uuid'], paused=0)
+        _assert_available(True)
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member['uuid'], status=3)
+        _assert_available(False)
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member['uuid'], status=1)
+        _assert_available(True)
+
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member['uuid'], weight=4)
+        self.assertEqual(
+            session.zrange('%s:weight:4' % available, 0, -1),
+            [member['uuid']])
+        self.assertEqual(session.zcard('%s:weight:1' % available), 0)
+
+    def test_update_queue_member_skills(self):
+        member = self.cache_api.create_queue_member(
+            queue_id='555', number='6135551234', skills={'english': 3})
+        key = self.cache_api._get_members_namespace(queue_id='555')
+        session = self.cache_api._get_session(queue_id='555')
+        self.assertEqual(member.skills, {'english': 3})
+        self.assertEqual(
+            session.zrange('%s:skill:english' % key, 0, -1, withscores=True),
+            [(member.uuid, 3.0)])
+
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member.uuid, skills={'french': 2})
+        res = self.cache_api.get_queue_member(
+            queue_id='555', uuid=member.uuid)
+        self.assertEqual(res.skills, {'french': 2})
+        self.assertEqual(session.zcard('%s:skill:english' % key), 0)
+        self.assertEqual(
+            session.zrange('%s:skill:french' % key, 0, -1, withscores=True),
+            [(member.uuid, 2.0)])
+
+    def test_update_queue_member_weight_invalid(self):
+        member = self._create_queue_member()
+
+        for weight in [0, api.MAX_MEMBER_WEIGHT + 1]:
+            self.assertRaises(
+                exception.QueueMemberWeightInvalid,
+                self.cache_api.update_queue_member,
+                queue_id=member['queue_id'], uuid=member['uuid'],
+                weight=weight)
+
     def test_update_queue_member_only_status(self):
         member = self._create_queue_member()
 
         self.cache_api.update_queue_member(
             queue_id=member['queue_id'], uuid=member['uuid'], status=3)
         res = self.cache_api.get_queue_member(
-            queue_id=member['queue_id'], uuid=member['uuid']).__dict__
+            queue_id=member['queue_id'], uuid=member['uuid']).as_dict()
 
         self.assertEqual(res['status'], '3')
         self.assertGreater(res['status_at'], member['status_at'])
 
+    def test_update_queue_member_status_not_found(self):
+        self.assertRaises(
+            exception.QueueMemberNotFound,
+            self.cache_api.update_queue_member,
+            queue_id='foo', uuid='bar', status=3)
+
+        self.assertEqual(self.cache_api._session.keys(), [])
+
+    def test_get_pool(self):
+        res = api.get_instance()
+        self.assertIs(
+            res._session.connection_pool,
+            self.cache_api._session.connection_pool)
+        self.assertIs(res._session.connection_pool, api.get_pool())
+
+    def test_get_pool_options(self):
+        api.cleanup()
+        self.config(
+            max_connections=5, socket_timeout=2.5, socket_keepalive=True,
+            health_check_interval=30, group='redis')
+
+        res = api.get_pool()
+        self.assertEqual(res.max_connections, 5)
+        self.assertEqual(res.health_check_interval, 30)
+        self.assertEqual(res.connection_kwargs['socket_timeout'], 2.5)
+        self.assertTrue(res.connection_kwargs['socket_keepalive'])
+
+    def test_get_pool_stats(self):
+        self._create_queue_caller()
+
+        res = api.get_pool_stats()
+        self.assertEqual(res['created_connections'], 1)
+        self.assertEqual(res['available_connections'], 1)
+        self.assertEqual(res['in_use_connections'], 0)
+
+    def test_pool_health_check(self):
+        api.cleanup()
+        self.config(health_check_interval=30, group='redis')
+        self.cache_api = api.get_instance()
+        self._create_queue_caller()
+        self.cache_api.list_queue_callers(queue_id='555')
+
+        pool = api.get_pool()
+        connection = pool._available_connections[0]
+        connection.released_at -= 60
+        sent = self._count_round_trips(
+            self.cache_api.list_queue_callers, queue_id='555')
+        self.assertEqual(sent, 3)
+
+        sent = self._count_round_trips(
+            self.cache_api.list_queue_callers, queue_id='555')
+        self.assertEqual(sent, 2)
+
+    def test__get_agent_namespace(self):
+        res = self.cache_api._get_agent_namespace(agent_uuid='foobar')
+        self.assertEqual(res, 'agent:foobar')
+
     def test__get_members_namespace(self):
         res = self.cache_api._get_members_namespace(
             queue_id='foobar')
@@ -219,6 +1299,21 @@ class TestCase(base.TestCase):
             queue_id='foobar', status=1)
         self.assertEqual(res, 'queue:foobar:callers:status:1')
 
+    def _count_round_trips(self, func, **kwargs):
+        calls = []
+        send = redis.Connection.send_packed_command
+
+        def _send_packed_command(connection, command):
+            calls.append(command)
+            return send(connection, command)
+
+        with fixtures.MonkeyPatch(
+                'redis.Connection.send_packed_command',
+                _send_packed_command):
+            func(**kwargs)
+
+        return len(calls)
+
     def _create_queue_caller(self):
         json = {
             'member_uuid': 'None',
@@ -229,9 +1324,9 @@ class TestCase(base.TestCase):
         }
         res = self.cache_api.create_queue_caller(
             queue_id=json['queue_id'], name=json['name'],
-            number=json['number']).__dict__
+            number=json['number']).as_dict()
 
-        self.assertEqual(len(res), 9)
+        self.assertEqual(len(res), 11)
 
         for k, v in json.iteritems():
             self.assertEqual(res[k], v)
@@ -251,9 +1346,9 @@ class TestCase(base.TestCase):
             'status': '1',
         }
         res = self.cache_api.create_queue_member(
-            queue_id=json['queue_id'], number=json['number']).__dict__
+            queue_id=json['queue_id'], number=json['number']).as_dict()
 
-        self.assertEqual(len(res), 8)
+        self.assertEqual(len(res), 10)
 
         for k, v in json.iteritems():
             self.assertEqual(res[k], v)
@@ -264,3 +1359,229 @@ class TestCase(base.TestCase):
         self.assertTrue(res['uuid'])
 
         return res
+
+
+class CompactTestCase(TestCase):
+
+    def setUp(self):
+        super(CompactTestCase, self).setUp()
+        self.config(record_format='compact', group='redis')
+        self.cache_api = api.get_instance()
+
+    def test_record_format(self):
+        caller = self._create_queue_caller()
+
+        res = self.cache_api._session.hgetall(
+            'queue:555:callers:%s' % caller['uuid'])
+        self.assertEqual(
+            sorted(res.keys()), ['#', 'c', 'n', 'q', 'r', 's', 't', 'u'])
+        self.assertTrue(res['c'].isdigit())
+
+
+class ReplicaTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ReplicaTestCase, self).setUp()
+        api.cleanup()
+        # NOTE(pabelanger): Use the test Redis as its own replica.
+        self.config(replicas=['127.0.0.1:6379'], group='redis')
+        self.cache_api = api.get_instance()
+        self.caller = self.cache_api.create_queue_caller(
+            queue_id='555', name='Bob Smith', number='6135559876')
+
+    def test_get_queue_caller(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'payload.cache.replicas.ReplicaSet.is_fresh',
+            lambda replicas, info: True))
+        api.get_replicas().check()
+        res = self.cache_api.get_queue_caller(
+            queue_id='555', uuid=self.caller.uuid)
+        self.assertEqual(res.as_dict(), self.caller.as_dict())
+
+        res = self.cache_api.list_queue_callers(queue_id='555')
+        self.assertEqual(res[0].as_dict(), self.caller.as_dict())
+
+        stats = api.get_pool_stats()['replicas']['127.0.0.1:6379']
+        self.assertEqual(stats['created_connections'], 1)
+        self.assertEqual(stats['available_connections'], 1)
+
+    def test_get_queue_caller_master(self):
+        self.cache_api.get_queue_caller(
+            queue_id='555', uuid=self.caller.uuid, master=True)
+        self.cache_api.list_queue_callers(queue_id='555', master=True)
+
+        stats = api.get_pool_stats()['replicas']['127.0.0.1:6379']
+        self.assertEqual(stats['created_connections'], 0)
+
+    def test_get_queue_caller_stale_replica(self):
+        # NOTE(pabelanger): The test Redis reports itself as a master, so
+        # it is never fresh enough to read from as a replica.
+        res = self.cache_api.get_queue_caller(
+            queue_id='555', uuid=self.caller.uuid)
+        self.assertEqual(res.as_dict(), self.caller.as_dict())
+        self.assertEqual(api.get_replicas().available, [])
+
+    def test_get_replicas_cluster(self):
+        api.cleanup()
+        self.config(cluster_nodes=['127.0.0.1:7000'], group='redis')
+        self.assertIsNone(api.get_replicas())
+
+
+class ClusterTestCase(TestCase):
+
+    def setUp(self):
+        super(ClusterTestCase, self).setUp()
+        api.cleanup()
+        self.config(cluster_nodes=['127.0.0.1:7000'], group='redis')
+        self.useFixture(fixtures.MonkeyPatch(
+            'payload.cache.cluster.Router.refresh', self._refresh))
+        self.cache_api = api.get_instance()
+
+    def test_cluster_keys(self):
+        caller = self._create_queue_caller()
+
+        res = self.cache_api._session.keys('queue:{555}:*')
+        self.assertEqual(sorted(res), [
+            'queue:{555}:callers',
+            'queue:{555}:callers:%s' % caller['uuid'],
+            'queue:{555}:callers:status:1',
+            'queue:{555}:callers:version',
+        ])
+
+    def test_hash_tag_invalid(self):
+        # NOTE(pabelanger): Either would spread the keys of the queue, or
+        # agent, over other slots than the one it is routed to.
+        for queue_id in ['', '{555}', '5}55']:
+            self.assertRaises(
+                exception.QueueIdInvalid, self.cache_api.create_queue_caller,
+                queue_id=queue_id)
+        self.assertRaises(
+            exception.AgentUuidInvalid, self.cache_api.get_agent_presence,
+            agent_uuid='{1234')
+
+    def test_get_watcher(self):
+        # NOTE(pabelanger): The host option may not be a node of the
+        # cluster, subscriptions go to a master found through the seeds.
+        session = redis.StrictRedis(connection_pool=api.ConnectionPool(
+            **api.get_pool().connection_kwargs))
+        router = api.get_router()
+        router.slots = [None] * cluster.SLOTS
+        router.slots[-1] = session
+
+        self.assertIs(
+            api.get_watcher().pubsub.connection_pool,
+            session.connection_pool)
+        for func in [self.cache_api.subscribe_queue_changes,
+                     self.cache_api.subscribe_queue_events]:
+            res = func()
+            self.addCleanup(res.close)
+            self.assertIs(res.connection_pool, session.connection_pool)
+
+    def test_retry_on_moved(self):
+        caller = self._create_queue_caller()
+        router = api.get_router()
+        get_session = router.get_session
+        calls = []
+
+        def _get_session(router, queue_id):
+            calls.append(queue_id)
+            if len(calls) == 1:
+                raise redis.ResponseError('MOVED 1234 127.0.0.1:7001')
+            return get_session(queue_id=queue_id)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'payload.cache.cluster.Router.get_session', _get_session))
+        res = self.cache_api.get_queue_caller(
+            queue_id='555', uuid=caller['uuid'])
+        self.assertEqual(res.uuid, caller['uuid'])
+        self.assertEqual(len(calls), 2)
+
+    def test_overflow_queue_callers_resume(self):
+        caller = self._create_queue_caller()
+        move = self.cache_api._move_overflow
+
+        def _move_overflow(**kwargs):
+            raise redis.ConnectionError()
+
+        self.cache_api._move_overflow = _move_overflow
+        self.assertRaises(
+            redis.ConnectionError, self.cache_api.overflow_queue_callers,
+            queue_id='555', target_queue_id='556', max_callers=0)
+
+        # NOTE(pabelanger): Out of line, but not lost.
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', status=api.QueueCallerStatus.WAITING)
+        self.assertEqual(res, [])
+        self.assertEqual(self.cache_api.list_queue_callers(queue_id='556'), [])
+        self.cache_api.get_queue_caller(queue_id='555', uuid=caller['uuid'])
+
+        self.cache_api._move_overflow = move
+        self.cache_api.overflow_queue_callers(
+            queue_id='555', target_queue_id='556', max_callers=0)
+        res = self.cache_api.get_queue_caller(
+            queue_id='556', uuid=caller['uuid'])
+        self.assertEqual(res.created_at, caller['created_at'])
+        self.assertEqual(res.queue_id, '556')
+        self.assertRaises(
+            exception.QueueCallerNotFound, self.cache_api.get_queue_caller,
+            queue_id='555', uuid=caller['uuid'])
+        key = self.cache_api._get_callers_namespace(queue_id='555')
+        self.assertEqual(
+            sorted(self.cache_api._session.keys('%s*' % key)),
+            ['%s:epoch' % key, '%s:version' % key])
+
+    def test_overflow_queue_callers_hang_up(self):
+        caller = self._create_queue_caller()
+        finish = self.cache_api._finish_overflow
+
+        def _finish_overflow(**kwargs):
+            # NOTE(pabelanger): The caller hangs up once written to the
+            # other queue.
+            self.cache_api.delete_queue_caller(
+                queue_id='555', uuid=caller['uuid'])
+            return finish(**kwargs)
+
+        self.cache_api._finish_overflow = _finish_overflow
+        self.cache_api.overflow_queue_callers(
+            queue_id='555', target_queue_id='556', max_callers=0)
+
+        for queue_id in ['555', '556']:
+            self.assertRaises(
+                exception.QueueCallerNotFound,
+                self.cache_api.get_queue_caller, queue_id=queue_id,
+                uuid=caller['uuid'])
+            key = self.cache_api._get_callers_namespace(queue_id=queue_id)
+            self.assertEqual(
+                self.cache_api._session.keys('%s*' % key),
+                ['%s:version' % key])
+
+    def test__get_agent_namespace(self):
+        res = self.cache_api._get_agent_namespace(agent_uuid='foobar')
+        self.assertEqual(res, 'agent:{foobar}')
+
+    def test__get_members_namespace(self):
+        res = self.cache_api._get_members_namespace(
+            queue_id='foobar')
+        self.assertEqual(res, 'queue:{foobar}:members')
+
+    def test__get_members_status_namespace(self):
+        res = self.cache_api._get_members_status_namespace(
+            queue_id='foobar', status=1)
+        self.assertEqual(res, 'queue:{foobar}:members:status:1')
+
+    def test__get_callers_namespace(self):
+        res = self.cache_api._get_callers_namespace(
+            queue_id='foobar')
+        self.assertEqual(res, 'queue:{foobar}:callers')
+
+    def test__get_callers_status_namespace(self):
+        res = self.cache_api._get_callers_status_namespace(
+            queue_id='foobar', status=1)
+        self.assertEqual(res, 'queue:{foobar}:callers:status:1')
+
+    def _refresh(self):
+        # NOTE(pabelanger): The test Redis is not a cluster, pretend it
+        # serves every slot.
+        router = api.get_router()
+        session = redis.StrictRedis(connection_pool=api.get_pool())
+        router.slots = [session] * cluster.SLOTS
@@ -0,0 +1,90 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fixtures
+import redis
+
+from payload.cache import api
+from payload.cache import cluster
+from payload.tests import base
+
+
+class TestCase(base.TestCase):
+
+    def test_key_slot(self):
+        self.assertEqual(cluster.key_slot('123456789'), 12739)
+        self.assertEqual(
+            cluster.key_slot('queue:{555}:callers'), cluster.key_slot('555'))
+        # NOTE(pabelanger): An empty hash tag hashes the whole key.
+        self.assertEqual(
+            cluster.key_slot('queue:{}:callers'),
+            cluster.crc16('queue:{}:callers') % cluster.SLOTS)
+
+    def test_refresh(self):
+        def _execute_command(session, *args):
+            self.assertEqual(args, ('CLUSTER SLOTS',))
+            return [
+                [0, 8191, ['127.0.0.1', 7000]],
+                [8192, 16383, ['127.0.0.1', 7001], ['127.0.0.1', 7004]],
+            ]
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'redis.StrictRedis.execute_command', _execute_command))
+        router = cluster.Router(
+            nodes=['127.0.0.1:7000'], pool_class=redis.ConnectionPool)
+        router.refresh()
+
+        self.assertEqual(
+            sorted(router.sessions.keys()),
+            ['127.0.0.1:7000', '127.0.0.1:7001'])
+        # NOTE(pabelanger): '555' hashes to slot 12995.
+        res = router.get_session(queue_id='555')
+        self.assertIs(res, router.sessions['127.0.0.1:7001'])
+
+    def test_retry_on_moved(self):
+        class _Router(object):
+            refreshed = 0
+
+            def refresh(self):
+                self.refreshed += 1
+
+        class _API(object):
+            _router = _Router()
+            replies = []
+
+            @api._retry_on_moved
+            def get(self):
+                reply = self.replies.pop(0)
+                if reply.startswith(('MOVED ', 'ASK ')):
+                    raise redis.ResponseError(reply)
+                return reply
+
+        res = _API()
+        res.replies = ['MOVED 12995 127.0.0.1:7001', 'foo']
+        self.assertEqual(res.get(), 'foo')
+        self.assertEqual(res._router.refreshed, 1)
+
+        # NOTE(pabelanger): The slot map is unchanged while the slot moves.
+        res.replies = ['ASK 12995 127.0.0.1:7001', 'foo']
+        self.assertRaises(redis.ResponseError, res.get)
+        self.assertEqual(res._router.refreshed, 1)
+
+    def test_get_session_unassigned_slot(self):
+        router = cluster.Router(
+            nodes=['127.0.0.1:7000'], pool_class=redis.ConnectionPool)
+        router.slots = [None] * cluster.SLOTS
+        self.assertRaises(
+            redis.ConnectionError, router.get_session, queue_id='555')
@@ -0,0 +1,75 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import fixtures
+from oslo.config import cfg
+
+from payload.cache import api
+from payload.cache import codec
+from payload.tests import base
+
+
+class TestCase(base.TestCase):
+
+    def test_compact_encode(self):
+        res = codec.CompactCodec(codec.QUEUE_CALLER_FIELDS).encode({
+            'created_at': 1418349914.000123,
+            'member_uuid': None,
+            'name': 'Bob Smith',
+        })
+        self.assertEqual(res, {'c': 1418349914000123, 'n': 'Bob Smith'})
+
+    def test_compact_load(self):
+        values = {
+            'created_at': 1418349914.000123,
+            'member_uuid': None,
+            'name': u'Bob Smith',
+            'number': '6135551234',
+            'queue_id': '555',
+            'status': 1,
+            'status_at': 1418349914.5,
+            'uuid': '1234',
+        }
+        res = codec.CompactCodec(codec.QUEUE_CALLER_FIELDS).load(values)
+        expected = codec.HashCodec(codec.QUEUE_CALLER_FIELDS).load(values)
+
+        self.assertEqual(res, expected)
+        self.assertEqual(res['created_at'], 1418349914000123)
+        self.assertEqual(res['member_uuid'], 'None')
+
+    def test_hash_decode_iso8601(self):
+        res = codec.HashCodec(codec.QUEUE_MEMBER_FIELDS).decode({
+            'created_at': '2014-12-12T02:05:14.000123Z',
+            'status_at': '1418349914000123',
+        })
+        self.assertEqual(res, {
+            'created_at': '2014-12-12T02:05:14.000123Z',
+            'status_at': 1418349914000123,
+        })
+
+    def test_record_format_invalid(self):
+        path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'payload.conf')
+        with open(path, 'w') as f:
+            f.write('[redis]\nrecord_format = foo\n')
+
+        conf = cfg.ConfigOpts()
+        conf.register_opts(api.cache_opts, 'redis')
+        conf(args=['--config-file', path])
+        self.assertRaises(
+            cfg.ConfigFileValueError, getattr, conf.redis, 'record_format')
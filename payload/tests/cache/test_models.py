@@ -0,0 +1,40 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from payload.cache import models
+from payload.openstack.common import timeutils
+from payload.tests import base
+
+
+class TestCase(base.TestCase):
+
+    def test_iso8601_from_microseconds(self):
+        res = models.iso8601_from_microseconds(1388534400000001)
+        self.assertEqual(
+            res, timeutils.iso8601_from_timestamp(1388534400.000001, True))
+
+    def test_queue_caller_timestamps(self):
+        res = models.QueueCaller(
+            uuid='1234', created_at=1418349914000123, member_uuid='None',
+            name='Bob Smith', number='6135551234', position=0,
+            queue_id='555', status='1',
+            status_at='2014-12-12T02:05:15.000000Z')
+
+        self.assertEqual(res._created_at, 1418349914000123)
+        self.assertEqual(res.created_at, '2014-12-12T02:05:14.000123Z')
+        self.assertEqual(res._created_at, '2014-12-12T02:05:14.000123Z')
+        self.assertEqual(res.status_at, '2014-12-12T02:05:15.000000Z')
+        self.assertEqual(len(res.as_dict()), 11)
@@ -0,0 +1,82 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import redis
+
+from payload.cache import replicas
+from payload.tests import base
+
+
+class TestCase(base.TestCase):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.replicas = replicas.ReplicaSet(
+            nodes=['127.0.0.1:6380', '127.0.0.1:6381'], max_lag=10,
+            pool_class=redis.ConnectionPool)
+        self.info = {
+            'role': 'slave',
+            'master_link_status': 'up',
+            'master_last_io_seconds_ago': 3,
+            'master_sync_in_progress': 0,
+        }
+
+    def test_is_fresh(self):
+        self.assertTrue(self.replicas.is_fresh(self.info))
+
+    def test_is_fresh_lagging(self):
+        self.info['master_last_io_seconds_ago'] = 11
+        self.assertFalse(self.replicas.is_fresh(self.info))
+
+    def test_is_fresh_link_down(self):
+        self.info['master_link_status'] = 'down'
+        self.info['master_last_io_seconds_ago'] = -1
+        self.assertFalse(self.replicas.is_fresh(self.info))
+
+    def test_is_fresh_master(self):
+        self.assertFalse(self.replicas.is_fresh({'role': 'master'}))
+
+    def test_check_unreachable(self):
+        self.replicas.check()
+        self.assertEqual(self.replicas.available, [])
+        self.assertIsNotNone(self.replicas.checked_at)
+
+    def test_check_timeout(self):
+        res = replicas.ReplicaSet(
+            nodes=['127.0.0.1:6380'], max_lag=10,
+            pool_class=redis.ConnectionPool, timeout=0.5, socket_timeout=5)
+        kwargs = res.checks['127.0.0.1:6380'].connection_pool.connection_kwargs
+        self.assertEqual(kwargs['socket_timeout'], 0.5)
+        self.assertEqual(kwargs['socket_connect_timeout'], 0.5)
+        kwargs = res.sessions[
+            '127.0.0.1:6380'].connection_pool.connection_kwargs
+        self.assertEqual(kwargs['socket_timeout'], 5)
+        self.assertEqual(kwargs['socket_connect_timeout'], 0.5)
+
+    def test_get_session_unchecked(self):
+        self.addCleanup(self.replicas.disconnect)
+        # NOTE(pabelanger): Replicas are checked in the background, reads
+        # go to the master meanwhile.
+        self.assertIsNone(self.replicas.get_session())
+        self.assertIsNotNone(self.replicas.thread)
+
+    def test_get_session_checks_behind(self):
+        self.replicas.start = lambda: None
+        self.replicas.available = self.replicas.sessions.values()
+        self.replicas.checked_at = time.time() - 10
+        self.assertIsNone(self.replicas.get_session())
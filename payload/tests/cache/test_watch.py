@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+import time
+
+from oslo.config import cfg
+import redis
+
+from payload.cache import watch
+from payload.tests import base
+
+CONF = cfg.CONF
+
+
+class TestCase(base.TestCase):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.session = redis.StrictRedis(
+            host=CONF.redis.host, port=CONF.redis.port,
+            db=CONF.redis.database, password=CONF.redis.password)
+        self.watcher = watch.Watcher(session=self.session)
+        self.addCleanup(self.watcher.stop)
+        self.changes = []
+
+    def test_wait(self):
+        timer = threading.Timer(0.1, self._change)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        started = time.time()
+        self.watcher.wait(
+            channel='foo', check=lambda: bool(self.changes), timeout=10)
+        self.assertTrue(time.time() - started < 5)
+        self.assertEqual(self.changes, ['foo'])
+        self.assertEqual(self.watcher.channels, {})
+
+    def test_wait_changed(self):
+        self.changes.append('foo')
+        started = time.time()
+        self.watcher.wait(
+            channel='foo', check=lambda: bool(self.changes), timeout=10)
+        self.assertTrue(time.time() - started < 5)
+
+    def test_wait_other_channel(self):
+        timer = threading.Timer(0.1, self._change, args=['bar'])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        started = time.time()
+        self.watcher.wait(channel='foo', check=lambda: False, timeout=0.5)
+        self.assertTrue(time.time() - started >= 0.5)
+        self.assertEqual(self.changes, ['bar'])
+
+    def test_unsubscribe_unconfirmed(self):
+        # NOTE(pabelanger): Replies are dispatched by hand here.
+        self.watcher.thread = threading.Thread(target=lambda: None)
+        self.watcher.thread.start()
+
+        event = threading.Event()
+        state = self.watcher._subscribe(channel='foo', event=event)
+        self.watcher._unsubscribe(channel='foo', event=event)
+        self.assertIs(self.watcher.channels['foo'], state)
+
+        # NOTE(pabelanger): The next waiter shares the pending subscription,
+        # rather than taking its reply for that of a new one.
+        event = threading.Event()
+        self.assertIs(
+            self.watcher._subscribe(channel='foo', event=event), state)
+        self.watcher._unsubscribe(channel='foo', event=event)
+
+        self.watcher._dispatch({'type': 'subscribe', 'channel': 'foo'})
+        self.assertTrue(state.subscribed.is_set())
+        self.assertEqual(self.watcher.channels, {})
+
+    def _change(self, channel='foo'):
+        self.changes.append(channel)
+        self.session.publish(channel, '')
@@ -26,11 +26,13 @@ class TestCase(base.FunctionalTest):
         row = {
             'id': 1,
             'project_id': '793491dd5fa8477eb2d6a820193a183b',
+            'skills': {'english': 3, 'sales': 1},
             'updated_at': None,
             'user_id': '02d99a62af974b26b510c3564ba84644'
         }
         res = self.db_api.create_agent(
-            user_id=row['user_id'], project_id=row['project_id'])
+            user_id=row['user_id'], project_id=row['project_id'],
+            skills=row['skills'])
 
         for k, v in row.iteritems():
             self.assertEqual(res[k], v)
@@ -26,6 +26,7 @@ class TestCase(base.FunctionalTest):
         row = {
             'id': 1,
             'project_id': '793491dd5fa8477eb2d6a820193a183b',
+            'skills': None,
             'updated_at': None,
             'user_id': '02d99a62af974b26b510c3564ba84644'
         }
@@ -28,7 +28,11 @@ class TestCase(base.FunctionalTest):
             'disabled': True,
             'id': 1,
             'name': 'support',
+            'overflow_max_callers': None,
+            'overflow_max_wait': None,
+            'overflow_queue_id': None,
             'project_id': '793491dd5fa8477eb2d6a820193a183b',
+            'strategy': 'longest-idle',
             'updated_at': None,
             'user_id': '02d99a62af974b26b510c3564ba84644'
         }
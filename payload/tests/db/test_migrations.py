@@ -217,3 +217,27 @@ class TestPayloadMigrations(test_migrations.BaseMigrationTestCase,
             exc.NoSuchTableError, db_utils.get_table, engine, 'queues')
         self.assertRaises(
             exc.NoSuchTableError, db_utils.get_table, engine, 'queue_memebers')
+
+    def _check_002(self, engine, data):
+        self.assertColumnExists(engine, 'queues', 'strategy')
+
+    def _post_downgrade_002(self, engine):
+        self.assertColumnNotExists(engine, 'queues', 'strategy')
+
+    def _check_003(self, engine, data):
+        self.assertColumnExists(engine, 'agents', 'skills')
+
+    def _post_downgrade_003(self, engine):
+        self.assertColumnNotExists(engine, 'agents', 'skills')
+
+    def _check_004(self, engine, data):
+        for column in [
+                'overflow_max_callers', 'overflow_max_wait',
+                'overflow_queue_id']:
+            self.assertColumnExists(engine, 'queues', column)
+
+    def _post_downgrade_004(self, engine):
+        for column in [
+                'overflow_max_callers', 'overflow_max_wait',
+                'overflow_queue_id']:
+            self.assertColumnNotExists(engine, 'queues', column)
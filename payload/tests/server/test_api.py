@@ -13,6 +13,7 @@
 from payload.cache import api as cache_api
 from payload.cache.api import QueueCallerStatus
 from payload.cache.api import QueueMemberStatus
+from payload.db import api as db_api
 from payload.server import api as server_api
 from payload.tests import base
 
@@ -68,6 +69,102 @@ class TestCase(base.TestCase):
             queue_id='foobar')
         self.assertEqual(res, None)
 
+    def test_match(self):
+        callers = [self._create_queue_caller() for x in range(0, 2)]
+        members = [self._create_queue_member() for x in range(0, 3)]
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=members[0]['uuid'], paused='1')
+
+        caller, member = self.server_api.match(queue_id='555')
+        self.assertEqual(caller.uuid, callers[0]['uuid'])
+        self.assertEqual(caller.member_uuid, members[1]['uuid'])
+        self.assertEqual(caller.position, 0)
+        self.assertEqual(caller.status, QueueCallerStatus.RINGING)
+        self.assertEqual(member.uuid, members[1]['uuid'])
+        self.assertEqual(member.status, QueueMemberStatus.RINGING)
+        self.assertEqual(caller.status_at, member.status_at)
+
+        res = self.cache_api.get_queue_caller(
+            queue_id='555', uuid=caller.uuid)
+        self.assertEqual(res.as_dict(), caller.as_dict())
+        res = self.cache_api.list_queue_members(
+            queue_id='555', status=QueueMemberStatus.RINGING)
+        self.assertEqual([x.uuid for x in res], [member.uuid])
+
+        caller, member = self.server_api.match(queue_id='555')
+        self.assertEqual(caller.uuid, callers[1]['uuid'])
+        self.assertEqual(member.uuid, members[2]['uuid'])
+
+        # Callers are left, but the only waiting member is paused.
+        self._create_queue_caller()
+        res = self.server_api.match(queue_id='555')
+        self.assertEqual(res, None)
+
+    def test_match_priority(self):
+        self._create_queue_caller()
+        caller = self.cache_api.create_queue_caller(
+            queue_id='555', priority=1)
+        self._create_queue_member()
+
+        res = self.server_api.match(queue_id='555')
+        self.assertEqual(res[0].uuid, caller.uuid)
+        self.assertEqual(res[0].position, 0)
+
+    def test_match_no_caller(self):
+        self._create_queue_member()
+        res = self.server_api.match(queue_id='555')
+        self.assertEqual(res, None)
+
+        res = self.cache_api.list_queue_members(
+            queue_id='555', status=QueueMemberStatus.WAITING)
+        self.assertEqual(len(res), 1)
+
+    def test_match_queues(self):
+        queue = db_api.create_queue(
+            name='support', user_id='foo', project_id='bar',
+            strategy='fewest-calls')
+        queue_ids = ['555', queue['uuid']]
+        for queue_id in queue_ids:
+            self.cache_api.create_queue_caller(queue_id=queue_id)
+            self.cache_api.create_queue_member(
+                queue_id=queue_id, number='1000')
+
+        matches, pending = self.server_api.match_queues(
+            queue_ids=queue_ids, limit=10)
+        self.assertEqual(len(matches), 2)
+        self.assertEqual(pending, [])
+
+    def test_get_strategy(self):
+        queue = db_api.create_queue(
+            name='support', user_id='foo', project_id='bar',
+            strategy='round-robin')
+
+        res = self.server_api.get_strategy(queue_id=queue['uuid'])
+        self.assertEqual(res.name, 'round-robin')
+
+        res = self.server_api.get_strategy(queue_id='555')
+        self.assertEqual(res.name, 'longest-idle')
+
+    def test_get_overflow(self):
+        queue = db_api.create_queue(
+            name='support', user_id='foo', project_id='bar',
+            overflow_queue_id='556', overflow_max_wait=60)
+
+        res = self.server_api.get_overflow(queue_id=queue['uuid'])
+        self.assertEqual(res, ('556', None, 60))
+        self.assertIsNone(self.server_api.get_overflow(queue_id='555'))
+
+    def test_get_overflow_self(self):
+        queue = db_api.create_queue(
+            name='support', user_id='foo', project_id='bar',
+            overflow_max_callers=1)
+        # NOTE(pabelanger): Rules like this were accepted before the API
+        # refused them.
+        queue.overflow_queue_id = queue.uuid
+        queue.save()
+
+        self.assertIsNone(self.server_api.get_overflow(queue_id=queue['uuid']))
+
     def _create_queue_caller(self):
         json = {
             'member_uuid': 'None',
@@ -78,9 +175,9 @@ class TestCase(base.TestCase):
         }
         res = self.cache_api.create_queue_caller(
             queue_id=json['queue_id'], name=json['name'],
-            number=json['number']).__dict__
+            number=json['number']).as_dict()
 
-        self.assertEqual(len(res), 9)
+        self.assertEqual(len(res), 11)
 
         for k, v in json.iteritems():
             self.assertEqual(res[k], v)
@@ -100,9 +197,9 @@ class TestCase(base.TestCase):
             'status': '1',
         }
         res = self.cache_api.create_queue_member(
-            queue_id=json['queue_id'], number=json['number']).__dict__
+            queue_id=json['queue_id'], number=json['number']).as_dict()
 
-        self.assertEqual(len(res), 8)
+        self.assertEqual(len(res), 10)
 
         for k, v in json.iteritems():
             self.assertEqual(res[k], v)
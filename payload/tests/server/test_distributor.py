@@ -0,0 +1,207 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import time
+
+import fixtures
+
+from payload.cache.api import QueueCallerStatus
+from payload.cache.api import QueueMemberStatus
+from payload.db import api as db_api
+from payload.server import distributor
+from payload.tests import base
+
+
+class TestCase(base.TestCase):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.distributor = distributor.Distributor()
+        self.cache_api = self.distributor.server_api.cache_api
+
+    def test_distribute(self):
+        for x in range(0, 3):
+            self.cache_api.create_queue_caller(queue_id='555')
+        for x in range(0, 2):
+            self.cache_api.create_queue_member(queue_id='555', number='1000')
+
+        self.distributor.distribute(queue_id='555')
+
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', status=QueueCallerStatus.WAITING)
+        self.assertEqual(len(res), 1)
+        res = self.cache_api.list_queue_members(
+            queue_id='555', status=QueueMemberStatus.RINGING)
+        self.assertEqual(len(res), 2)
+
+        res = self.distributor.get_stats()
+        self.assertEqual(res['matches'], 2)
+        self.assertTrue(res['latency_max'] >= res['latency_avg'] >= 0)
+
+    def test_overflow(self):
+        queue = db_api.create_queue(
+            name='foo', user_id='1', project_id='1', overflow_queue_id='556',
+            overflow_max_callers=1, overflow_max_wait=60)
+        for x in range(0, 3):
+            self.cache_api.create_queue_caller(queue_id=queue.uuid)
+
+        self.distributor.distribute(queue_id=queue.uuid)
+
+        res = self.cache_api.list_queue_callers(queue_id=queue.uuid)
+        self.assertEqual(len(res), 1)
+        res = self.cache_api.list_queue_callers(queue_id='556')
+        self.assertEqual(len(res), 2)
+
+        self.distributor.swept_at = time.time()
+        self.assertTrue(0 < self.distributor.get_timeout() <= 60)
+
+    def test_queue_events(self):
+        pubsub = self.cache_api.subscribe_queue_events()
+        self.addCleanup(pubsub.close)
+
+        caller = self.cache_api.create_queue_caller(queue_id='555')
+        member = self.cache_api.create_queue_member(
+            queue_id='555', number='1000')
+        self.cache_api.update_queue_caller(
+            queue_id='555', uuid=caller.uuid,
+            status=QueueCallerStatus.RINGING)
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member.uuid,
+            status=QueueMemberStatus.WAITING)
+
+        # NOTE(pabelanger): The subscribe confirmation reads as None.
+        res = []
+        for x in range(0, 5):
+            message = pubsub.get_message(timeout=0.1)
+            if message is not None:
+                res.append(message['data'])
+        self.assertEqual(res, ['555', '555', '555'])
+
+    def test_sweep(self):
+        queues = [
+            db_api.create_queue(name='foo', user_id='1', project_id='1'),
+            db_api.create_queue(
+                name='bar', user_id='1', project_id='1', disabled=True),
+        ]
+        for queue in queues:
+            self.cache_api.create_queue_caller(queue_id=queue.uuid)
+            self.cache_api.create_queue_member(
+                queue_id=queue.uuid, number='1000')
+
+        self.distributor.sweep()
+
+        res = self.cache_api.list_queue_callers(
+            queue_id=queues[0].uuid, status=QueueCallerStatus.RINGING)
+        self.assertEqual(len(res), 1)
+        res = self.cache_api.list_queue_callers(
+            queue_id=queues[1].uuid, status=QueueCallerStatus.RINGING)
+        self.assertEqual(len(res), 0)
+        self.assertTrue(self.distributor.swept_at)
+
+    def test_sweep_indexes_members(self):
+        queue = db_api.create_queue(name='foo', user_id='1', project_id='1')
+        self.cache_api.create_queue_member(queue_id=queue.uuid, number='1000')
+        key = self.cache_api._get_members_namespace(queue_id=queue.uuid)
+        session = self.cache_api._get_session(queue_id=queue.uuid)
+        session.delete(*session.keys('%s:available*' % key))
+        self.cache_api.create_queue_caller(queue_id=queue.uuid)
+
+        self.distributor.sweep()
+
+        self.assertTrue(self.distributor.indexed)
+        res = self.cache_api.list_queue_callers(
+            queue_id=queue.uuid, status=QueueCallerStatus.RINGING)
+        self.assertEqual(len(res), 1)
+
+    def test_sweep_leased(self):
+        queue = db_api.create_queue(name='foo', user_id='1', project_id='1')
+        self.cache_api.create_queue_caller(queue_id=queue.uuid)
+        self.cache_api.create_queue_member(queue_id=queue.uuid, number='1000')
+        self.cache_api.acquire_queue_lease(
+            queue_id=queue.uuid, owner='other', ttl=10)
+
+        self.distributor.sweep()
+
+        res = self.cache_api.list_queue_callers(
+            queue_id=queue.uuid, status=QueueCallerStatus.RINGING)
+        self.assertEqual(len(res), 0)
+
+    def test_heartbeat(self):
+        self.distributor.swept_at = time.time()
+        self.distributor.heartbeat()
+        self.assertTrue(self.distributor.swept_at)
+        # NOTE(pabelanger): The sweep asked for next is waited for at most
+        # a heartbeat.
+        self.assertTrue(
+            self.distributor.get_timeout() <=
+            self.distributor.heartbeat_interval)
+
+        self.cache_api.join_distributors(node_id='other', ttl=10)
+        self.distributor.heartbeat()
+        self.assertEqual(self.distributor.swept_at, 0)
+
+    def test_heartbeat_error(self):
+        def _heartbeat():
+            raise ValueError('foo')
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'payload.server.partition.Partitioner.heartbeat', _heartbeat))
+        self.distributor.heartbeat()
+
+    def test_run_error(self):
+        delays = []
+
+        def _listen():
+            raise ValueError('foo')
+
+        def _sleep(delay):
+            delays.append(delay)
+            if len(delays) == 7:
+                raise KeyboardInterrupt()
+
+        self.distributor._listen = _listen
+        self.useFixture(fixtures.MonkeyPatch('time.sleep', _sleep))
+        self.assertRaises(KeyboardInterrupt, self.distributor.run)
+        self.assertEqual(delays, [1, 2, 4, 8, 16, 30, 30])
+
+    def test_tick(self):
+        self.config(batch_matching=True, batch_size=1, group='distributor')
+        for queue_id in ['555', '556']:
+            for x in range(0, 2):
+                self.cache_api.create_queue_caller(queue_id=queue_id)
+            self.cache_api.create_queue_member(
+                queue_id=queue_id, number='1000')
+
+        self.distributor.tick()
+
+        self.assertEqual(self.distributor.get_stats()['matches'], 2)
+        self.assertEqual(self.cache_api.list_dirty_queues(), [])
+        for queue_id in ['555', '556']:
+            res = self.cache_api.list_queue_callers(
+                queue_id=queue_id, status=QueueCallerStatus.WAITING)
+            self.assertEqual(len(res), 1)
+
+    def test_tick_leased(self):
+        self.config(batch_matching=True, group='distributor')
+        self.cache_api.acquire_queue_lease(
+            queue_id='556', owner='other', ttl=10)
+        for queue_id in ['555', '556']:
+            self.cache_api.create_queue_caller(queue_id=queue_id)
+            self.cache_api.create_queue_member(
+                queue_id=queue_id, number='1000')
+            self.distributor._add_pending(queue_id=queue_id)
+        self.assertEqual(self.distributor.pending, set(['555']))
+
+        # NOTE(pabelanger): Queues held by other nodes stay dirty for them.
+        self.distributor.tick()
+        self.assertEqual(self.distributor.get_stats()['matches'], 1)
+        self.assertEqual(self.cache_api.list_dirty_queues(), ['556'])
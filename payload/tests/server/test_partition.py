@@ -0,0 +1,108 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from payload.cache import api
+from payload.server import partition
+from payload.tests import base
+
+
+class HashRingTestCase(base.TestCase):
+
+    def test_get_node(self):
+        ring = partition.HashRing(nodes=['foo', 'bar', 'baz'], replicas=64)
+        res = dict()
+        for x in range(0, 300):
+            node = ring.get_node(x)
+            res[node] = res.get(node, 0) + 1
+        self.assertEqual(sorted(res.keys()), ['bar', 'baz', 'foo'])
+        for count in res.values():
+            self.assertTrue(count > 50)
+
+    def test_get_node_leave(self):
+        ring = partition.HashRing(nodes=['foo', 'bar', 'baz'], replicas=64)
+        other = partition.HashRing(nodes=['foo', 'bar'], replicas=64)
+        for x in range(0, 300):
+            if ring.get_node(x) != 'baz':
+                self.assertEqual(other.get_node(x), ring.get_node(x))
+
+    def test_get_node_empty(self):
+        ring = partition.HashRing(nodes=[], replicas=64)
+        self.assertEqual(ring.get_node('555'), None)
+
+
+class PartitionerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(PartitionerTestCase, self).setUp()
+        self.cache_api = api.get_instance()
+        self.partitioners = [
+            partition.Partitioner(
+                cache_api=self.cache_api, node_id=x, ttl=10, replicas=64)
+            for x in ['foo', 'bar']]
+
+    def test_owns(self):
+        foo, bar = self.partitioners
+        self.assertFalse(foo.heartbeat())
+        self.assertTrue(bar.heartbeat())
+
+        # NOTE(pabelanger): foo only sees bar once it has joined.
+        self.assertTrue(foo.heartbeat())
+        for x in range(0, 100):
+            res = [y.owns(str(x)) for y in self.partitioners]
+            self.assertEqual(res.count(True), 1)
+
+    def test_owns_leased(self):
+        foo, bar = self.partitioners
+        self.assertTrue(foo.owns('555'))
+
+        # NOTE(pabelanger): Both nodes own the queue until they agree on the
+        # ring, the lease keeps bar off it.
+        self.assertFalse(bar.owns('555'))
+        foo.stop()
+        self.assertTrue(bar.owns('555'))
+
+    def test_heartbeat_handover(self):
+        foo, bar = self.partitioners
+        foo.heartbeat()
+        queue_ids = [str(x) for x in range(0, 100)]
+        for queue_id in queue_ids:
+            self.assertTrue(foo.owns(queue_id))
+
+        # NOTE(pabelanger): bar owns some of the queues on the ring as soon
+        # as it joins, foo holds their leases until its next heartbeat.
+        self.assertTrue(bar.heartbeat())
+        handed = [x for x in queue_ids if bar.ring.get_node(x) == 'bar']
+        self.assertTrue(handed)
+        for queue_id in handed:
+            self.assertFalse(bar.owns(queue_id))
+        self.assertEqual(bar.pending, set(handed))
+        self.assertFalse(bar.heartbeat())
+
+        self.assertTrue(foo.heartbeat())
+        self.assertTrue(bar.heartbeat())
+        self.assertEqual(sorted(bar.leases.keys()), sorted(handed))
+        self.assertEqual(bar.pending, set())
+        self.assertFalse(bar.heartbeat())
+
+    def test_heartbeat_rebalance(self):
+        foo, bar = self.partitioners
+        foo.heartbeat()
+        queue_ids = [str(x) for x in range(0, 100)]
+        for queue_id in queue_ids:
+            self.assertTrue(foo.owns(queue_id))
+
+        bar.heartbeat()
+        self.assertTrue(foo.heartbeat())
+        self.assertTrue(0 < len(foo.leases) < len(queue_ids))
+        for queue_id in queue_ids:
+            if queue_id not in foo.leases:
+                self.assertTrue(bar.owns(queue_id))
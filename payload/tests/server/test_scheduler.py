@@ -0,0 +1,157 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from payload.cache.api import QueueCallerStatus
+from payload.db import api as db_api
+from payload.openstack.common import timeutils
+from payload.server import scheduler
+from payload.tests import base
+
+
+class TimingWheelTestCase(base.TestCase):
+
+    def setUp(self):
+        super(TimingWheelTestCase, self).setUp()
+        self.wheel = scheduler.TimingWheel(interval=1, size=8, now=100)
+
+    def test_advance(self):
+        self.wheel.add(due=102.5, item='foo')
+        self.wheel.add(due=101, item='bar')
+        self.assertEqual(len(self.wheel), 2)
+
+        self.assertEqual(self.wheel.advance(now=100.9), set())
+        self.assertEqual(self.wheel.advance(now=101), set(['bar']))
+        self.assertEqual(self.wheel.advance(now=102.9), set())
+        self.assertEqual(self.wheel.advance(now=103), set(['foo']))
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_advance_revolutions(self):
+        self.wheel.add(due=103, item='foo')
+        self.wheel.add(due=111, item='bar')
+
+        self.assertEqual(self.wheel.advance(now=108), set(['foo']))
+        self.assertEqual(self.wheel.advance(now=110), set())
+        self.assertEqual(self.wheel.advance(now=200), set(['bar']))
+
+    def test_add_due(self):
+        self.wheel.add(due=50, item='foo')
+        self.wheel.add(due=105, item='bar')
+        self.wheel.add(due=103, item='bar')
+
+        self.assertEqual(self.wheel.advance(now=101), set(['foo']))
+        self.assertEqual(
+            self.wheel.advance(now=103), set(['bar']))
+        self.assertEqual(self.wheel.advance(now=105), set())
+
+
+class SchedulerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(SchedulerTestCase, self).setUp()
+        self.config(max_wait=1, group='timers')
+        self.config(tick_interval=0.01, group='scheduler')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.scheduler = scheduler.Scheduler()
+        self.addCleanup(self.scheduler._unsubscribe)
+        self.cache_api = self.scheduler.server_api.cache_api
+
+    def test_tick(self):
+        queues = [
+            db_api.create_queue(name='foo', user_id='1', project_id='1'),
+            db_api.create_queue(
+                name='bar', user_id='1', project_id='1', disabled=True),
+        ]
+        for queue in queues:
+            self.cache_api.create_queue_caller(queue_id=queue.uuid)
+
+        self.scheduler.load()
+        self.assertEqual(len(self.scheduler.wheel), 1)
+        self.scheduler.tick()
+        res = self.cache_api.list_queue_callers(
+            queue_id=queues[0].uuid, status=QueueCallerStatus.WAITING)
+        self.assertEqual(len(res), 1)
+
+        # NOTE(pabelanger): Timers fire on the first tick after they are
+        # due.
+        timeutils.advance_time_seconds(1.1)
+        self.scheduler.tick()
+        for queue, count in zip(queues, [1, 0]):
+            res = self.cache_api.list_queue_callers(
+                queue_id=queue.uuid, status=QueueCallerStatus.TIMEOUT)
+            self.assertEqual(len(res), count)
+
+        # NOTE(pabelanger): Timed out callers are deleted in turn.
+        self.assertEqual(len(self.scheduler.wheel), 1)
+        timeutils.advance_time_seconds(301)
+        self.scheduler.tick()
+        res = self.cache_api.list_queue_callers(queue_id=queues[0].uuid)
+        self.assertEqual(res, [])
+        self.assertEqual(len(self.scheduler.wheel), 0)
+
+    def test_tick_error(self):
+        res = []
+
+        def _expire_queue_timers(queue_id, limit):
+            if queue_id == '555':
+                raise ValueError('foo')
+            res.append(queue_id)
+
+        self.cache_api.expire_queue_timers = _expire_queue_timers
+        for queue_id in ['555', '556']:
+            self.scheduler.wheel.add(
+                due=timeutils.utcnow_ts(microsecond=True), item=queue_id)
+
+        timeutils.advance_time_seconds(0.02)
+        self.scheduler.tick()
+        self.assertEqual(res, ['556'])
+        self.assertEqual(len(self.scheduler.wheel), 0)
+
+    def test_run_error(self):
+        def _load():
+            raise ValueError('foo')
+
+        self.scheduler.load = _load
+        self.scheduler.run()
+        self.assertEqual(self.scheduler.loaded_at, 0)
+
+    def test_run_changed(self):
+        queues = [
+            db_api.create_queue(name='foo', user_id='1', project_id='1'),
+            db_api.create_queue(
+                name='bar', user_id='1', project_id='1', disabled=True),
+        ]
+        self.scheduler.run()
+        self.assertEqual(len(self.scheduler.wheel), 0)
+
+        # NOTE(pabelanger): Timers set since the last load are picked up
+        # from the changed queues alone.
+        for queue in queues:
+            self.cache_api.create_queue_caller(queue_id=queue.uuid)
+        timeutils.advance_time_seconds(1)
+        listed = []
+        list_queue_timers = self.cache_api.list_queue_timers
+
+        def _list_queue_timers(queue_ids):
+            listed.append(set(queue_ids))
+            return list_queue_timers(queue_ids=queue_ids)
+
+        self.cache_api.list_queue_timers = _list_queue_timers
+        self.scheduler.run()
+        self.assertEqual(listed, [set([queues[0].uuid])])
+        self.assertEqual(
+            self.scheduler.refreshed_at - self.scheduler.loaded_at, 1)
+        self.assertEqual(len(self.scheduler.wheel), 1)
+
+        timeutils.advance_time_seconds(60)
+        self.scheduler.run()
+        self.assertEqual(self.scheduler.loaded_at, self.scheduler.refreshed_at)
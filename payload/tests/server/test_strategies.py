@@ -0,0 +1,135 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fixtures
+
+from payload.cache import api as cache_api
+from payload.cache.api import QueueCallerStatus
+from payload.cache.api import QueueMemberStatus
+from payload.server import strategies
+from payload.tests import base
+
+
+class TestCase(base.TestCase):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.cache_api = cache_api.get_instance()
+
+    def test_get_names(self):
+        self.assertEqual(
+            sorted(strategies.get_names()), [
+                'fewest-calls', 'longest-idle', 'random', 'round-robin',
+                'weighted'])
+
+    def test_fewest_calls(self):
+        members = [self._create_queue_member() for x in range(0, 3)]
+        self._match('longest-idle', members[0])
+        self._match('longest-idle', members[1])
+
+        # members[1] waited longer, but members[2] has not had a call yet.
+        self._release(members[1])
+        self._release(members[0])
+        self._match('fewest-calls', members[2])
+
+    def test_longest_idle(self):
+        members = [self._create_queue_member() for x in range(0, 2)]
+        self._match('longest-idle', members[0])
+        self._release(members[0])
+        self._match('longest-idle', members[1])
+        self._match('longest-idle', members[0])
+
+    def test_random(self):
+        members = [self._create_queue_member() for x in range(0, 3)]
+        self.useFixture(fixtures.MonkeyPatch(
+            'random.random', lambda: 0.5))
+        self._match('random', members[1])
+
+    def test_round_robin(self):
+        members = [self._create_queue_member() for x in range(0, 3)]
+        self._match('round-robin', members[0])
+        self._release(members[0])
+        self._match('round-robin', members[1])
+
+        # members[0] has been waiting the longest, but it is members[2]'s
+        # turn, after which we wrap around.
+        self._release(members[1])
+        self._match('round-robin', members[2])
+        self._match('round-robin', members[0])
+
+    def test_weighted(self):
+        members = [self._create_queue_member() for x in range(0, 2)]
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=members[1]['uuid'], weight=3)
+
+        # The total weight is 4, so members[0] is picked for [0, 0.25).
+        self.useFixture(fixtures.MonkeyPatch(
+            'random.random', lambda: 0.2))
+        self._match('weighted', members[0])
+        self._release(members[0])
+        self.useFixture(fixtures.MonkeyPatch(
+            'random.random', lambda: 0.3))
+        self._match('weighted', members[1])
+
+    def test_paused(self):
+        members = [self._create_queue_member() for x in range(0, 2)]
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=members[0]['uuid'], paused=1)
+        for name in strategies.get_names():
+            self._match(name, members[1])
+            self._release(members[1])
+
+    def test_skills(self):
+        members = [
+            self._create_queue_member(skills={'english': 3}),
+            self._create_queue_member(skills={'english': 1, 'french': 2}),
+            self._create_queue_member(),
+        ]
+        for name in strategies.get_names():
+            self._match(name, members[1], skills={'french': 1})
+            self._release(members[1])
+            self._match(name, members[0], skills={'english': 2})
+            self._release(members[0])
+            self._match(
+                name, members[1], skills={'english': 1, 'french': 2})
+            self._release(members[1])
+
+        key = self.cache_api._get_members_namespace(queue_id='555')
+        session = self.cache_api._get_session(queue_id='555')
+        self.assertEqual(session.keys('%s:eligible*' % key), [])
+
+    def test_skills_lookahead(self):
+        member = self._create_queue_member(skills={'english': 3})
+        self.cache_api.create_queue_caller(
+            queue_id='555', skills={'german': 1})
+
+        # The first caller keeps waiting for a german speaking member.
+        self._match('longest-idle', member)
+        res = self.cache_api.list_queue_callers(
+            queue_id='555', status=QueueCallerStatus.WAITING)
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0].skills, {'german': 1})
+
+    def _create_queue_member(self, skills=None):
+        return self.cache_api.create_queue_member(
+            queue_id='555', number='6135551234', skills=skills).as_dict()
+
+    def _match(self, name, member, skills=None):
+        self.cache_api.create_queue_caller(queue_id='555', skills=skills)
+        res = self.cache_api.match_queue_caller(
+            queue_id='555', strategy=strategies.get_strategy(name=name))
+        self.assertEqual(res[1].uuid, member['uuid'])
+
+    def _release(self, member):
+        self.cache_api.update_queue_member(
+            queue_id='555', uuid=member['uuid'],
+            status=QueueMemberStatus.WAITING)
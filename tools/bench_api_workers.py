@@ -0,0 +1,141 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure payload-api throughput as the number of workers grows.
+
+Starts payload-api with every worker count given, loads it with
+concurrent clients and prints the requests per second of each::
+
+    tools/bench_api_workers.py --config-file /etc/payload/payload.conf \\
+        --workers 1 2 4
+
+The configuration file is copied for every run with the [api] workers
+option set. The [api] host and port of the copy are where the requests
+go. Workers only add throughput up to the number of CPUs of the host.
+"""
+
+import argparse
+import httplib
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib2
+
+from six.moves import configparser
+
+
+def load(host, port, path, requests, concurrency):
+    """Send requests GETs from concurrency threads, return requests/s."""
+    lock = threading.Lock()
+    sent = [0]
+    errors = []
+
+    def _run():
+        while True:
+            with lock:
+                if sent[0] >= requests:
+                    return
+                sent[0] += 1
+            conn = httplib.HTTPConnection(host, port)
+            try:
+                conn.request('GET', path)
+                res = conn.getresponse()
+                res.read()
+                if res.status != 200:
+                    errors.append(res.status)
+            finally:
+                conn.close()
+
+    threads = [threading.Thread(target=_run) for x in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    if errors:
+        raise RuntimeError('%d requests failed' % len(errors))
+
+    return requests / elapsed
+
+
+def wait_for(url, timeout):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            urllib2.urlopen(url).read()
+            return
+        except (IOError, httplib.HTTPException):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config-file', required=True)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--path', default='/v1/queues')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    parser = configparser.RawConfigParser()
+    parser.read(args.config_file)
+    if not parser.has_section('api'):
+        parser.add_section('api')
+    host = '127.0.0.1'
+    if parser.has_option('api', 'host'):
+        host = parser.get('api', 'host').replace('0.0.0.0', '127.0.0.1')
+    port = 9859
+    if parser.has_option('api', 'port'):
+        port = parser.getint('api', 'port')
+
+    print('%d CPUs' % multiprocessing.cpu_count())
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for workers in args.workers:
+            parser.set('api', 'workers', str(workers))
+            path = os.path.join(tmpdir, 'payload.conf')
+            with open(path, 'w') as f:
+                parser.write(f)
+
+            with open(os.devnull, 'w') as devnull:
+                proc = subprocess.Popen(
+                    ['payload-api', '--config-file', path],
+                    stdout=devnull, stderr=devnull)
+            try:
+                url = 'http://%s:%d%s' % (host, port, args.path)
+                wait_for(url, timeout=30)
+                res = load(
+                    host=host, port=port, path=args.path,
+                    requests=args.requests, concurrency=args.concurrency)
+                print('workers=%d: %.0f req/s' % (workers, res))
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (C) 2014 PolyBeacon, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the WSME and the direct JSON encoding of listings.
+
+Encodes the same cache records of callers and members both the way
+wsexpose did and the way payload.api.controllers.v1.base.render_list()
+does, and prints the time each takes per listing::
+
+    tools/bench_listing.py --records 1000
+
+Records are built anew for every run, since as_dict() formats the
+timestamps of a record once.
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+import timeit
+
+import wsme.rest.json
+from wsme import types as wtypes
+
+from payload.api.controllers.v1 import base
+from payload.api.controllers.v1.queue import caller
+from payload.api.controllers.v1.queue import member
+from payload.cache import models
+
+
+def get_callers(records, now):
+    return [models.QueueCaller(
+        uuid='%036d' % x, created_at=now + x, member_uuid=None,
+        name='Bob Smith', number='6135551234', position=x,
+        queue_id='q' * 36, status='1', status_at=now + x,
+        skills={'french': 2}) for x in range(records)]
+
+
+def get_members(records, now):
+    return [models.QueueMember(
+        uuid='%036d' % x, created_at=now + x, number='1000@example.org',
+        paused='0', paused_at=None, queue_id='q' * 36, status='1',
+        status_at=now + x, skills={'french': 2},
+        agent_uuid='a' * 36) for x in range(records)]
+
+
+def render_list(items):
+    # The body base.render_list() streams, without pecan.
+    res = []
+    it = iter(items)
+    chunk = list(itertools.islice(it, base.CHUNK_SIZE))
+    while chunk:
+        res.append(json.dumps([x.as_dict() for x in chunk])[1:-1])
+        chunk = list(itertools.islice(it, base.CHUNK_SIZE))
+
+    return '[%s]' % ', '.join(res)
+
+
+def measure(func, number, repeat):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000)
+    parser.add_argument('--number', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    now = int(time.time() * 1000000)
+    for name, get_items, api_type in [
+            ('callers', get_callers, caller.QueueCaller),
+            ('members', get_members, member.QueueMember)]:
+        datatype = wtypes.registry.resolve_type([api_type])
+        assert (json.loads(render_list(get_items(args.records, now))) ==
+                json.loads(wsme.rest.json.encode_result(
+                    get_items(args.records, now), datatype)))
+
+        def _build():
+            get_items(args.records, now)
+
+        def _wsme():
+            wsme.rest.json.encode_result(
+                get_items(args.records, now), datatype)
+
+        def _direct():
+            render_list(get_items(args.records, now))
+
+        overhead = measure(_build, args.number, args.repeat)
+        for label, func in [('wsme', _wsme), ('direct', _direct)]:
+            res = measure(func, args.number, args.repeat) - overhead
+            print('%d %s, %s: %.1fms' % (
+                args.records, name, label, res * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main())